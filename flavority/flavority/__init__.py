@@ -1,22 +1,26 @@
 
 from flask import Flask, g, json
-from flask.ext.sqlalchemy import SQLAlchemy
 from flask.ext.restful import Api
 
+from flavority.auth import Auth
+from flavority.database import Database
+
 __version__ = "0.1.0"
 __envvar__ = "FLAVORITY_SETTINGS"
-   
-app = Flask(__name__)
-app.db = SQLAlchemy(app)
-app.restapi = Api(app)
+__profile_envvar__ = "FLAVORITY_PROFILE"
+
+db = Database()
+lm = Auth()
 
 
-def load_config(a, package = None):
+def load_config(a, package = None, config = None):
     """
     Loading application configuration from environment variable or, if not set, from config file
-    distributed with this module.
+    distributed with this module. A profile named by FLAVORITY_PROFILE environment variable (eg.
+    `production`) is applied over the defaults first; it refuses to run with the default SECRET_KEY.
 
-    :param a:   flask's application object
+    :param a:       flask's application object
+    :param config:  mapping or object with settings overriding all the others
     """
 
     def paths_to_abs(cfg):
@@ -25,6 +29,11 @@ def load_config(a, package = None):
         pathKeys = ['APPLICATION_ROOT', 'TEMPDIR']
         for key in pathKeys:
             cfg[key] = os.path.abspath(cfg[key])
+        # relative to TEMPDIR
+        tempKeys = ['METRICS_DIR']
+        for key in tempKeys:
+            if cfg.get(key) is not None:
+                cfg[key] = os.path.join(cfg['TEMPDIR'], cfg[key])
 
     def create_directories(cfg):
         import os
@@ -37,28 +46,89 @@ def load_config(a, package = None):
             elif not os.path.isdir(cfg[key]):
                 raise RuntimeError('Not a directory {}'.format(cfg[key]))
 
+    import os
+
     if package is None: package = __name__
 
     a.config.from_object("{}.config".format(package))     # default settings
+    default_secret = a.config['SECRET_KEY']
+    profile = os.environ.get(__profile_envvar__)
+    if profile:                                           # eg. config_production
+        a.config.from_object("{}.config_{}".format(package, profile))
     try: a.config.from_envvar(__envvar__)                 # override defaults
     except RuntimeError: pass
+    if isinstance(config, dict): a.config.update(config)
+    elif config is not None: a.config.from_object(config)
+    if profile and a.config['SECRET_KEY'] == default_secret:
+        raise RuntimeError('SECRET_KEY must be set for the {} profile, eg. in the file pointed by {}'
+                           .format(profile, __envvar__))
 
     paths_to_abs(a.config)
     create_directories(a.config)
 
 
 def load_database(a):
-    a.db.create_all()
+    """
+    Binds the database to application `a`. The schema isn't created here, use `manage.py db upgrade`.
+    """
+    from flavority.database import configure_engine
 
+    db.init_app(a)
+    a.db = db
+    configure_engine(a)
 
-import flavority.models
 
-load_config(app, package=__name__)
-load_database(app)
+def create_app(config = None):
+    """
+    Creates and configures an application. Nothing connects to the database until the first request, so
+    the application may be created in a parent process and served by forked workers (see :func:`after_fork`).
 
+    :param config:  mapping or object with settings overriding the configuration files
+    """
+    a = Flask(__name__)
+    load_config(a, package=__name__, config=config)
+    load_database(a)
+    a.restapi = Api(a)
 
-from flavority.auth import Auth
-lm = Auth(app)
+    from flavority.serializers import compile_models, output_json
+    import flavority.models
+    compile_models(db.Model)
+    a.restapi.representations['application/json'] = output_json
+
+    from flavority.instrumentation import QueryTracker
+    a.queries = QueryTracker(a)
+
+    from flavority.metrics import Metrics
+    a.metrics = Metrics(a)
 
-import flavority.resources
-import flavority.controllers
+    from flavority.profiling import RequestProfiler
+    a.profiler = RequestProfiler(a)
+
+    from flavority.compression import Compressor
+    a.compression = Compressor(a)
+
+    from flavority.cache import ResponseCache
+    a.cache = ResponseCache(a)
+
+    lm.init_app(a)
+
+    from flavority.memory import MemoryProfiler
+    a.memory = MemoryProfiler(a)
+
+    from flavority.batch import BatchRunner
+    a.batch = BatchRunner(a)
+
+    from flavority import resources, controllers
+    resources.init_app(a)
+    controllers.init_app(a)
+    return a
+
+
+def after_fork(a):
+    """
+    Must be called in a worker forked from a process in which application `a` has been used. Drops
+    connections inherited from the parent and forgets the parent's metrics and threads.
+    """
+    a.db.get_engine(a).dispose()
+    a.metrics.registry.reset()
+    a.batch.reset()
@@ -1,11 +1,8 @@
 
-def Auth(app, **kwargs):
-    from flask import Blueprint
-    
+def Auth(app=None, **kwargs):
     from .blueprint import UserManager
-    
-    blueprint = Blueprint("LoginManager", __name__)
-    app.register_blueprint(blueprint, **kwargs)
-        
-    return UserManager(app.config['SECRET_KEY'])
 
+    manager = UserManager()
+    if app is not None:
+        manager.init_app(app, **kwargs)
+    return manager
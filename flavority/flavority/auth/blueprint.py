@@ -1,7 +1,7 @@
 
 from functools import wraps
 
-from flask import abort, request
+from flask import Blueprint, abort, current_app, g, request
 from itsdangerous import TimedJSONWebSignatureSerializer, SignatureExpired, BadSignature
 
 from .mixins import AnonymousMixin, UserMixin
@@ -12,11 +12,14 @@ class UserManager:
     USER_ID = 'uid'
     TOKEN_HEADER = "X-Flavority-Token"
     TOKEN_DURATION = 900
+    # users already resolved in the current application context, by token
+    USERS_ATTRIBUTE = 'auth_users'
     
-    def __init__(self, secret_key, *args, **kwargs):
-        if not isinstance(secret_key, str):
+    def __init__(self, secret_key=None, *args, **kwargs):
+        if secret_key is not None and not isinstance(secret_key, str):
             raise TypeError()
-        self.secret_key = secret_key
+        # when not given, the key is read from configuration of the current application
+        self._secret_key = secret_key
 
         # function called when retrieving UserID from session
         # should accept a single argument which will precisely identify the user
@@ -26,6 +29,19 @@ class UserManager:
         # arguments depend on the user (forwarding them)
         self.user_auth_func = None
 
+    def init_app(self, app, **kwargs):
+        blueprint = Blueprint("LoginManager", __name__)
+        app.register_blueprint(blueprint, **kwargs)
+
+    @property
+    def secret_key(self):
+        if self._secret_key is not None:
+            return self._secret_key
+        secret_key = current_app.config['SECRET_KEY']
+        if not isinstance(secret_key, str):
+            raise TypeError()
+        return secret_key
+
     def generate_token(self, userMixin, expiration=None):
         if not isinstance(userMixin, UserMixin):
             raise TypeError()
@@ -37,20 +53,34 @@ class UserManager:
         })
 
     def get_current_user(self):
-        s = TimedJSONWebSignatureSerializer(self.secret_key)
+        """
+        Returns the user identified by the request's token. The user is resolved once per application
+        context, so requests nested in it (eg. parts of a batch) don't decode the token and load the user
+        again.
+        """
         try:
             token = request.headers[self.TOKEN_HEADER]
         except KeyError:
             return None
 
+        users = getattr(g, self.USERS_ATTRIBUTE, None)
+        if users is None:
+            users = {}
+            setattr(g, self.USERS_ATTRIBUTE, users)
+        elif token in users:
+            return users[token]
+
         # decode the token to access user identification data
+        s = TimedJSONWebSignatureSerializer(self.secret_key)
         try:
             data = s.loads(token)
         except SignatureExpired:
             abort(401)
         except BadSignature:
+            users[token] = None
             return None
-        return self.user_loader_func(data[self.USER_ID])
+        users[token] = self.user_loader_func(data[self.USER_ID])
+        return users[token]
 
     def login_user(self, *args, **kwargs):
         """
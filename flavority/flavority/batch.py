@@ -0,0 +1,172 @@
+
+from base64 import b64encode
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from flask import Response, current_app, g, request
+from flask.ext.restful import Resource, reqparse
+from flask_restful import abort
+
+from . import lm, db
+from .serializers import encode
+
+
+SubRequest = namedtuple('SubRequest', ('method', 'path', 'args', 'body', 'headers'))
+
+METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+
+# headers of sub-responses passed to the client, the others (CORS, length) belong to the batch response
+FORWARDED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Location', 'X-Cache')
+
+
+class BatchRunner:
+
+    """
+    Runs sub-requests of a batch (see :class:`Batch`) in the application context of the batch request.
+
+    Sub-requests are dispatched directly to view functions, without request hooks, so they share the
+    user resolved for the batch and its database session. With `BATCH_THREADS` set, consecutive GET
+    sub-requests are split between the request's thread and a pool of threads, each of them with its
+    own application context and session; other methods run in the request's thread in order, after all
+    the reads preceding them.
+    """
+
+    def __init__(self, a):
+        self.app = a
+        self.threads = a.config.get('BATCH_THREADS', 0)
+        self.max_requests = a.config.get('BATCH_MAX_REQUESTS', 20)
+        self.pool = None
+        self.lock = Lock()
+
+    def executor(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(self.threads)
+            return self.pool
+
+    def reset(self):
+        """Forgets the pool, whose threads don't exist in a forked process."""
+        self.pool = None
+
+    def run(self, subrequests):
+        """Returns results (see :func:`describe`) of `subrequests`, in the same order."""
+        token = request.headers.get(lm.TOKEN_HEADER)
+        results, reads = [None] * len(subrequests), []
+        for i, sub in enumerate(subrequests):
+            if sub.method == 'GET' and self.threads > 0:
+                reads.append(i)
+                continue
+            self.run_reads(subrequests, reads, results, token)
+            reads = []
+            results[i] = self.dispatch(sub, token)
+        self.run_reads(subrequests, reads, results, token)
+        return results
+
+    def run_reads(self, subrequests, indices, results, token):
+        if not indices: return
+        chunks = [indices[k::self.threads] for k in range(min(self.threads, len(indices)))]
+        futures = [self.executor().submit(self.run_chunk, [subrequests[i] for i in chunk], token)
+                   for chunk in chunks[1:]]
+        for i in chunks[0]:
+            results[i] = self.dispatch(subrequests[i], token)
+        for chunk, future in zip(chunks[1:], futures):
+            for i, result in zip(chunk, future.result()):
+                results[i] = result
+
+    def run_chunk(self, subrequests, token):
+        with self.app.app_context():
+            return [self.dispatch(sub, token) for sub in subrequests]
+
+    def dispatch(self, sub, token):
+        # bodies are embedded into the batch response, which is compressed as a whole
+        headers = {name: value for name, value in sub.headers.items() if name.lower() != 'accept-encoding'}
+        if token is not None: headers[lm.TOKEN_HEADER] = token
+        body = {} if sub.body is None else {'data': encode(sub.body), 'content_type': 'application/json'}
+
+        with self.app.test_request_context(sub.path, method=sub.method, query_string=sub.args,
+                                           headers=headers, **body):
+            try:
+                try:
+                    if request.routing_exception is not None: raise request.routing_exception
+                    if request.endpoint == Batch.ENDPOINT: abort(400, message='batches can not be nested')
+                    if not hasattr(g, 'user'): g.user = lm.get_current_user()
+                    rv = self.app.view_functions[request.endpoint](**request.view_args)
+                except Exception as e:
+                    rv = self.app.handle_user_exception(e)
+                response = self.app.make_response(rv)
+            except Exception:
+                self.app.logger.exception('batch: %s %s failed', sub.method, sub.path)
+                db.session.rollback()
+                response = self.app.restapi.make_response({'message': 'Internal Server Error'}, 500)
+            return describe(response)
+
+
+def describe(response):
+    """
+    Returns the encoded result of a sub-request: its status, forwarded headers and body, which is
+    embedded as it is when it's JSON and Base64 encoded otherwise.
+    """
+    response.direct_passthrough = False
+    data = response.get_data()
+    result = {
+        'status': response.status_code,
+        'headers': {name: value for name, value in response.headers if name in FORWARDED_HEADERS},
+    }
+    if not data:
+        body = b'null'
+    elif response.mimetype == 'application/json':
+        body = data.strip()
+    else:
+        result['encoding'] = 'base64'
+        body = encode(b64encode(data).decode('ascii'))
+    # the body is spliced into the encoded result instead of being decoded and encoded again
+    return encode(result)[:-1] + b',"body":' + body + b'}'
+
+
+def cast_subrequests(val):
+    if not isinstance(val, list): raise ValueError('requests must be a list')
+    if len(val) > current_app.batch.max_requests:
+        raise ValueError('at most {} requests are allowed'.format(current_app.batch.max_requests))
+
+    subrequests = []
+    for item in val:
+        if not isinstance(item, dict): raise ValueError('every request must be an object')
+        method, path = str(item.get('method', 'GET')).upper(), item.get('path')
+        args, headers = item.get('args') or {}, item.get('headers') or {}
+        if method not in METHODS: raise ValueError('unsupported method {}'.format(method))
+        if not isinstance(path, str) or not path.startswith('/'): raise ValueError('path must start with /')
+        if not isinstance(args, dict) or not isinstance(headers, dict):
+            raise ValueError('args and headers must be objects')
+        subrequests.append(SubRequest(method, path, args, item.get('body'), headers))
+    return subrequests
+
+
+class Batch(Resource):
+
+    """
+    Runs many API calls in one HTTP round trip. The body is a JSON object with a list of `requests`, each
+    with a `method` (GET by default), a `path`, and optional `args` (query string), `body` (JSON) and
+    `headers`; the batch's token is used by all of them. Returns `responses` with a `status`, `headers`
+    and `body` of every request, in order. Requests failing don't stop the others.
+    """
+
+    ENDPOINT = 'batch'
+
+    @staticmethod
+    def parse_post_arguments():
+        parser = reqparse.RequestParser()
+        parser.add_argument('requests', type=cast_subrequests, location='json', required=True,
+                            help='{error_msg}')
+        return parser.parse_args()
+
+    def options(self):
+        return None
+
+    def post(self):
+        args = self.parse_post_arguments()
+        results = current_app.batch.run(args.requests)
+        return Response(b'{"responses":[' + b','.join(results) + b']}\n', mimetype='application/json')
+
+
+__all__ = ['BatchRunner', 'Batch']
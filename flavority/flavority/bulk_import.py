@@ -0,0 +1,214 @@
+
+from collections import OrderedDict
+from json import loads as json_loads
+
+from flask import Response, current_app, request, stream_with_context
+from flask.ext.restful import Resource
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import load_only
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+
+from . import lm, db
+from .cache import invalidate
+from .export import NDJSON
+from .models import Change, Ingredient, IngredientAssociation, IngredientUnit, Photo, Recipe, Tag, Unit
+from .recipes import Recipes
+from .serializers import encode
+from .sync import PHOTO, RECIPE, record
+
+
+class RecordRequest:
+
+    """
+    Stands for a request with a JSON body `data`, so that an imported record is validated by the same
+    `reqparse` parser as a single recipe posted to /recipes/.
+    """
+
+    def __init__(self, data):
+        self.json = data
+        self.values = MultiDict()
+
+
+class Resolver:
+
+    """
+    Finds tags, ingredients, units and photos used by a chunk of records with one query per kind, and
+    creates those missing once for the whole chunk. Tags are resolved as by :func:`Recipes.post`: by id
+    when it's one of an existing tag, otherwise by name regardless of case.
+    """
+
+    def __init__(self, records):
+        tag_ids, tag_names, ingr_names, unit_names, photo_ids = set(), set(), set(), set(), set()
+        for args in records:
+            for tag in args.tags:
+                try: tag_ids.add(int(tag))
+                except (TypeError, ValueError): pass
+                tag_names.add(str(tag).lower())
+            for ingr_name, _, unit_name in args.ingredients:
+                ingr_names.add(ingr_name)
+                unit_names.add(unit_name)
+            photo_ids.update(args.photos)
+
+        self.tags_by_id = {t.id: t for t in Tag.query.filter(Tag.id.in_(tag_ids))} if tag_ids else {}
+        self.tags_by_name = {t.name.lower(): t for t in Tag.query.filter(func.lower(Tag.name).in_(tag_names))} \
+            if tag_names else {}
+        self.ingredients = {i.name: i for i in Ingredient.query.filter(Ingredient.name.in_(ingr_names))} \
+            if ingr_names else {}
+        self.units = {u.unit_name: u for u in Unit.query.filter(Unit.unit_name.in_(unit_names))} \
+            if unit_names else {}
+        self.photos = {p.id: p for p in Photo.query.options(load_only('id', 'recipe_id', 'avatar_user_id'))
+                       .filter(Photo.id.in_(photo_ids))} if photo_ids else {}
+
+        # pairs of an ingredient and a unit by both objects, existing ones by their ids
+        self.ingredient_units = {}
+        if self.ingredients and self.units:
+            ingredients = {i.id: i for i in self.ingredients.values()}
+            units = {u.id: u for u in self.units.values()}
+            rows = IngredientUnit.query.filter(IngredientUnit.ingredient_id.in_(ingredients),
+                                               IngredientUnit.unit_id.in_(units))
+            for iu in rows:
+                self.ingredient_units[(ingredients[iu.ingredient_id], units[iu.unit_id])] = iu
+
+    def tag(self, name):
+        try: tag = self.tags_by_id.get(int(name))
+        except (TypeError, ValueError): tag = None
+        if tag is None:
+            key = str(name).lower()
+            tag = self.tags_by_name.get(key)
+            if tag is None: tag = self.tags_by_name[key] = Tag(str(name))
+        return tag
+
+    def tags(self, names):
+        tags = OrderedDict()
+        for name in names:
+            tag = self.tag(name)
+            tags[id(tag)] = tag
+        return list(tags.values())
+
+    def ingredient_unit(self, ingr_name, unit_name):
+        ingr = self.ingredients.get(ingr_name)
+        if ingr is None: ingr = self.ingredients[ingr_name] = Ingredient(ingr_name)
+        unit = self.units.get(unit_name)
+        if unit is None: unit = self.units[unit_name] = Unit(unit_name, None, None)
+        iu = self.ingredient_units.get((ingr, unit))
+        if iu is None: iu = self.ingredient_units[(ingr, unit)] = IngredientUnit(ingr, unit)
+        return iu
+
+
+def error(status, message):
+    return {'status': status, 'message': message}
+
+
+def validate(line):
+    """Returns arguments of a recipe parsed from an NDJSON `line`, or an error result."""
+    try:
+        data = json_loads(line.decode('utf-8'))
+    except ValueError:
+        return None, error(400, 'invalid JSON')
+    if not isinstance(data, dict): return None, error(400, 'a record must be an object')
+    try:
+        args = Recipes.parse_post_arguments(RecordRequest(data))
+    except HTTPException as e:
+        return None, error(400, getattr(e, 'data', {}).get('message', e.description))
+    try:
+        args.photos = [int(photo_id) for photo_id in args.photos]
+    except (TypeError, ValueError):
+        return None, error(400, 'photos must be ids')
+    return args, None
+
+
+def import_chunk(chunk, user_id):
+    """
+    Imports a chunk of `(line number, line)` pairs in one transaction, returns NDJSON lines with results
+    of the records. Records failing validation are reported and skipped; when the transaction fails all
+    records of the chunk fail.
+    """
+    results, valid = {}, []
+    for number, line in chunk:
+        args, results[number] = validate(line)
+        if args is not None: valid.append((number, args))
+
+    resolver, recipes, used_photos = Resolver([args for _, args in valid]), [], set()
+    for number, args in valid:
+        photos = [resolver.photos[i] for i in args.photos if i in resolver.photos]
+        # photos must not be already attached to any recipe
+        if any(photo.is_attached() or photo.id in used_photos for photo in photos):
+            results[number] = error(403, 'a photo is already attached')
+            continue
+        used_photos.update(photo.id for photo in photos)
+
+        recipe = Recipe(args.dish_name, args.preparation_time, args.recipe_text, args.portions, args.difficulty,
+                        user_id)
+        recipe.tags = resolver.tags(args.tags)
+        recipe.ingredients = [IngredientAssociation(resolver.ingredient_unit(ingr_name, unit_name), amount)
+                              for ingr_name, amount, unit_name in args.ingredients]
+        for photo in photos:
+            photo.recipe = recipe
+        db.session.add(recipe)
+        recipes.append((number, recipe, photos))
+
+    if recipes:
+        try:
+            db.session.flush()
+            # ids are read before the commit expires the recipes
+            created = [(number, recipe.id) for number, recipe, _ in recipes]
+            for number, recipe, photos in recipes:
+                record(RECIPE, recipe.id, Change.INSERT)
+                for photo in photos:
+                    record(PHOTO, photo.id, Change.UPDATE)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            current_app.logger.error(e)
+            db.session.rollback()
+            for number, _, _ in recipes:
+                results[number] = error(500, 'committing the transaction failed')
+        else:
+            for number, recipe_id in created:
+                results[number] = {'status': 201, 'id': recipe_id}
+            # new recipes may have brought new tags, ingredients and units
+            invalidate('recipes', 'tags', 'ingredients', 'units')
+
+    return b''.join(encode(dict(results[number], line=number)) + b'\n' for number, _ in chunk)
+
+
+def import_lines(lines, user_id, chunk_size, max_records):
+    """Imports records from NDJSON `lines` a chunk at a time, yields results of every chunk."""
+    chunk, records = [], 0
+    for number, line in enumerate(lines, 1):
+        if not line.strip(): continue
+        records += 1
+        if records > max_records:
+            if chunk: yield import_chunk(chunk, user_id)
+            yield encode(dict(error(413, 'at most {} records are imported at once'.format(max_records)),
+                              line=number)) + b'\n'
+            return
+        chunk.append((number, line))
+        if len(chunk) >= chunk_size:
+            yield import_chunk(chunk, user_id)
+            chunk = []
+    if chunk: yield import_chunk(chunk, user_id)
+
+
+class RecipeImport(Resource):
+
+    """
+    Creates recipes of the current user from an NDJSON body, one recipe per line with the arguments of
+    :func:`Recipes.post`. The body is read incrementally and imported `IMPORT_CHUNK_SIZE` records per
+    transaction. The response is NDJSON with a result of every record, in order: its `line`, `status`
+    (201 and the `id` of the recipe, or an error with a `message`).
+    """
+
+    def options(self):
+        return None
+
+    @lm.auth_required
+    def post(self):
+        config = current_app.config
+        lines = import_lines(request.stream, lm.get_current_user().id, config.get('IMPORT_CHUNK_SIZE', 100),
+                             config.get('IMPORT_MAX_RECORDS', 10000))
+        return Response(stream_with_context(lines), mimetype=NDJSON)
+
+
+__all__ = ['RecipeImport']
@@ -0,0 +1,238 @@
+
+from collections import OrderedDict
+from functools import wraps
+import os
+import os.path
+import re
+from threading import Lock
+from time import time
+
+from flask import Response, current_app, g, request
+
+
+# bytes added to the size of every entry for the key, the headers and bookkeeping
+ENTRY_OVERHEAD = 256
+
+TAG_FILE = re.compile(r'[^\w.-]')
+
+
+class Entry:
+
+    __slots__ = ('body', 'status', 'headers', 'tags', 'created', 'expires', 'variants', 'size')
+
+    def __init__(self, body, status, headers, tags, created, expires, variants=None):
+        self.body = body
+        self.status = status
+        self.headers = headers
+        self.tags = tags
+        self.created = created
+        self.expires = expires
+        # compressed bodies by content coding (see flavority.compression)
+        self.variants = variants or {}
+        self.size = len(body) + sum(len(data) for data in self.variants.values()) + ENTRY_OVERHEAD
+
+
+class ResponseCache:
+
+    """
+    Cache of serialized GET responses, enabled with `CACHE_ENABLED`.
+
+    Entries are kept in LRU order and the least recently used ones are evicted once their total size exceeds
+    `CACHE_MAX_BYTES`; every entry expires after `CACHE_TTL` seconds. An entry is labelled with tags, eg.
+    `recipes` or `recipe:12`, and write paths drop all entries of a tag with :func:`invalidate` after they
+    commit. Invalidations are also recorded as files in TEMPDIR/cache, so that other worker processes
+    stop serving entries created before them. Files of tags not invalidated for `CACHE_TTL` are removed,
+    as no live entry is older than them.
+
+    Entries are stored with their compressed variants, so that a response is compressed once per fill.
+
+    Resource methods are cached with :func:`cached`. Lookups are counted by `flavority_cache_requests_total`.
+    """
+
+    NAME = 'responses'
+    MAX_INVALIDATIONS = 10000
+
+    def __init__(self, a):
+        self.app = a
+        self.enabled = a.config.get('CACHE_ENABLED', False)
+        self.max_bytes = a.config.get('CACHE_MAX_BYTES', 64 * 1024 * 1024)
+        self.ttl = a.config.get('CACHE_TTL', 60)
+        self.directory = os.path.join(a.config['TEMPDIR'], 'cache')
+        self.entries = OrderedDict()
+        self.keys_by_tag = {}
+        self.invalidated = {}
+        self.last_prune = time()
+        self.size = 0
+        self.lock = Lock()
+        if self.enabled and not os.path.isdir(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+
+    def tag_path(self, tag):
+        return os.path.join(self.directory, TAG_FILE.sub('_', tag))
+
+    def invalidated_at(self, tag):
+        """Returns time of the latest invalidation of `tag` in any process."""
+        local = self.invalidated.get(tag, 0.0)
+        try:
+            return max(local, os.stat(self.tag_path(tag)).st_mtime)
+        except OSError:
+            return local
+
+    def get(self, key):
+        now = time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None: return None
+            if entry.expires > now:
+                self.entries.move_to_end(key)
+            else:
+                self.remove(key)
+                return None
+        if any(self.invalidated_at(tag) >= entry.created for tag in entry.tags):
+            with self.lock:
+                if self.entries.get(key) is entry: self.remove(key)
+            return None
+        return entry
+
+    def put(self, key, entry):
+        if entry.size > self.max_bytes: return
+        with self.lock:
+            if key in self.entries: self.remove(key)
+            # an invalidation which happened while the response was being built makes it stale already
+            if any(self.invalidated.get(tag, 0.0) >= entry.created for tag in entry.tags): return
+            self.entries[key] = entry
+            self.size += entry.size
+            for tag in entry.tags:
+                self.keys_by_tag.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        """Removes entry `key`, the lock must be held."""
+        entry = self.entries.pop(key)
+        self.size -= entry.size
+        for tag in entry.tags:
+            keys = self.keys_by_tag.get(tag)
+            if keys is None: continue
+            keys.discard(key)
+            if not keys: del self.keys_by_tag[tag]
+
+    def invalidate(self, *tags):
+        """Drops all entries labelled with any of `tags`, in this process and in the others."""
+        if not self.enabled: return
+        now = time()
+        with self.lock:
+            if len(self.invalidated) > self.MAX_INVALIDATIONS:
+                # entries older than the TTL are gone anyway, so are their invalidations
+                self.invalidated = {t: at for t, at in self.invalidated.items() if at > now - self.ttl}
+            for tag in tags:
+                self.invalidated[tag] = now
+                for key in list(self.keys_by_tag.get(tag, ())):
+                    self.remove(key)
+        for tag in tags:
+            path = self.tag_path(tag)
+            try:
+                with open(path, 'a'):
+                    os.utime(path, (now, now))
+            except OSError as e:
+                current_app.logger.warning('cache: failed to record invalidation of %s: %s', tag, e)
+        if now - self.last_prune > self.ttl:
+            self.last_prune = now
+            self.prune_tag_files(now - self.ttl)
+
+    def prune_tag_files(self, before):
+        """Removes files of tags last invalidated before `before`, entries created earlier have expired."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.stat(path).st_mtime < before: os.remove(path)
+            except OSError:
+                # removed, or invalidated again, by another process at the same time
+                continue
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_tag.clear()
+            self.size = 0
+
+    def count(self, result):
+        self.app.metrics.cache_requests.inc(cache=self.NAME, result=result)
+
+
+def request_key(per_user):
+    """Builds a cache key of the current request from its path, sorted query arguments and user's id."""
+    args = sorted(request.args.items(multi=True))
+    key = [request.path, '&'.join('{}={}'.format(name, value) for name, value in args)]
+    if per_user:
+        user = getattr(g, 'user', None)
+        key.append(str(user.id) if user is not None else '')
+    return '\0'.join(key)
+
+
+def cached(tags, per_user=False):
+    """
+    Caches responses of a resource's GET method.
+
+    :param tags:        function of the method's keyword arguments (URL parameters) returning tags of
+                        the response
+    :param per_user:    `True` when the response depends on the current user, or a function returning
+                        whether it does for the current request
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def decorated(*args, **kwargs):
+            cache = current_app.cache
+            if not cache.enabled: return fn(*args, **kwargs)
+
+            key = request_key(per_user() if callable(per_user) else per_user)
+            entry = cache.get(key)
+            if entry is not None:
+                cache.count('hit')
+                response = Response(entry.body, status=entry.status, headers=entry.headers)
+                response.headers['X-Cache'] = 'HIT'
+                return current_app.compression.serve(response, entry.variants)
+
+            cache.count('miss')
+            created = time()
+            rv = fn(*args, **kwargs)
+            if isinstance(rv, Response): return rv
+            response = current_app.restapi.make_response(*unpack(rv))
+            variants = None
+            if response.status_code == 200 and not response.is_streamed:
+                # the entity tag is computed once and served with every hit (see flavority.etags)
+                if response.get_etag()[0] is None: response.add_etag()
+                body = response.get_data()
+                variants = current_app.compression.variants(body, response.mimetype)
+                cache.put(key, Entry(body, response.status_code,
+                                     [('Content-Type', response.headers['Content-Type']),
+                                      ('ETag', response.headers['ETag'])],
+                                     tuple(tags(**kwargs)), created, created + cache.ttl, variants))
+            response.headers['X-Cache'] = 'MISS'
+            return current_app.compression.serve(response, variants) if variants is not None else response
+        return decorated
+    return decorator
+
+
+def unpack(rv):
+    """Turns a value returned by a resource method into arguments of `Api.make_response`."""
+    if isinstance(rv, tuple):
+        data, code, headers = (rv + (200, None))[:3]
+        return data, code, headers or {}
+    return rv, 200, {}
+
+
+def invalidate(*tags):
+    """Drops cached responses labelled with any of `tags`, called by write paths after a commit."""
+    current_app.cache.invalidate(*tags)
+
+
+def recipe_tag(recipe_id):
+    return 'recipe:{}'.format(recipe_id)
+
+
+__all__ = ['ResponseCache', 'cached', 'invalidate', 'recipe_tag']
@@ -1,13 +1,17 @@
 
+from flask import current_app
 from flask.ext.restful import Resource, reqparse
 from flask_restful import abort
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import load_only
 
 from functools import reduce
 
-from . import lm, app
-from .models import Comment, Recipe
-from .util import Flavority, ViewPager
+from . import lm, db
+from .cache import invalidate, recipe_tag
+from .models import Change, Comment, Recipe
+from .sync import COMMENT, RECIPE, record
+from .util import Flavority, ViewPager, cast_fields, check_fields
 
 
 class Comments(Resource):
@@ -41,6 +45,7 @@ class Comments(Resource):
         parser.add_argument('recipe_id', type=int, default=None)
         parser.add_argument('page', type=int, default=1)
         parser.add_argument('limit', type=int, default=10)
+        parser.add_argument('fields', type=cast_fields, default=None)
         return parser.parse_args()
 
     #Implemented to get all User's comments
@@ -73,7 +78,7 @@ class Comments(Resource):
         try:
             return reduce( lambda q1, q2: q1.union(q2), [ recipe.comments for recipe in user.recipes] )
         except BaseException as e:
-            app.logger.error(e)
+            current_app.logger.error(e)
             abort(404, message="Author with id: {} has no comments!".format(user.id))
 
     @staticmethod
@@ -104,11 +109,15 @@ class Comments(Resource):
         comment_to_delete = self.get_comment(comment_id, author_id, recipe_id) #If someone's user_id is different from author's id then \
                 # comment shouldn't be found because comment_id was given
         try:
-            app.db.session.delete(comment_to_delete)
-            app.db.session.commit()
+            db.session.delete(comment_to_delete)
+            comment_to_delete.recipe.touch()
+            record(COMMENT, comment_to_delete.id, Change.DELETE)
+            record(RECIPE, comment_to_delete.recipe_id, Change.UPDATE)
+            db.session.commit()
         except SQLAlchemyError:
-            app.db.session.rollback()
+            db.session.rollback()
             return Flavority.failure()
+        invalidate('recipes', recipe_tag(comment_to_delete.recipe_id))
         return Flavority.success()
 
     #Method handles comment edition
@@ -116,15 +125,17 @@ class Comments(Resource):
     def put(self, comment_id, new_text):   #zakladam, ze nie mozna zmienic oceny tylko sam tekst komentarza!!
         comment = self.get_comment(comment_id)      #same note as in $delete$ method -> will search for proper comment (only author can edit)
         comment.text = new_text
+        record(COMMENT, comment.id, Change.UPDATE)
         try:
-            app.db.session.commit()
+            db.session.commit()
         except SQLAlchemyError:
-            app.db.session.rollback()
+            db.session.rollback()
             return Flavority.failure()
         return Flavority.success()
 
     def get(self):
         args = self.parse_get_arguments()
+        check_fields(args.fields, Comment.json_fields())
 
         query = Comment.query
         user = lm.get_current_user()
@@ -141,9 +152,11 @@ class Comments(Resource):
         query = query.order_by(Comment.date.desc())
         totalElements = query.count()
         query = ViewPager(query, args['page'], args['limit'])
+        if args.fields is not None:
+            query = query.options(load_only(*Comment.columns_for(args.fields)))
 
         return {
-            'comments': [c.to_json() for c in query.all()],
+            'comments': [c.to_json(fields=args.fields) for c in query.all()],
             'totalElements': totalElements,
         }
 
@@ -160,18 +173,25 @@ class Comments(Resource):
         # creating new comment
         comment = Comment(args.text, args.taste, args.difficulty, user.get_id(), recipe.id)
         try:
-            app.db.session.add(comment)
-            app.db.session.commit()
+            # the comment, recipe's rates and the change log are committed together
+            db.session.add(comment)
+            db.session.flush()
             recipe.count_taste()
             recipe.count_difficulty()
-            app.db.session.commit()
+            recipe.touch()
+            record(COMMENT, comment.id, Change.INSERT)
+            record(RECIPE, recipe.id, Change.UPDATE)
+            db.session.commit()
         except SQLAlchemyError as e:
-            app.logger.error(e)
+            current_app.logger.error(e)
+            db.session.rollback()
             return {
                 'message': 'committing the transaction failed',
                 'status': 500,
             }, 500
 
+        # rates of the recipe have changed
+        invalidate('recipes', recipe_tag(recipe.id))
         return comment.to_json()
 
 
@@ -0,0 +1,110 @@
+
+"""
+Compression of responses negotiated with `Accept-Encoding`.
+
+Responses of compressible types larger than `COMPRESSION_MIN_SIZE` are sent with gzip, or with brotli
+when the `brotli` package is installed and the client prefers it. Cached responses (see flavority.cache)
+keep their compressed variants, made once when the entry is filled, and are served without compressing
+them again.
+
+A compressed response gets the entity tag of its uncompressed body with a suffix of the content coding
+(eg. `"abc-gzip"`), as variants of a strong tag must differ. Conditional requests (see flavority.etags)
+strip the suffix with :func:`strip_encoding`, so they keep working for clients switching encodings;
+`Vary: Accept-Encoding` tells shared caches to keep the variants apart.
+"""
+
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+ENCODING_SUFFIX = '-{}'
+
+
+def variant_tag(etag, encoding):
+    """Returns the entity tag of a response's variant compressed with `encoding`."""
+    return etag + ENCODING_SUFFIX.format(encoding)
+
+
+def strip_encoding(etag):
+    """Returns the entity tag of a response before compression from the tag of a compressed variant."""
+    for encoding in (Compressor.GZIP, Compressor.BROTLI):
+        suffix = ENCODING_SUFFIX.format(encoding)
+        if etag.endswith(suffix): return etag[:-len(suffix)]
+    return etag
+
+
+class Compressor:
+
+    GZIP = 'gzip'
+    BROTLI = 'br'
+
+    def __init__(self, a):
+        self.app = a
+        self.enabled = a.config.get('COMPRESSION_ENABLED', False)
+        self.min_size = a.config.get('COMPRESSION_MIN_SIZE', 1024)
+        self.level = a.config.get('COMPRESSION_LEVEL', 6)
+        self.brotli_quality = a.config.get('COMPRESSION_BROTLI_QUALITY', 5)
+        self.mimetypes = frozenset(a.config.get('COMPRESSION_MIMETYPES', ['application/json']))
+        # in order of preference when the client accepts more than one equally
+        self.encodings = (self.BROTLI, self.GZIP) if brotli is not None else (self.GZIP,)
+        if self.enabled:
+            a.after_request(self.compress_response)
+
+    def compress(self, data, encoding):
+        if encoding == self.BROTLI: return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, self.level)
+
+    def compressible(self, response):
+        return self.enabled and response.mimetype in self.mimetypes and \
+            'Content-Encoding' not in response.headers and \
+            not response.is_streamed and not response.direct_passthrough
+
+    def negotiate(self, available):
+        """Returns the encoding from `available` preferred by the client, or `None`."""
+        return request.accept_encodings.best_match([e for e in self.encodings if e in available])
+
+    def variants(self, data, mimetype):
+        """Returns `{encoding: compressed data}` of a response body worth compressing, stored by the cache."""
+        if not self.enabled or mimetype not in self.mimetypes or len(data) < self.min_size: return {}
+        variants = {}
+        for encoding in self.encodings:
+            compressed = self.compress(data, encoding)
+            if len(compressed) < len(data): variants[encoding] = compressed
+        return variants
+
+    def serve(self, response, variants):
+        """Sends `response` with one of its precompressed `variants` when the client accepts any."""
+        if not self.compressible(response): return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate(variants) if variants else None
+        if encoding is not None:
+            self.encode(response, variants[encoding], encoding)
+        return response
+
+    @staticmethod
+    def encode(response, data, encoding):
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None: response.set_etag(variant_tag(etag, encoding), weak)
+
+    def compress_response(self, response):
+        if not self.compressible(response): return response
+        data = response.get_data()
+        if len(data) < self.min_size: return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate(self.encodings)
+        if encoding is None: return response
+        compressed = self.compress(data, encoding)
+        if len(compressed) < len(data): self.encode(response, compressed, encoding)
+        return response
+
+
+__all__ = ['variant_tag', 'strip_encoding', 'Compressor']
@@ -13,3 +13,74 @@ APPLICATION_ROOT = os.path.curdir
 SQLALCHEMY_DATABASE_URI = "sqlite:///{}".format(os.path.join(
         os.path.abspath(APPLICATION_ROOT),
         'test.db'))
+
+# per-request SQL instrumentation (see flavority.instrumentation)
+SQL_DEBUG_HEADERS = None            # send X-Query-Count and X-DB-Time headers, None follows app.debug
+SQL_SLOW_REQUEST_QUERIES = 50       # log requests executing more statements, None disables
+SQL_SLOW_REQUEST_TIME = 0.5         # log requests spending more seconds in the database, None disables
+SQL_SLOW_REQUEST_LOG_LIMIT = 100    # maximum number of statements logged per request
+
+# operational metrics exposed on /metrics (see flavority.metrics)
+METRICS_DIR = None                  # directory (relative to TEMPDIR) shared by workers, None keeps metrics per process
+METRICS_FLUSH_INTERVAL = 1.0        # seconds between writes of a worker's metrics to METRICS_DIR
+METRICS_ALLOWED_ADDRESSES = ['127.0.0.1', '::1']  # clients allowed to scrape /metrics without a token
+METRICS_TOKEN = None                # bearer token letting other clients scrape /metrics, None disables
+
+# per-request profiling (see flavority.profiling), results are written to TEMPDIR/profiles
+PROFILER_SECRET = None              # value of X-Flavority-Profile header enabling profiling, None disables
+PROFILER_MODE = 'cprofile'          # 'cprofile' or 'sampling', used for requests with the header
+PROFILER_SAMPLE_RATE = 0.0          # fraction of all requests profiled with the sampling profiler
+PROFILER_SAMPLING_INTERVAL = 0.005  # seconds between stack samples
+PROFILER_MAX_FILES = 100            # profiles kept in TEMPDIR/profiles, the oldest are removed, None keeps all
+
+# memory diagnostics on /admin/memory/ (see flavority.memory)
+MEMORY_TRACING = False              # trace allocations with tracemalloc, slows down and serializes requests
+MEMORY_TRACE_FRAMES = 1             # frames stored per traced allocation
+MEMORY_MAX_SNAPSHOTS = 5            # snapshots kept in memory
+
+# SQLite tuning (see flavority.database), the production profile enables WAL and a connection pool
+SQLITE_PRAGMAS = {}                 # {name: value} executed as PRAGMA on every new connection
+SQLALCHEMY_POOL_SIZE = None         # connections pooled per process, None opens one per use
+SQLALCHEMY_MAX_OVERFLOW = None      # connections allowed above SQLALCHEMY_POOL_SIZE under load, None is 10
+SQLALCHEMY_POOL_TIMEOUT = None      # seconds to wait for a pooled connection, None is 30
+
+# production server started by runserver.py (gunicorn), SERVER_WORKERS = None starts one per CPU core
+SERVER_BIND = '127.0.0.1:5000'      # address, or a list of addresses, to listen on
+SERVER_WORKERS = None               # worker processes
+SERVER_THREADS = 4                  # threads per worker process
+SERVER_KEEPALIVE = 5                # seconds an idle keep-alive connection is kept open
+SERVER_TIMEOUT = 30                 # seconds after which a silent worker is killed and replaced
+SERVER_GRACEFUL_TIMEOUT = 30        # seconds workers have to finish requests on reload or shutdown
+SERVER_MAX_REQUESTS = 0             # requests after which a worker is replaced, 0 disables
+SERVER_MAX_REQUESTS_JITTER = 0      # random addition to SERVER_MAX_REQUESTS, so workers don't restart at once
+SERVER_LIMIT_REQUEST_LINE = 4094    # maximum length of a request line in bytes
+SERVER_LIMIT_REQUEST_FIELDS = 100   # maximum number of request headers
+SERVER_PIDFILE = None               # file with pid of the master, `kill -HUP` reloads workers gracefully
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024   # maximum size of a request body in bytes, larger ones get 413
+
+# cache of GET responses (see flavority.cache)
+CACHE_ENABLED = False               # cache responses of listings, recipes, tags, units and ingredients
+CACHE_MAX_BYTES = 64 * 1024 * 1024  # memory used by cached responses of a process
+CACHE_TTL = 60                      # seconds after which a cached response is built again
+
+# compression of responses (see flavority.compression), brotli is used when the `brotli` package is installed
+COMPRESSION_ENABLED = True          # compress responses for clients sending Accept-Encoding
+COMPRESSION_MIN_SIZE = 1024         # bytes, smaller responses are sent as they are
+COMPRESSION_LEVEL = 6               # gzip level, from 1 (fastest) to 9 (smallest)
+COMPRESSION_BROTLI_QUALITY = 5      # brotli quality, from 0 (fastest) to 11 (smallest)
+COMPRESSION_MIMETYPES = ['application/json', 'text/plain']
+
+# many API calls in one request on /batch (see flavority.batch)
+BATCH_MAX_REQUESTS = 20             # sub-requests accepted in one batch
+BATCH_THREADS = 0                   # threads running GET sub-requests concurrently, 0 runs them in order
+
+# NDJSON export of the catalog on /recipes/export (see flavority.export)
+EXPORT_CHUNK_SIZE = 500             # recipes fetched from the cursor, and written, at once
+
+# incremental synchronization on /sync (see flavority.sync)
+SYNC_MAX_CHANGES = 1000             # changes returned at once, the client asks again for the rest
+SYNC_TOMBSTONE_DAYS = 30            # days deletions are kept by `manage.py changelog compact`
+
+# NDJSON import of recipes on /recipes/import (see flavority.bulk_import)
+IMPORT_CHUNK_SIZE = 100             # records validated, resolved and committed in one transaction
+IMPORT_MAX_RECORDS = 10000          # records accepted in one request, the rest is rejected
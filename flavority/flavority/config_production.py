@@ -0,0 +1,35 @@
+
+"""
+Production profile, loaded over the defaults when FLAVORITY_PROFILE=production.
+
+Settings from the file pointed by FLAVORITY_SETTINGS still override these.
+"""
+
+DEBUG = False
+SQL_DEBUG_HEADERS = False
+
+# WAL lets readers work next to a writer, NORMAL synchronisation is safe with WAL (a power loss may only
+# lose the last transactions), a busy writer is waited for instead of failing with "database is locked"
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,           # milliseconds
+    'cache_size': -64000,           # negative means KiB, 64MB per connection
+    'mmap_size': 268435456,         # 256MB
+    'temp_store': 'MEMORY',
+}
+
+SQLALCHEMY_POOL_SIZE = 8
+SQLALCHEMY_MAX_OVERFLOW = 8
+SQLALCHEMY_POOL_TIMEOUT = 10
+
+SERVER_BIND = '0.0.0.0:5000'
+SERVER_THREADS = 4                  # keep at most SQLALCHEMY_POOL_SIZE + SQLALCHEMY_MAX_OVERFLOW
+SERVER_MAX_REQUESTS = 10000
+SERVER_MAX_REQUESTS_JITTER = 1000
+
+METRICS_DIR = 'metrics'             # under TEMPDIR, shared by all workers
+
+CACHE_ENABLED = True
+
+BATCH_THREADS = 4                   # every thread holds a pooled connection while it runs
@@ -1,7 +1,7 @@
 
 from flask import g
 
-from flavority import app, lm
+from flavority import lm
 from flavority.models import User
 
 
@@ -16,12 +16,10 @@ def login(email, pwd):
     if user is not None and user.password == User.hash_pwd(User.combine(user.salt, pwd.encode())): return user
 
 
-@app.before_request
 def retrieve_user():
     g.user = lm.get_current_user()
 
 
-@app.after_request
 def crossorigin(response):
     response.headers['Access-Control-Allow-Origin'] = '*'
     response.headers['Access-Control-Allow-Headers'] = ','.join([
@@ -33,3 +31,8 @@ def crossorigin(response):
         'GET', 'POST', 'OPTIONS', 'HEAD', 'DELETE', 'PUT',
     ])
     return response
+
+
+def init_app(a):
+    a.before_request(retrieve_user)
+    a.after_request(crossorigin)
@@ -0,0 +1,87 @@
+
+import os
+
+from flask.ext.sqlalchemy import SQLAlchemy
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+def is_sqlite_file(info):
+    return info.drivername.startswith('sqlite') and info.database not in (None, '', ':memory:')
+
+
+class Database(SQLAlchemy):
+
+    """
+    Flask-SQLAlchemy extension which can pool connections to a SQLite file.
+
+    By default SQLite connections are opened per use and can't be shared between threads. With
+    `SQLALCHEMY_POOL_SIZE` set they are kept in a :class:`QueuePool` sized for multi-threaded workers
+    (`SQLALCHEMY_MAX_OVERFLOW` and `SQLALCHEMY_POOL_TIMEOUT` apply as well). Without it they are dropped,
+    SQLite's default pools don't accept them.
+    """
+
+    def apply_driver_hacks(self, app, info, options):
+        rv = super().apply_driver_hacks(app, info, options)
+        if not info.drivername.startswith('sqlite'): return rv
+        if not (is_sqlite_file(info) and app.config.get('SQLALCHEMY_POOL_SIZE')):
+            options.pop('max_overflow', None)
+            options.pop('pool_timeout', None)
+            return rv
+
+        max_overflow = app.config.get('SQLALCHEMY_MAX_OVERFLOW')
+        pool_timeout = app.config.get('SQLALCHEMY_POOL_TIMEOUT')
+        options['poolclass'] = QueuePool
+        options['pool_size'] = app.config['SQLALCHEMY_POOL_SIZE']
+        options['max_overflow'] = 10 if max_overflow is None else max_overflow
+        options['pool_timeout'] = 30 if pool_timeout is None else pool_timeout
+        connect_args = options.setdefault('connect_args', {})
+        # a pooled connection is used by many threads, never by two at once
+        connect_args['check_same_thread'] = False
+        return rv
+
+
+def set_pragmas(engine, pragmas):
+    """
+    Executes `PRAGMA name = value` for every item of `pragmas` on each new connection of `engine`.
+    """
+    if not pragmas or engine.dialect.name != 'sqlite': return
+
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute('PRAGMA {} = {}'.format(name, value))
+        finally:
+            cursor.close()
+
+
+def guard_fork(engine):
+    """
+    Makes `engine` refuse pooled connections opened by another process. A forked worker which didn't
+    dispose the engine inherited from its parent opens its own connections instead of sharing the parent's.
+    """
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info['pid'] != pid:
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError('Connection record belongs to pid {}, attempting to check out '
+                                         'in pid {}'.format(connection_record.info['pid'], pid))
+
+
+def configure_engine(a):
+    """
+    Prepares application's engine before the first connection is made.
+    """
+    engine = a.db.get_engine(a)
+    set_pragmas(engine, a.config.get('SQLITE_PRAGMAS'))
+    guard_fork(engine)
+
+
+__all__ = ['Database', 'set_pragmas', 'guard_fork', 'configure_engine']
@@ -0,0 +1,79 @@
+
+from functools import wraps
+from hashlib import sha1
+
+from flask import Response, current_app, request
+
+from .cache import unpack
+from .compression import strip_encoding, variant_tag
+
+
+def version_tag(*parts):
+    """Returns an entity tag identifying a version made of `parts` (eg. a row's id and modification time)."""
+    return sha1('\0'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def conditional(version=None):
+    """
+    Makes a resource's GET method answer with `ETag` and, when the client already has the current version
+    (`If-None-Match` or `If-Modified-Since`), with an empty 304 response.
+
+    :param version: function of the method's keyword arguments returning a tuple of an entity tag and the
+                    modification time (or `None`) of the response, or `None` when it can't tell. It must be
+                    cheaper than building the response, which is skipped when the client's version is
+                    current. Without it the tag is a hash of the response body.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def decorated(*args, **kwargs):
+            etag, last_modified = (version(**kwargs) if version is not None else None) or (None, None)
+            if etag is not None:
+                matched = matching_tag(etag)
+                if matched is not None: return not_modified(matched, last_modified)
+                response = Response(status=200)
+                set_version(response, etag, last_modified)
+                response.make_conditional(request)
+                if response.status_code == 304: return response
+
+            rv = fn(*args, **kwargs)
+            response = rv if isinstance(rv, Response) else current_app.restapi.make_response(*unpack(rv))
+            if response.status_code != 200 or response.is_streamed: return response
+            if etag is not None:
+                set_version(response, etag, last_modified)
+            elif response.get_etag()[0] is None:
+                response.add_etag()
+            matched = matching_tag(response.get_etag()[0])
+            if matched is not None: return not_modified(matched, response.last_modified)
+            return response.make_conditional(request)
+        return decorated
+    return decorator
+
+
+def matching_tag(etag):
+    """
+    Returns the tag from `If-None-Match` naming the same version as `etag`, regardless of the content
+    coding of either of them (see flavority.compression), or `None`.
+    """
+    tags = request.if_none_match
+    if not tags: return None
+    if tags.star_tag: return etag
+    version = strip_encoding(etag)
+    for tag in tags.as_set(include_weak=True):
+        if strip_encoding(tag) == version: return tag
+    return None
+
+
+def not_modified(etag, last_modified):
+    response = Response(status=304)
+    set_version(response, etag, last_modified)
+    return response
+
+
+def set_version(response, etag, last_modified):
+    # a response served compressed from the cache is already encoded
+    encoding = response.headers.get('Content-Encoding')
+    response.set_etag(variant_tag(etag, encoding) if encoding else etag)
+    if last_modified is not None: response.last_modified = last_modified
+
+
+__all__ = ['version_tag', 'conditional']
@@ -0,0 +1,84 @@
+
+from itertools import islice
+
+from flask import Response, current_app, stream_with_context
+from flask.ext.restful import Resource, reqparse
+
+from . import db
+from .loaders import recipes_from_rows
+from .models import Recipe
+from .serializers import encode
+from .util import cast_datetime, cast_fields, check_fields
+
+
+NDJSON = 'application/x-ndjson'
+
+
+def cast_position(x):
+    """Casts a position token of the export, the id of the last recipe a client has received."""
+    position = int(x)
+    if position < 0: raise ValueError('invalid position {!r}'.format(x))
+    return position
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def export_lines(rows, fields, chunk_size):
+    """
+    Yields NDJSON lines of recipes from `rows`, a chunk at a time. Every line is an object with the
+    `recipe` and the `position` token to resume the export after it.
+    """
+    for chunk in chunks(rows, chunk_size):
+        yield b''.join(encode({'position': str(recipe_id), 'recipe': d}) + b'\n'
+                       for recipe_id, d in recipes_from_rows(chunk, fields))
+
+
+class RecipeExport(Resource):
+
+    """
+    Streams the whole catalog of recipes as NDJSON, one recipe (as :func:`Recipe.to_json`) per line,
+    ordered by id. Rows are read from a single cursor `EXPORT_CHUNK_SIZE` at a time and their tags,
+    ingredients, photos and authors are loaded per chunk, so memory use doesn't grow with the catalog
+    and no page is counted or skipped with an offset.
+
+    `updated_since` exports only recipes modified since then (see :func:`Recipe.touch`); an interrupted
+    export is resumed with the `position` of the last line received and the same `updated_since`.
+    """
+
+    @staticmethod
+    def parse_get_arguments():
+        parser = reqparse.RequestParser()
+        parser.add_argument('updated_since', type=cast_datetime, default=None)
+        parser.add_argument('position', type=cast_position, default=None)
+        parser.add_argument('limit', type=int, default=None)
+        parser.add_argument('fields', type=cast_fields, default=None)
+        return parser.parse_args()
+
+    def options(self):
+        return None
+
+    def get(self):
+        args = self.parse_get_arguments()
+        check_fields(args.fields, Recipe.json_fields())
+
+        columns = Recipe.columns_for(args.fields) if args.fields is not None else list(Recipe.__table__.columns)
+        query = db.session.query(*columns).order_by(Recipe.id)
+        if args.updated_since is not None:
+            query = query.filter(Recipe.updated_at >= args.updated_since)
+        if args.position is not None:
+            query = query.filter(Recipe.id > args.position)
+        if args.limit is not None:
+            query = query.limit(args.limit)
+
+        chunk_size = current_app.config.get('EXPORT_CHUNK_SIZE', 500)
+        lines = export_lines(query.yield_per(chunk_size), args.fields, chunk_size)
+        return Response(stream_with_context(lines), mimetype=NDJSON)
+
+
+__all__ = ['RecipeExport']
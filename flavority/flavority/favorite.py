@@ -1,12 +1,14 @@
+from flask import current_app
 from flask.ext.restful import Resource, reqparse
 from flask_restful import abort
 from sqlalchemy.exc import SQLAlchemyError
 
-from . import lm, app
-from .models import Recipe, User
-from .util import Flavority
-
+from . import lm, db
+from .cache import invalidate, recipe_tag
+from .models import Change, Recipe, User
+from .sync import FAVORITE, record
 from .util import Flavority, ViewPager
+from .loaders import short_recipes
 
 
 class FavoriteRecipes(Resource):
@@ -45,10 +47,9 @@ class FavoriteRecipes(Resource):
         user = lm.get_current_user()
         query = user.favourites
         total_elements = query.count()
-        func = lambda x: x.to_json_short(get_photo=lambda photo: photo.id)
         query = ViewPager(query, page=args['page'], limit_per_page=args['limit'])
         return {
-            'recipes': list(map(func, query.all())),
+            'recipes': short_recipes(query),
             'totalElements': total_elements,
         }
 
@@ -60,11 +61,13 @@ class FavoriteRecipes(Resource):
         try:
             if recipe is not None and recipe not in user.favourites:
                 user.favourites.append(recipe)
-            app.db.session.commit()
+                record(FAVORITE, recipe.id, Change.INSERT, user.id)
+            db.session.commit()
         except SQLAlchemyError as e:
-            app.logger.error(e)
-            app.db.session.rollback()
+            current_app.logger.error(e)
+            db.session.rollback()
             return abort(500)
+        if recipe is not None: invalidate('favorites', recipe_tag(recipe.id))
         return Flavority.success()
 
     @lm.auth_required
@@ -74,10 +77,12 @@ class FavoriteRecipes(Resource):
         try:
             if recipe is not None:
                 user.favourites.remove(recipe)
-                app.db.session.commit()
+                record(FAVORITE, recipe.id, Change.DELETE, user.id)
+                db.session.commit()
         except SQLAlchemyError as e:
-            app.logger.error(e)
-            app.db.session.rollback()
+            current_app.logger.error(e)
+            db.session.rollback()
             return abort(500)
+        if recipe is not None: invalidate('favorites', recipe_tag(recipe.id))
         return Flavority.success()
 
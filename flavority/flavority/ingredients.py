@@ -2,7 +2,9 @@
 from flask.ext.restful import Resource, reqparse
 from sqlalchemy import desc, func
 
-from . import app
+from . import db
+from .cache import cached
+from .etags import conditional
 from .models import Ingredient
 from .util import ViewPager
 
@@ -14,9 +16,15 @@ class IngredientsResource(Resource):
     def options(self):
         return None
 
+    @conditional()
+    @cached(lambda: ('ingredients',))
     def get(self):
         """
         Returns a list of all ingredients in database ordered by name.
         """
-        return [{'id': ingr.id, 'name': ingr.name} for ingr in Ingredient.query.order_by(func.lower(Ingredient.name)).all()]
+        # only the two columns are loaded, there's no need to build an ORM object for every ingredient
+        ingredients = db.session\
+            .query(Ingredient.id, Ingredient.name)\
+            .order_by(func.lower(Ingredient.name))
+        return [{'id': id, 'name': name} for id, name in ingredients]
 
@@ -0,0 +1,146 @@
+
+from contextlib import contextmanager
+from threading import local
+from time import perf_counter
+
+from flask import g, request
+from sqlalchemy import event
+
+
+class QueryLog:
+
+    """
+    Statements executed while the log was active together with their total execution time (in seconds).
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.time = 0.0
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def add(self, statement, parameters, elapsed):
+        self.statements.append((statement, parameters, elapsed))
+        self.time += elapsed
+
+    def format(self, limit=None):
+        lines = ['{:8.2f} ms  {}'.format(elapsed * 1000.0, ' '.join(statement.split()))
+                 for statement, parameters, elapsed in self.statements[:limit]]
+        if limit is not None and self.count > limit:
+            lines.append('... and {} more'.format(self.count - limit))
+        return '\n'.join(lines)
+
+
+class QueryTracker:
+
+    """
+    Counts statements executed by application's database engine and the time spent on them.
+
+    Every request gets its own :class:`QueryLog` available as `g.query_log`. With `SQL_DEBUG_HEADERS` enabled
+    (by default in debug mode) its summary is sent in `X-Query-Count` and `X-DB-Time` (milliseconds) response headers. Requests that
+    exceed `SQL_SLOW_REQUEST_QUERIES` statements or `SQL_SLOW_REQUEST_TIME` seconds are logged as warnings
+    along with their statements.
+
+    Logs are kept on a per-thread stack, so statements are recorded by every log active in the executing
+    thread, eg. a request log and an enclosing :func:`budget`.
+    """
+
+    QUERY_COUNT_HEADER = 'X-Query-Count'
+    DB_TIME_HEADER = 'X-DB-Time'
+
+    # attribute of a statement's execution context, which is dropped with it also when the statement fails
+    START_TIME = '_flavority_query_start'
+
+    def __init__(self, a):
+        self.app = a
+        self.local = local()
+
+        engine = a.db.get_engine(a)
+        event.listen(engine, 'before_cursor_execute', self.before_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_execute)
+
+        a.before_request(self.start_request)
+        a.after_request(self.finish_request)
+        a.teardown_request(self.teardown_request)
+
+    @property
+    def logs(self):
+        try:
+            return self.local.logs
+        except AttributeError:
+            self.local.logs = []
+            return self.local.logs
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None: setattr(context, self.START_TIME, perf_counter())
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, self.START_TIME, None)
+        if start is None: return
+        elapsed = perf_counter() - start
+        for log in self.logs:
+            log.add(statement, parameters, elapsed)
+
+    @contextmanager
+    def track(self):
+        """
+        Records statements executed by the current thread inside of a `with` block.
+        """
+        log = QueryLog()
+        self.logs.append(log)
+        try:
+            yield log
+        finally:
+            self.logs.remove(log)
+
+    @contextmanager
+    def budget(self, max_queries, max_time=None):
+        """
+        Test helper failing with :class:`AssertionError` when code inside of a `with` block (eg. a request made
+        with a test client) executes more than `max_queries` statements or spends more than `max_time`
+        seconds in the database.
+        """
+        with self.track() as log:
+            yield log
+        if log.count > max_queries:
+            raise AssertionError('{} queries executed, budget is {}:\n{}'.format(
+                log.count, max_queries, log.format()))
+        if max_time is not None and log.time > max_time:
+            raise AssertionError('{:.2f} ms spent in the database, budget is {:.2f} ms:\n{}'.format(
+                log.time * 1000.0, max_time * 1000.0, log.format()))
+
+    ###
+    ### request hooks
+    ###
+    def start_request(self):
+        g.query_log = QueryLog()
+        self.logs.append(g.query_log)
+
+    def finish_request(self, response):
+        log = getattr(g, 'query_log', None)
+        if log is None: return response
+
+        config = self.app.config
+        debug_headers = config.get('SQL_DEBUG_HEADERS')
+        if debug_headers is None: debug_headers = self.app.debug
+        if debug_headers:
+            response.headers[self.QUERY_COUNT_HEADER] = str(log.count)
+            response.headers[self.DB_TIME_HEADER] = '{:.2f}'.format(log.time * 1000.0)
+
+        max_queries, max_time = config.get('SQL_SLOW_REQUEST_QUERIES'), config.get('SQL_SLOW_REQUEST_TIME')
+        if (max_queries is not None and log.count > max_queries) or \
+                (max_time is not None and log.time > max_time):
+            self.app.logger.warning('%s %s executed %d queries in %.2f ms:\n%s',
+                                    request.method, request.full_path, log.count, log.time * 1000.0,
+                                    log.format(config.get('SQL_SLOW_REQUEST_LOG_LIMIT')))
+        return response
+
+    def teardown_request(self, exc=None):
+        log = getattr(g, 'query_log', None)
+        if log is not None and log in self.logs:
+            self.logs.remove(log)
+
+
+__all__ = ['QueryLog', 'QueryTracker']
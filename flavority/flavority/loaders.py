@@ -0,0 +1,348 @@
+
+"""
+Batch loaders of data related to many rows at once.
+
+Each loader takes ids of a page of rows and makes a single query for all of them, replacing lazy
+relationship loads made once per row.
+"""
+
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, load_only, subqueryload
+
+from . import db
+from .models import Comment, Ingredient, IngredientAssociation, IngredientUnit, Photo, Recipe, Tag, Unit, User, \
+    favour_recipes, tag_assignment
+from .serializers import serializer
+
+# newest comments embedded into every recipe by `include=comments`
+INCLUDED_COMMENTS = 10
+
+
+def in_order(rows, ids):
+    """Sorts `rows` (with an `id`) as their ids are ordered in `ids`."""
+    position = {i: n for n, i in enumerate(ids)}
+    return sorted(rows, key=lambda row: position[row.id])
+
+
+def tags_by_recipe(recipe_ids):
+    """Returns `{recipe_id: [tag json, ...]}` for recipes from `recipe_ids`."""
+    if not recipe_ids: return {}
+    rows = db.session\
+        .query(tag_assignment.c.recipe.label('recipe_id'), Tag.id, Tag.name, Tag.type)\
+        .join(Tag, Tag.id == tag_assignment.c.tag)\
+        .filter(tag_assignment.c.recipe.in_(recipe_ids))\
+        .order_by(tag_assignment.c.recipe, Tag.id)
+    serialize, tags = serializer(Tag), defaultdict(list)
+    for row in rows:
+        tags[row.recipe_id].append(serialize(row))
+    return tags
+
+
+def photo_ids_by_recipe(recipe_ids):
+    """Returns `{recipe_id: [photo id, ...]}` for recipes from `recipe_ids`."""
+    if not recipe_ids: return {}
+    rows = db.session\
+        .query(Photo.recipe_id, Photo.id)\
+        .filter(Photo.recipe_id.in_(recipe_ids))\
+        .order_by(Photo.recipe_id, Photo.id)
+    photos = defaultdict(list)
+    for recipe_id, photo_id in rows:
+        photos[recipe_id].append(photo_id)
+    return photos
+
+
+def ingredients_by_recipe(recipe_ids):
+    """Returns `{recipe_id: [ingredient json, ...]}` (as in :func:`Recipe.to_json`) for recipes from `recipe_ids`."""
+    if not recipe_ids: return {}
+    rows = db.session\
+        .query(IngredientAssociation.recipe_id, Unit.unit_name, Ingredient.name, IngredientAssociation.amount)\
+        .join(IngredientUnit, IngredientUnit.id == IngredientAssociation.ingredient_unit_id)\
+        .join(Unit, Unit.id == IngredientUnit.unit_id)\
+        .join(Ingredient, Ingredient.id == IngredientUnit.ingredient_id)\
+        .filter(IngredientAssociation.recipe_id.in_(recipe_ids))\
+        .order_by(IngredientAssociation.recipe_id, IngredientAssociation.id)
+    ingredients = defaultdict(list)
+    for recipe_id, unit_name, ingr_name, amount in rows:
+        ingredients[recipe_id].append({'unit_name': unit_name, 'ingr_name': ingr_name, 'amount': amount})
+    return ingredients
+
+
+def emails_by_user(user_ids):
+    """Returns `{user_id: email}` of users from `user_ids`."""
+    if not user_ids: return {}
+    return dict(db.session.query(User.id, User.email).filter(User.id.in_(user_ids)).all())
+
+
+def avatars_by_user(user_ids):
+    """Returns `{user_id: photo id}` of avatars of users from `user_ids`."""
+    if not user_ids: return {}
+    rows = db.session\
+        .query(Photo.avatar_user_id, func.min(Photo.id))\
+        .filter(Photo.avatar_user_id.in_(user_ids))\
+        .group_by(Photo.avatar_user_id)
+    return dict(rows.all())
+
+
+def comment_rows(condition):
+    """Returns a query of comments matching `condition` with columns of :func:`Comment.to_json`."""
+    return db.session\
+        .query(Comment.id, Comment.text, Comment.taste, Comment.difficulty, Comment.date, Comment.author_id,
+               Comment.recipe_id, User.email.label('author_name'), Recipe.dish_name.label('recipe_name'))\
+        .join(User, User.id == Comment.author_id)\
+        .join(Recipe, Recipe.id == Comment.recipe_id)\
+        .filter(condition)
+
+
+def comments_from_rows(rows):
+    """Returns `(comment row, comment json)` pairs of rows selected by :func:`comment_rows`."""
+    avatars = avatars_by_user({row.author_id for row in rows})
+    serialize = serializer(Comment)
+    return [(row, serialize(row, OrderedDict([
+        ('author_name', row.author_name),
+        ('author_avatar', avatars.get(row.author_id, '')),
+        ('recipe_name', row.recipe_name),
+    ]))) for row in rows]
+
+
+def comments_by_recipe(recipe_ids, limit=INCLUDED_COMMENTS):
+    """
+    Returns `{recipe_id: [comment json, ...]}` with at most `limit` newest comments of every recipe. Comments
+    are numbered per recipe with a window function, so older ones are never read (SQLite 3.25 or newer).
+    """
+    if not recipe_ids: return {}
+    position = func.row_number().over(partition_by=Comment.recipe_id,
+                                      order_by=(Comment.date.desc(), Comment.id.desc()))
+    ranked = db.session\
+        .query(Comment.id, position.label('position'))\
+        .filter(Comment.recipe_id.in_(recipe_ids))\
+        .subquery()
+    newest = db.session.query(ranked.c.id).filter(ranked.c.position <= limit)
+    rows = comment_rows(Comment.id.in_(newest))\
+        .order_by(Comment.recipe_id, Comment.date.desc(), Comment.id.desc())\
+        .all()
+    comments = defaultdict(list)
+    for row, d in comments_from_rows(rows):
+        comments[row.recipe_id].append(d)
+    return comments
+
+
+def comments_by_id(comment_ids):
+    """Returns `{comment_id: comment json}` of comments from `comment_ids`."""
+    if not comment_ids: return {}
+    rows = comment_rows(Comment.id.in_(comment_ids)).all()
+    return {row.id: d for row, d in comments_from_rows(rows)}
+
+
+def users_by_id(user_ids):
+    """Returns `{user_id: user json}` (as :func:`User.to_json`) of users from `user_ids`."""
+    if not user_ids: return {}
+    user_ids = list(user_ids)
+    recipes = dict(db.session
+                   .query(Recipe.author_id, func.count(Recipe.id))
+                   .filter(Recipe.author_id.in_(user_ids))
+                   .group_by(Recipe.author_id).all())
+    comments = dict(db.session
+                    .query(Comment.author_id, func.count(Comment.id))
+                    .filter(Comment.author_id.in_(user_ids))
+                    .group_by(Comment.author_id).all())
+    # sum of rates of user's recipes weighted by their numbers of comments, and the number of comments,
+    # added up recipe by recipe in the same order as :func:`User.count_average_rate` for identical results
+    rates = defaultdict(lambda: (0, 0))
+    for author_id, rate, count in db.session\
+            .query(Recipe.author_id, Recipe.taste_comments, func.count(Comment.id))\
+            .join(Comment, Comment.recipe_id == Recipe.id)\
+            .filter(Recipe.author_id.in_(user_ids))\
+            .group_by(Recipe.author_id, Recipe.id, Recipe.taste_comments)\
+            .order_by(Recipe.author_id, Recipe.id):
+        rate_sum, total = rates[author_id]
+        rates[author_id] = (rate_sum + (rate or 0) * count, total + count)
+    avatars = avatars_by_user(user_ids)
+
+    iso = lambda dt: dt.isoformat() if dt is not None else ''
+    users = {}
+    rows = db.session\
+        .query(User.id, User.email, User.register_date, User.last_seen_date)\
+        .filter(User.id.in_(user_ids))
+    for row in rows:
+        rate_sum, count = rates.get(row.id, (0, 0))
+        users[row.id] = {
+            'id': row.id,
+            'email': row.email,
+            'register_date': iso(row.register_date),
+            'last_seen_date': iso(row.last_seen_date),
+            'recipes': recipes.get(row.id, 0),
+            'comments': comments.get(row.id, 0),
+            'average_rate': rate_sum / count if count else 0,
+            'avatar': avatars.get(row.id, ''),
+        }
+    return users
+
+
+def authors_by_recipe(recipe_ids):
+    """Returns `{recipe_id: user json}` of authors of recipes from `recipe_ids`."""
+    if not recipe_ids: return {}
+    authors = dict(db.session.query(Recipe.id, Recipe.author_id).filter(Recipe.id.in_(recipe_ids)).all())
+    users = users_by_id(set(authors.values()) - {None})
+    return {recipe_id: users.get(author_id) for recipe_id, author_id in authors.items()}
+
+
+def favorites_count_by_recipe(recipe_ids):
+    """Returns `{recipe_id: number of users who marked it as a favorite}`."""
+    if not recipe_ids: return {}
+    rows = db.session\
+        .query(favour_recipes.c.recipe, func.count(favour_recipes.c.user))\
+        .filter(favour_recipes.c.recipe.in_(recipe_ids))\
+        .group_by(favour_recipes.c.recipe)
+    counts = dict(rows.all())
+    return {recipe_id: counts.get(recipe_id, 0) for recipe_id in recipe_ids}
+
+
+def photo_minis_by_recipe(recipe_ids):
+    """Returns `{recipe_id: [{'id': photo id, 'mini': Base64 encoded miniature}, ...]}`."""
+    if not recipe_ids: return {}
+    rows = db.session\
+        .query(Photo.recipe_id, Photo.id, Photo.mini_data)\
+        .filter(Photo.recipe_id.in_(recipe_ids))\
+        .order_by(Photo.recipe_id, Photo.id)
+    photos = defaultdict(list)
+    for recipe_id, photo_id, mini in rows:
+        photos[recipe_id].append({'id': photo_id, 'mini': mini.decode('ascii') if mini is not None else ''})
+    return photos
+
+
+# resources embedded into recipes by `include=`, name: (loader, value for a recipe without any)
+INCLUDES = OrderedDict([
+    ('comments', (comments_by_recipe, [])),
+    ('author', (authors_by_recipe, None)),
+    ('favorites_count', (favorites_count_by_recipe, 0)),
+    ('photo_minis', (photo_minis_by_recipe, [])),
+])
+
+
+def include_related(recipes, include):
+    """
+    Embeds resources named in `include` into recipes' json, each kind of resource is loaded for all the
+    recipes at once.
+
+    :param recipes: list of `(recipe_id, recipe json)` pairs
+    """
+    if not include or not recipes: return
+    ids = [recipe_id for recipe_id, _ in recipes]
+    for name, (loader, default) in INCLUDES.items():
+        if name not in include: continue
+        related = loader(ids)
+        for recipe_id, d in recipes:
+            d[name] = related.get(recipe_id, default)
+
+
+def photos_by_id(photo_ids, mini=False):
+    """
+    Returns metadata of photos from `photo_ids`, in the same order: ids of recipes or users they're
+    attached to and, with `mini`, Base64 encoded miniatures. Full images are never read.
+    """
+    if not photo_ids: return []
+    columns = [Photo.id, Photo.recipe_id, Photo.avatar_user_id]
+    if mini: columns.append(Photo.mini_data)
+    photos = []
+    for row in in_order(db.session.query(*columns).filter(Photo.id.in_(photo_ids)).all(), photo_ids):
+        d = {
+            'id': row.id,
+            'recipe_id': row.recipe_id if row.recipe_id is not None else '',
+            'avatar_user_id': row.avatar_user_id if row.avatar_user_id is not None else '',
+        }
+        if mini: d['mini'] = row.mini_data.decode('ascii') if row.mini_data is not None else ''
+        photos.append(d)
+    return photos
+
+
+def full_recipes(query, fields=None, include=None, order=None):
+    """
+    Returns recipes selected by `query` in the form of :func:`Recipe.to_json`. Tags, ingredients with
+    their units, authors and photos of all the recipes are loaded with a few queries instead of a few
+    per recipe, and only for the requested fields.
+
+    :param fields:  names of fields to include, all by default
+    :param include: names of related resources to embed (see :func:`include_related`)
+    :param order:   ids the recipes are sorted by, the query's order is kept by default
+    """
+    wanted = lambda name: fields is None or name in fields
+    if fields is not None:
+        query = query.options(load_only(*Recipe.columns_for(fields)))
+    if wanted('tags'):
+        query = query.options(subqueryload(Recipe.tags))
+    if wanted('ingredients'):
+        units = subqueryload(Recipe.ingredients).joinedload(IngredientAssociation.ingredient_unit)
+        query = query.options(units.joinedload(IngredientUnit.ingredient), units.joinedload(IngredientUnit.unit))
+    if wanted('author_name'):
+        query = query.options(joinedload(Recipe.author))
+    rows = query.all()
+    if order is not None: rows = in_order(rows, order)
+
+    ids = [row.id for row in rows]
+    photos = photo_ids_by_recipe(ids) if wanted('photos') else {}
+    recipes = [row.to_json(fields=fields, photo_ids=photos.get(row.id, [])) for row in rows]
+    include_related(list(zip(ids, recipes)), include)
+    return recipes
+
+
+def recipes_from_rows(rows, fields=None):
+    """
+    Returns `(recipe_id, recipe json)` pairs in the form of :func:`Recipe.to_json` built from `rows` of
+    columns (eg. selected with `Recipe.columns_for`) instead of ORM objects, with related data of all
+    the rows loaded with one query each.
+    """
+    wanted = lambda name: fields is None or name in fields
+    ids = [row.id for row in rows]
+    tags = tags_by_recipe(ids) if wanted('tags') else {}
+    ingredients = ingredients_by_recipe(ids) if wanted('ingredients') else {}
+    photos = photo_ids_by_recipe(ids) if wanted('photos') else {}
+    authors = emails_by_user({row.author_id for row in rows}) if wanted('author_name') else {}
+
+    serialize, recipes = serializer(Recipe, fields), []
+    for row in rows:
+        extra_content = OrderedDict()
+        if wanted('tags'): extra_content['tags'] = tags.get(row.id, [])
+        if wanted('ingredients'): extra_content['ingredients'] = ingredients.get(row.id, [])
+        if wanted('photos'): extra_content['photos'] = photos.get(row.id, [])
+        if wanted('author_name'): extra_content['author_name'] = authors.get(row.author_id)
+        recipes.append((row.id, serialize(row, extra_content)))
+    return recipes
+
+
+def short_recipes(query, fields=None, include=None, order=None):
+    """
+    Returns recipes selected by `query` in the form of :func:`Recipe.to_json_short`. Only the needed columns
+    are selected, as tuples instead of ORM objects (so eg. `recipe_text` is never loaded), and tags and
+    photos of the whole page are fetched with one query each.
+
+    :param fields:  names of fields to include, all by default
+    :param include: names of related resources to embed (see :func:`include_related`)
+    :param order:   ids the recipes are sorted by, the query's order is kept by default
+    """
+    wanted = lambda name: fields is None or name in fields
+    rows = query.with_entities(Recipe.id, Recipe.dish_name, Recipe.creation_date, Recipe.taste_comments).all()
+    if order is not None: rows = in_order(rows, order)
+    ids = [row.id for row in rows]
+    tags = tags_by_recipe(ids) if wanted('tags') else {}
+    photos = photo_ids_by_recipe(ids) if wanted('photos') else {}
+
+    recipes = []
+    for row in rows:
+        d = {}
+        if wanted('id'): d['id'] = row.id
+        if wanted('dishname'): d['dishname'] = row.dish_name
+        if wanted('creation_date'): d['creation_date'] = str(row.creation_date)
+        if wanted('photos'): d['photos'] = photos.get(row.id, [])
+        if wanted('rank'): d['rank'] = row.taste_comments if row.taste_comments is not None else 0.0
+        if wanted('tags'): d['tags'] = tags.get(row.id, [])
+        recipes.append(d)
+    include_related(list(zip(ids, recipes)), include)
+    return recipes
+
+
+__all__ = ['in_order', 'tags_by_recipe', 'photo_ids_by_recipe', 'ingredients_by_recipe', 'emails_by_user',
+           'avatars_by_user', 'comment_rows', 'comments_by_recipe', 'comments_by_id', 'users_by_id',
+           'authors_by_recipe', 'favorites_count_by_recipe', 'photo_minis_by_recipe', 'INCLUDES',
+           'include_related', 'photos_by_id', 'full_recipes', 'recipes_from_rows', 'short_recipes']
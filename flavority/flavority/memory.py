@@ -0,0 +1,197 @@
+
+from datetime import datetime
+from functools import wraps
+from itertools import count
+from threading import Lock
+import tracemalloc
+
+from flask import current_app, g, request
+from flask.ext.restful import Resource, reqparse
+from flask_restful import abort
+
+from . import lm
+
+
+class MemoryProfiler:
+
+    """
+    Memory diagnostics based on `tracemalloc`, enabled with `MEMORY_TRACING`.
+
+    For every endpoint it records the peak of traced memory reached while handling a request, above
+    the amount allocated when the request started. The peak is process-wide, so while tracing requests
+    of a process are handled one at a time and every peak belongs to a single request.
+
+    Snapshots taken with :func:`take_snapshot` are kept in memory (at most `MEMORY_MAX_SNAPSHOTS`)
+    and can be compared with each other or with the current state.
+    """
+
+    KEY_TYPE = 'lineno'
+
+    def __init__(self, a):
+        self.app = a
+        self.enabled = a.config.get('MEMORY_TRACING', False)
+        self.max_snapshots = a.config.get('MEMORY_MAX_SNAPSHOTS', 5)
+        self.snapshots = {}
+        self.ids = count(1)
+        self.endpoints = {}
+        self.lock = Lock()
+        self.request_lock = Lock()
+        if not self.enabled: return
+
+        tracemalloc.start(a.config.get('MEMORY_TRACE_FRAMES', 1))
+        self.request_peak = a.metrics.registry.histogram(
+            'flavority_request_peak_memory_bytes', 'Peak of memory allocated while handling a request',
+            ('resource', 'method'), (10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8, 10 ** 9))
+        a.before_request(self.start_request)
+        a.teardown_request(self.teardown_request)
+
+    def start_request(self):
+        # released in teardown_request, which flask calls for every request that got here
+        self.request_lock.acquire()
+        if hasattr(tracemalloc, 'reset_peak'): tracemalloc.reset_peak()
+        g.memory_start = tracemalloc.get_traced_memory()[0]
+
+    def teardown_request(self, exc=None):
+        start = getattr(g, 'memory_start', None)
+        if start is None: return
+        g.memory_start = None
+
+        peak = max(0, tracemalloc.get_traced_memory()[1] - start)
+        self.request_lock.release()
+        key = '{} {}'.format(request.method, request.endpoint or 'unmatched')
+        with self.lock:
+            stats = self.endpoints.setdefault(key, {'requests': 0, 'peak': 0, 'total': 0})
+            stats['requests'] += 1
+            stats['total'] += peak
+            stats['peak'] = max(stats['peak'], peak)
+        self.request_peak.observe(peak, resource=request.endpoint or 'unmatched', method=request.method)
+
+    def endpoint_stats(self):
+        with self.lock:
+            return {key: dict(stats, average=stats['total'] // stats['requests'])
+                    for key, stats in self.endpoints.items()}
+
+    def take_snapshot(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        with self.lock:
+            snapshot_id = next(self.ids)
+            self.snapshots[snapshot_id] = (datetime.now(), snapshot)
+            while len(self.snapshots) > self.max_snapshots:
+                del self.snapshots[min(self.snapshots)]
+        return snapshot_id
+
+    def get_snapshot(self, snapshot_id):
+        with self.lock:
+            return self.snapshots.get(snapshot_id)
+
+    def delete_snapshot(self, snapshot_id):
+        with self.lock:
+            return self.snapshots.pop(snapshot_id, None) is not None
+
+    @staticmethod
+    def describe(stat):
+        frame = stat.traceback[0]
+        return {
+            'file': frame.filename,
+            'line': frame.lineno,
+            'size': stat.size,
+            'count': stat.count,
+        }
+
+    def top(self, snapshot, limit=20):
+        return [self.describe(stat) for stat in snapshot.statistics(self.KEY_TYPE)[:limit]]
+
+    def diff(self, old, new, limit=20):
+        result = []
+        for stat in new.compare_to(old, self.KEY_TYPE)[:limit]:
+            d = self.describe(stat)
+            d.update({'size_diff': stat.size_diff, 'count_diff': stat.count_diff})
+            result.append(d)
+        return result
+
+
+def admin_required(fn):
+    """
+    Like :func:`UserManager.auth_required` but lets in only administrators.
+    """
+    @wraps(fn)
+    @lm.auth_required
+    def decorated(*args, **kwargs):
+        if not lm.get_current_user().is_admin(): abort(403)
+        return fn(*args, **kwargs)
+    return decorated
+
+
+class MemoryResource(Resource):
+
+    """
+    Admin-only endpoint reporting memory usage of the process handling the request.
+    """
+
+    @staticmethod
+    def parse_get_arguments():
+        parser = reqparse.RequestParser()
+        parser.add_argument('limit', type=int, default=20)
+        parser.add_argument('compare_to', type=int, default=None)
+        return parser.parse_args()
+
+    @staticmethod
+    def get_profiler():
+        if not current_app.memory.enabled:
+            abort(404, message='memory tracing is disabled')
+        return current_app.memory
+
+    def options(self, snapshot_id=None):
+        return None
+
+    @admin_required
+    def get(self, snapshot_id=None):
+        """
+        Without `snapshot_id` returns the traced memory, the top allocating sites and the peak memory per
+        endpoint. With `snapshot_id` returns differences between that snapshot and the current state,
+        or the snapshot given with `compare_to`.
+        """
+        profiler, args = self.get_profiler(), self.parse_get_arguments()
+        current, peak = tracemalloc.get_traced_memory()
+
+        if snapshot_id is None:
+            return {
+                'current': current,
+                'peak': peak,
+                'snapshots': sorted(profiler.snapshots),
+                'top': profiler.top(tracemalloc.take_snapshot(), args['limit']),
+                'endpoints': profiler.endpoint_stats(),
+            }
+
+        old = profiler.get_snapshot(snapshot_id)
+        if old is None: abort(404, message='no snapshot with id {}'.format(snapshot_id))
+        if args['compare_to'] is None:
+            new = (datetime.now(), tracemalloc.take_snapshot())
+        else:
+            new = profiler.get_snapshot(args['compare_to'])
+            if new is None: abort(404, message='no snapshot with id {}'.format(args['compare_to']))
+        return {
+            'from': old[0].isoformat(),
+            'to': new[0].isoformat(),
+            'diff': profiler.diff(old[1], new[1], args['limit']),
+        }
+
+    @admin_required
+    def post(self, snapshot_id=None):
+        """
+        Takes a new snapshot, returns its id.
+        """
+        if snapshot_id is not None: abort(405)
+        return {'id': self.get_profiler().take_snapshot()}, 201
+
+    @admin_required
+    def delete(self, snapshot_id=None):
+        if snapshot_id is None: abort(405)
+        if not self.get_profiler().delete_snapshot(snapshot_id): abort(404)
+        return None, 204
+
+
+__all__ = ['MemoryProfiler', 'MemoryResource', 'admin_required']
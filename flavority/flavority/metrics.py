@@ -0,0 +1,364 @@
+
+import atexit
+import fcntl
+from glob import glob
+from hmac import compare_digest
+from json import dump, load
+import os
+import os.path
+from threading import Lock
+from time import perf_counter, time
+
+from flask import Response, abort, g, request
+from sqlalchemy import event
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metric:
+
+    """
+    Base class of all metrics. Values are stored per tuple of label values.
+    """
+
+    TYPE = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = Lock()
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        """Returns `(suffix, labels, value)` tuples, labels being a list of name-value pairs."""
+        with self.lock:
+            return [('', list(zip(self.labels, key)), value) for key, value in self.values.items()]
+
+
+class Counter(Metric):
+
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+
+    TYPE = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            # bucket counts (not cumulative), +Inf bucket, sum
+            counts = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]: i += 1
+            counts[i] += 1
+            counts[-1] += value
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            items = [(key, list(counts)) for key, counts in self.values.items()]
+        for key, counts in items:
+            labels = list(zip(self.labels, key))
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                total += count
+                samples.append(('_bucket', labels + [('le', format_value(bound))], total))
+            samples.append(('_sum', labels, counts[-1]))
+            samples.append(('_count', labels, total))
+        return samples
+
+
+class Registry:
+
+    """
+    In-process collection of metrics.
+
+    With `directory` set every process periodically writes its raw values to a file there and
+    :func:`collect` sums values of all processes, so that a scrape answered by any worker covers
+    the whole deployment. Files of processes which are no longer alive are pruned: their counters and
+    histograms are added to an archive file, so that totals don't go back, and their gauges are dropped.
+    """
+
+    FILE_FORMAT = 'metrics-{}.json'
+    ARCHIVE_FILE = 'archived-metrics.json'
+    LOCK_FILE = 'metrics.lock'
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.metrics = []
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.last_flush = 0.0
+        if directory is not None:
+            if not os.path.isdir(directory): os.makedirs(directory)
+            atexit.register(self.flush)
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def reset(self):
+        """Forgets values of all metrics, eg. ones inherited by a forked worker from its parent."""
+        for metric in self.metrics:
+            with metric.lock:
+                metric.values = {}
+        self.last_flush = 0.0
+
+    def local_values(self):
+        values = {}
+        for metric in self.metrics:
+            with metric.lock:
+                values[metric.name] = [[list(key), value] for key, value in metric.values.items()]
+        return values
+
+    def flush(self, force=True):
+        """Writes values of this process to the shared directory (at most once per `flush_interval`)."""
+        if self.directory is None: return
+        now = time()
+        if not force and now - self.last_flush < self.flush_interval: return
+        self.last_flush = now
+
+        path = os.path.join(self.directory, self.FILE_FORMAT.format(os.getpid()))
+        with open(path + '.tmp', 'w') as file: dump(self.local_values(), file)
+        os.replace(path + '.tmp', path)
+
+    def process_files(self):
+        """Returns `(pid, path)` of files written by processes."""
+        files = []
+        for path in glob(os.path.join(self.directory, self.FILE_FORMAT.format('*'))):
+            try:
+                files.append((int(os.path.basename(path)[len('metrics-'):-len('.json')]), path))
+            except ValueError:
+                continue
+        return files
+
+    def prune(self):
+        """Moves counters and histograms of dead processes to the archive and removes their files."""
+        for pid, path in self.process_files():
+            if pid_alive(pid): continue
+            # renaming claims the file, when many workers prune at once only one of them succeeds
+            claimed = '{}.{}.prune'.format(path, os.getpid())
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(os.path.join(self.directory, self.LOCK_FILE), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                archive_path = os.path.join(self.directory, self.ARCHIVE_FILE)
+                archive, values = read_values(archive_path) or {}, read_values(claimed) or {}
+                for metric in self.metrics:
+                    if isinstance(metric, Gauge): continue
+                    merged = dict((tuple(key), value) for key, value in archive.get(metric.name, []))
+                    merge_values(merged, values.get(metric.name, []))
+                    archive[metric.name] = [[list(key), value] for key, value in merged.items()]
+                with open(archive_path + '.tmp', 'w') as file: dump(archive, file)
+                os.replace(archive_path + '.tmp', archive_path)
+            os.remove(claimed)
+
+    def collect(self):
+        """Returns metrics with values merged from all processes."""
+        if self.directory is None: return self.metrics
+
+        self.flush()
+        self.prune()
+        merged = []
+        for metric in self.metrics:
+            copy = metric.__class__.__new__(metric.__class__)
+            copy.__dict__.update(metric.__dict__, values={}, lock=Lock())
+            merged.append(copy)
+
+        paths = [path for _, path in self.process_files()] + [os.path.join(self.directory, self.ARCHIVE_FILE)]
+        for path in paths:
+            values = read_values(path)
+            if values is None: continue
+            for metric in merged:
+                merge_values(metric.values, values.get(metric.name, []))
+        return merged
+
+    def render(self):
+        """Returns all metrics in Prometheus text exposition format."""
+        lines = []
+        for metric in self.collect():
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.TYPE))
+            for suffix, labels, value in metric.samples():
+                lines.append('{}{}{} {}'.format(metric.name, suffix, format_labels(labels), format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def read_values(path):
+    """Returns values written by :func:`Registry.flush`, or `None` when the file can't be read."""
+    try:
+        with open(path) as file: return load(file)
+    except (IOError, ValueError):
+        return None
+
+
+def merge_values(values, items):
+    """Adds `[key, value]` items read from a file to `values` of a metric."""
+    for key, value in items:
+        key = tuple(key)
+        if key not in values:
+            values[key] = value
+        elif isinstance(value, list):
+            values[key] = [a + b for a, b in zip(values[key], value)]
+        else:
+            values[key] += value
+
+
+def pid_alive(pid):
+    if pid == os.getpid(): return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def format_labels(labels):
+    if not labels: return ''
+    escape = lambda v: v.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in labels) + '}'
+
+
+def format_value(value):
+    return '+Inf' if value == float('inf') else str(value)
+
+
+class Metrics:
+
+    """
+    Operational metrics of the application exposed on `/metrics`.
+
+    Requests are measured per endpoint (a `flask_restful` resource) and HTTP method. Other parts of the
+    application record their own measurements with metrics available as attributes of this object,
+    eg. `app.metrics.photo_encode_seconds.observe(...)`.
+
+    `/metrics` answers clients from `METRICS_ALLOWED_ADDRESSES` and those sending `METRICS_TOKEN` as
+    a bearer token, others get HTTP403.
+    """
+
+    TOKEN_PREFIX = 'Bearer '
+
+    def __init__(self, a):
+        self.app = a
+        self.allowed_addresses = frozenset(a.config.get('METRICS_ALLOWED_ADDRESSES') or ())
+        self.token = a.config.get('METRICS_TOKEN')
+        self.registry = Registry(a.config.get('METRICS_DIR'), a.config.get('METRICS_FLUSH_INTERVAL', 1.0))
+
+        r = self.registry
+        self.request_seconds = r.histogram('flavority_request_duration_seconds',
+                                           'Request latency', ('resource', 'method'))
+        self.requests_in_flight = r.gauge('flavority_requests_in_flight',
+                                          'Requests being processed', ('resource', 'method'))
+        self.responses = r.counter('flavority_responses_total',
+                                   'Responses by status code', ('resource', 'method', 'status'))
+        self.response_bytes = r.histogram('flavority_response_size_bytes',
+                                          'Size of response bodies', ('resource', 'method'), SIZE_BUCKETS)
+        self.photo_encode_seconds = r.histogram('flavority_photo_encode_seconds',
+                                                'Time spent encoding uploaded photos')
+        self.cache_requests = r.counter('flavority_cache_requests_total',
+                                        'Cache lookups by result (hit or miss)', ('cache', 'result'))
+        self.db_connections_checked_out = r.gauge('flavority_db_connections_checked_out',
+                                                  'Database connections currently in use')
+        self.db_connections = r.counter('flavority_db_connections_total',
+                                        'Database connections opened')
+
+        engine = a.db.get_engine(a)
+        event.listen(engine, 'connect', lambda *args: self.db_connections.inc())
+        event.listen(engine, 'checkout', lambda *args: self.db_connections_checked_out.inc())
+        event.listen(engine, 'checkin', lambda *args: self.db_connections_checked_out.dec())
+
+        a.before_request(self.start_request)
+        a.after_request(self.finish_request)
+        a.teardown_request(self.teardown_request)
+        a.add_url_rule('/metrics', 'metrics', self.view)
+
+    @staticmethod
+    def labels():
+        return {'resource': request.endpoint or 'unmatched', 'method': request.method}
+
+    def start_request(self):
+        g.metrics_start = perf_counter()
+        g.metrics_labels = self.labels()
+        self.requests_in_flight.inc(**g.metrics_labels)
+
+    def finish_request(self, response):
+        labels = getattr(g, 'metrics_labels', None)
+        if labels is None: return response
+
+        g.metrics_status = response.status_code
+        size = response.content_length
+        if size is None and not response.is_streamed:
+            size = response.calculate_content_length()
+        if size is not None:
+            self.response_bytes.observe(size, **labels)
+        return response
+
+    def teardown_request(self, exc=None):
+        labels = getattr(g, 'metrics_labels', None)
+        if labels is None: return
+
+        self.request_seconds.observe(perf_counter() - g.metrics_start, **labels)
+        self.responses.inc(status=getattr(g, 'metrics_status', 500), **labels)
+        self.requests_in_flight.dec(**labels)
+        g.metrics_labels = None
+        self.registry.flush(force=False)
+
+    def authorized(self):
+        if request.remote_addr in self.allowed_addresses: return True
+        header = request.headers.get('Authorization', '')
+        return self.token is not None and compare_digest(header, self.TOKEN_PREFIX + self.token)
+
+    def view(self):
+        if not self.authorized(): abort(403)
+        return Response(self.registry.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+
+__all__ = ['Counter', 'Gauge', 'Histogram', 'Registry', 'Metrics']
@@ -0,0 +1,68 @@
+
+"""
+Versioned schema migrations (Alembic) and batched data migrations.
+
+Schema revisions live in `versions/` and are applied with :func:`upgrade`. A database created from scratch
+gets the current schema from the models and is stamped with the newest revision, a database created with
+`db.create_all()` before migrations existed is stamped with :data:`BASELINE` first. Data which has to be
+rewritten for a new revision is converted by :mod:`flavority.migrations.data` in small transactions.
+"""
+
+import os.path
+
+from sqlalchemy import inspect
+
+
+BASELINE = '0001'
+VERSION_TABLE = 'alembic_version'
+
+
+def alembic_config(a):
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option('script_location', os.path.dirname(os.path.abspath(__file__)))
+    config.attributes['app'] = a
+    return config
+
+
+def current_revision(a):
+    from alembic.migration import MigrationContext
+
+    with a.db.get_engine(a).connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def upgrade(a, revision='head'):
+    from alembic import command
+
+    config = alembic_config(a)
+    if current_revision(a) is None:
+        tables = set(inspect(a.db.get_engine(a)).get_table_names()) - {VERSION_TABLE}
+        if not tables:
+            a.db.create_all(app=a)
+            command.stamp(config, 'head')
+            return
+        command.stamp(config, BASELINE)
+    command.upgrade(config, revision)
+
+
+def downgrade(a, revision):
+    from alembic import command
+
+    command.downgrade(alembic_config(a), revision)
+
+
+def stamp(a, revision):
+    from alembic import command
+
+    command.stamp(alembic_config(a), revision)
+
+
+def revision(a, message, autogenerate=False):
+    from alembic import command
+
+    command.revision(alembic_config(a), message=message, autogenerate=autogenerate)
+
+
+__all__ = ['BASELINE', 'alembic_config', 'current_revision', 'upgrade', 'downgrade', 'stamp', 'revision']
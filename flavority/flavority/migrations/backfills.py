@@ -0,0 +1,98 @@
+
+"""
+Data migrations filling in columns added by schema revisions, see :mod:`flavority.migrations.data`.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import and_, select
+
+from flavority.migrations.data import DataMigration, data_migration
+from flavority.models import Change, Comment, Photo, Recipe, User, favour_recipes
+from flavority.sync import COMMENT, FAVORITE, PHOTO, RECIPE
+
+
+@data_migration
+class RecipeUpdatedAt(DataMigration):
+
+    """Recipes created before revision 0003 were last modified when they were created, as far as we know."""
+
+    name = 'recipe_updated_at'
+    table = Recipe.__table__
+
+    def migrate(self, connection, ids):
+        recipes = self.table
+        connection.execute(recipes.update()
+                           .where(and_(recipes.c.id.in_(ids), recipes.c.updated_at == None))
+                           .values(updated_at=recipes.c.creation_date))
+
+
+class LogExisting(DataMigration):
+
+    """
+    Records an insertion of every entity existing before revision 0004 added the change log, so that
+    clients synchronizing from scratch (`/sync?since=0`) get them. Entities with a change already
+    logged are skipped, so running it again or after the application recorded changes is harmless.
+    """
+
+    entity = None
+
+    def migrate(self, connection, ids):
+        log = Change.__table__
+        logged = {row[0] for row in connection.execute(
+            select([log.c.entity_id]).where(and_(log.c.entity == self.entity, log.c.entity_id.in_(ids))))}
+        now = datetime.now()
+        rows = [{'entity': self.entity, 'entity_id': entity_id, 'user_id': None, 'op': Change.INSERT, 'date': now}
+                for entity_id in ids if entity_id not in logged]
+        if rows: connection.execute(log.insert(), rows)
+
+
+@data_migration
+class LogExistingRecipes(LogExisting):
+
+    name = 'changelog_recipes'
+    table = Recipe.__table__
+    entity = RECIPE
+
+
+@data_migration
+class LogExistingComments(LogExisting):
+
+    name = 'changelog_comments'
+    table = Comment.__table__
+    entity = COMMENT
+
+
+@data_migration
+class LogExistingPhotos(LogExisting):
+
+    name = 'changelog_photos'
+    table = Photo.__table__
+    entity = PHOTO
+
+
+@data_migration
+class LogExistingFavorites(LogExisting):
+
+    """Favorites are private, they're logged for their users. Batches are made of users."""
+
+    name = 'changelog_favorites'
+    table = User.__table__
+    entity = FAVORITE
+
+    def migrate(self, connection, ids):
+        log = Change.__table__
+        logged = {tuple(row) for row in connection.execute(
+            select([log.c.user_id, log.c.entity_id]).where(and_(log.c.entity == self.entity, log.c.user_id.in_(ids))))}
+        now = datetime.now()
+        rows = [{'entity': self.entity, 'entity_id': recipe_id, 'user_id': user_id, 'op': Change.INSERT, 'date': now}
+                for user_id, recipe_id in connection.execute(
+                    select([favour_recipes.c.user, favour_recipes.c.recipe])
+                    .where(favour_recipes.c.user.in_(ids))
+                    .order_by(favour_recipes.c.user, favour_recipes.c.recipe))
+                if (user_id, recipe_id) not in logged]
+        if rows: connection.execute(log.insert(), rows)
+
+
+__all__ = ['RecipeUpdatedAt', 'LogExisting', 'LogExistingRecipes', 'LogExistingComments', 'LogExistingPhotos',
+           'LogExistingFavorites']
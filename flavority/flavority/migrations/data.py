@@ -0,0 +1,125 @@
+
+"""
+Batched, resumable data migrations.
+
+A data migration rewrites rows of one table in primary key order, `batch_size` rows per transaction.
+Progress is stored in the `data_migration` table in the same transaction as the batch, so an interrupted
+migration continues from the last committed batch. Short transactions separated by `pause` keep the
+table available to other readers and writers while a large table (eg. `Photo` or `Comment`) is converted.
+
+Migrations are registered with :func:`data_migration` (see :mod:`flavority.migrations.backfills`) and
+executed with `manage.py data run <name>`.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from sys import stdout
+from time import sleep
+
+from sqlalchemy import Boolean, Column, DateTime, Integer, MetaData, String, Table, select
+
+
+metadata = MetaData()
+
+progress = Table('data_migration', metadata,
+                 Column('name', String(80), primary_key=True),
+                 Column('last_id', Integer, nullable=False, default=0),
+                 Column('done', Boolean, nullable=False, default=False),
+                 Column('updated_at', DateTime))
+
+REGISTRY = OrderedDict()
+
+
+class DataMigration:
+
+    """
+    Base class of data migrations. Subclasses set `name` and `table` and implement :func:`migrate`.
+    """
+
+    name = None
+    table = None
+    batch_size = 1000
+
+    def __init__(self):
+        from flask import current_app
+        self.app = current_app._get_current_object()
+
+    @property
+    def primary_key(self):
+        return list(self.table.primary_key.columns)[0]
+
+    def next_batch(self, connection, after, limit):
+        """Returns primary keys of the next `limit` rows with keys greater than `after`."""
+        pk = self.primary_key
+        return [row[0] for row in connection.execute(
+            select([pk]).where(pk > after).order_by(pk).limit(limit))]
+
+    def migrate(self, connection, ids):
+        """Converts rows with primary keys from `ids`."""
+        raise NotImplementedError()
+
+
+def data_migration(cls):
+    """Class decorator registering a :class:`DataMigration` under its `name`."""
+    REGISTRY[cls.name] = cls
+    return cls
+
+
+def status(engine):
+    """Returns `{name: (last_id, done)}` for all registered migrations."""
+    progress.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        rows = {row.name: (row.last_id, row.done) for row in connection.execute(select([progress]))}
+    return OrderedDict((name, rows.get(name, (0, False))) for name in REGISTRY)
+
+
+def run(engine, name, batch_size=None, pause=0.0, max_batches=None, out=stdout):
+    """
+    Runs (or resumes) migration `name` until all rows are converted or `max_batches` batches are done.
+
+    :return:    `True` when the migration is complete
+    """
+    migration = REGISTRY[name]()
+    if batch_size is None: batch_size = migration.batch_size
+    progress.create(engine, checkfirst=True)
+
+    with engine.begin() as connection:
+        row = connection.execute(select([progress]).where(progress.c.name == name)).first()
+        if row is None:
+            connection.execute(progress.insert().values(name=name, last_id=0, done=False,
+                                                        updated_at=datetime.now()))
+        elif row.done:
+            return True
+    last_id = 0 if row is None else row.last_id
+
+    batches, converted = 0, 0
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as connection:
+            ids = migration.next_batch(connection, last_id, batch_size)
+            if ids:
+                migration.migrate(connection, ids)
+                last_id = ids[-1]
+            connection.execute(progress.update()
+                               .where(progress.c.name == name)
+                               .values(last_id=last_id, done=not ids, updated_at=datetime.now()))
+        if not ids:
+            out.write('{}: done, {} rows converted in this run\n'.format(name, converted))
+            return True
+
+        batches, converted = batches + 1, converted + len(ids)
+        out.write('{}: {} rows converted, last id {}\r'.format(name, converted, last_id))
+        out.flush()
+        if pause: sleep(pause)
+
+    out.write('\n{}: stopped after {} batches at id {}\n'.format(name, batches, last_id))
+    return False
+
+
+def reset(engine, name):
+    """Forgets the progress of migration `name`, so the next run starts from the beginning."""
+    progress.create(engine, checkfirst=True)
+    with engine.begin() as connection:
+        connection.execute(progress.delete().where(progress.c.name == name))
+
+
+__all__ = ['DataMigration', 'data_migration', 'status', 'run', 'reset', 'REGISTRY']
@@ -0,0 +1,37 @@
+
+from alembic import context
+
+
+config = context.config
+app = config.attributes.get('app')
+if app is None:
+    from flask import current_app
+    app = current_app._get_current_object()
+
+target_metadata = app.db.metadata
+
+
+def run_migrations_offline():
+    context.configure(url=app.config['SQLALCHEMY_DATABASE_URI'],
+                      target_metadata=target_metadata,
+                      literal_binds=True,
+                      render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with app.db.get_engine(app).connect() as connection:
+        # SQLite can't alter columns in place, batch mode recreates such tables instead
+        context.configure(connection=connection,
+                          target_metadata=target_metadata,
+                          render_as_batch=connection.dialect.name == 'sqlite',
+                          transaction_per_migration=True)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
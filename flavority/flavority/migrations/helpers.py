@@ -0,0 +1,23 @@
+
+"""
+Checks used by revisions to stay idempotent: databases created with `db.create_all()` (eg. by the
+scripts) get the current schema, so a revision may find its table, column or index already in place.
+"""
+
+from alembic import op
+from sqlalchemy import inspect
+
+
+def has_table(table):
+    return table in inspect(op.get_bind()).get_table_names()
+
+
+def has_column(table, column):
+    return column in {c['name'] for c in inspect(op.get_bind()).get_columns(table)}
+
+
+def has_index(table, index):
+    return index in {i['name'] for i in inspect(op.get_bind()).get_indexes(table)}
+
+
+__all__ = ['has_table', 'has_column', 'has_index']
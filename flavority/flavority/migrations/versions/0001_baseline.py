@@ -0,0 +1,18 @@
+"""baseline: schema created by db.create_all() before migrations were introduced
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 00:00:00
+"""
+
+
+revision = '0001'
+down_revision = None
+
+
+def upgrade():
+    pass
+
+
+def downgrade():
+    pass
@@ -0,0 +1,45 @@
+"""index columns used by the most frequent filters, joins and sorting
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+
+from flavority.migrations.helpers import has_index
+
+
+revision = '0002'
+down_revision = '0001'
+
+
+INDEXES = [
+    ('IngredientAssociation', 'recipe_id'),
+    ('Recipe', 'author_id'),
+    ('Recipe', 'creation_date'),
+    ('Recipe', 'taste_comments'),
+    ('Comment', 'author_id'),
+    ('Comment', 'recipe_id'),
+    ('Photo', 'recipe_id'),
+    ('Photo', 'avatar_user_id'),
+    ('tag_assignment', 'recipe'),
+    ('tag_assignment', 'tag'),
+    ('favour_recipes', 'user'),
+    ('favour_recipes', 'recipe'),
+]
+
+
+def index_name(table, column):
+    return 'ix_{}_{}'.format(table, column)
+
+
+def upgrade():
+    for table, column in INDEXES:
+        if not has_index(table, index_name(table, column)):
+            op.create_index(index_name(table, column), table, [column])
+
+
+def downgrade():
+    for table, column in reversed(INDEXES):
+        op.drop_index(index_name(table, column), table)
@@ -0,0 +1,28 @@
+"""modification time of recipes, used to answer conditional requests
+
+Existing rows are filled in by the `recipe_updated_at` data migration (`manage.py data run recipe_updated_at`).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from flavority.migrations.helpers import has_column
+
+
+revision = '0003'
+down_revision = '0002'
+
+
+def upgrade():
+    if not has_column('Recipe', 'updated_at'):
+        with op.batch_alter_table('Recipe') as batch:
+            batch.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('Recipe') as batch:
+        batch.drop_column('updated_at')
@@ -0,0 +1,43 @@
+"""change log of synchronized entities and its compaction horizon, used by /sync
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 00:00:00
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from flavority.migrations.helpers import has_table
+
+
+revision = '0004'
+down_revision = '0003'
+
+
+def upgrade():
+    if not has_table('ChangeLog'):
+        op.create_table('ChangeLog',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('entity', sa.String(length=20), nullable=False),
+                        sa.Column('entity_id', sa.Integer(), nullable=False),
+                        sa.Column('user_id', sa.Integer(), nullable=True),
+                        sa.Column('op', sa.String(length=10), nullable=False),
+                        sa.Column('date', sa.DateTime(), nullable=False),
+                        sa.PrimaryKeyConstraint('id'),
+                        sqlite_autoincrement=True)
+        op.create_index('ix_ChangeLog_entity', 'ChangeLog', ['entity', 'entity_id'])
+        op.create_index('ix_ChangeLog_user_id', 'ChangeLog', ['user_id'])
+    if not has_table('ChangeHorizon'):
+        op.create_table('ChangeHorizon',
+                        sa.Column('id', sa.Integer(), nullable=False),
+                        sa.Column('cursor', sa.Integer(), nullable=False),
+                        sa.Column('date', sa.DateTime(), nullable=True),
+                        sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade():
+    op.drop_table('ChangeHorizon')
+    op.drop_index('ix_ChangeLog_user_id', 'ChangeLog')
+    op.drop_index('ix_ChangeLog_entity', 'ChangeLog')
+    op.drop_table('ChangeLog')
@@ -5,12 +5,12 @@ from hashlib import sha256
 import json
 from re import compile as Regex
 from os import urandom
-import traceback
 
-from flavority import app
-from flavority.auth.mixins import UserMixin
+from sqlalchemy import func, select
 
-db = app.db
+from flavority import db
+from flavority.auth.mixins import UserMixin
+from flavority.serializers import serializer
 
 #Associations aka Logic tables (many-to-many connections)
 #DEL -> te takie inne niebieskie tabelki w uml'u, dla mnie to one sa niebieskie ale pewnie jakos inaczej ten kolor sie zwie, whatever
@@ -20,7 +20,7 @@ class IngredientAssociation(db.Model):
     __tablename__ = 'IngredientAssociation'
     
     id = db.Column(db.Integer, primary_key = True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('Recipe.id'))
+    recipe_id = db.Column(db.Integer, db.ForeignKey('Recipe.id'), index=True)
     ingredient_unit_id = db.Column(db.Integer, db.ForeignKey('IngredientUnit.id'))
     amount = db.Column(db.Integer)
 
@@ -48,46 +48,28 @@ class IngredientUnit(db.Model):
 
 
 tag_assignment = db.Table('tag_assignment',
-                          db.Column('recipe', db.Integer, db.ForeignKey('Recipe.id')),
-                          db.Column('tag', db.Integer, db.ForeignKey('Tag.id')))
+                          db.Column('recipe', db.Integer, db.ForeignKey('Recipe.id'), index=True),
+                          db.Column('tag', db.Integer, db.ForeignKey('Tag.id'), index=True))
 favour_recipes = db.Table('favour_recipes',
-                          db.Column('user', db.Integer, db.ForeignKey('User.id')),
-                          db.Column('recipe', db.Integer, db.ForeignKey('Recipe.id')))
+                          db.Column('user', db.Integer, db.ForeignKey('User.id'), index=True),
+                          db.Column('recipe', db.Integer, db.ForeignKey('Recipe.id'), index=True))
 #End of associations declaration
 
 def serialize_date(dt):
 
     return dt.isoformat()
 
-def to_json_dict(inst, cls, extra_content={}):
+def to_json_dict(inst, cls, extra_content={}, fields=None):
     """
     Jsonify the sql alchemy query result.
 
     in extra_content you can put any stuff you want to have in your json
     e.g. sth that is not a column
+
+    Columns are converted by a serializer compiled once per model (see flavority.serializers), only
+    columns named in fields are included when it's given.
     """
-    convert = dict()
-    convert[db.Date] = lambda dt: dt.isoformat()
-    convert[db.DateTime] = lambda dt: dt.isoformat()
-    # add your coversions for things like datetime's
-    # and what-not that aren't serializable.
-    d = dict()
-    for c in cls.__table__.columns:
-        v = getattr(inst, c.name)
-        if type(c.type) in convert.keys() and v is not None:
-            try:
-                d[c.name] = convert[type(c.type)](v)
-
-            except:
-                traceback.print_exc()
-                d[c.name] = "Error:  Failed to covert using ", str(convert[type(c.type)])
-        elif v is None:
-            d[c.name] = str()
-        else:
-            d[c.name] = v
-    d.update(extra_content)
-    #return json.dumps(d)
-    return d
+    return serializer(cls, fields)(inst, extra_content)
 
 
 class User(db.Model, UserMixin):
@@ -177,6 +159,9 @@ class User(db.Model, UserMixin):
     def get_id(self):
         return self.id
 
+    def is_admin(self):
+        return self.type == User.USER_TYPES[User.USER_TYPE_ADMIN]
+
     def count_average_rate(self):
         sum_rate = 0
         sum_count = 0
@@ -202,15 +187,16 @@ class Recipe(db.Model):
     __tablename__ = 'Recipe'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     dish_name = db.Column(db.String(DESCRIPTION_LENGTH))
-    author_id = db.Column(db.Integer, db.ForeignKey('User.id'))
-    creation_date = db.Column(db.DateTime)
+    author_id = db.Column(db.Integer, db.ForeignKey('User.id'), index=True)
+    creation_date = db.Column(db.DateTime, index=True)
     preparation_time = db.Column(db.SmallInteger)
     recipe_text = db.Column(db.Text)
     difficulty = db.Column(db.Float)
-    taste_comments = db.Column(db.Float)
+    taste_comments = db.Column(db.Float, index=True)
     difficulty_comments = db.Column(db.Float)
     eventToAdminControl = db.Column(db.Boolean)
     portions = db.Column(db.SmallInteger)
+    updated_at = db.Column(db.DateTime)
 
     author = db.relationship('User', backref=db.backref('recipes', lazy='dynamic'))
     ingredients = db.relationship('IngredientAssociation', cascade='all, delete-orphan')
@@ -227,31 +213,71 @@ class Recipe(db.Model):
         self.difficulty = difficulty
         self.taste_comments = 0;
         self.difficulty_comments = 0;
-    
+        self.touch()
+
+    def touch(self):
+        """Marks the recipe as modified, must be called by every change visible in :func:`to_json`."""
+        self.updated_at = datetime.now()
+
     def __repr__(self):
         return '<Recipe name : %r, posted by : %r>' % (self.dish_name, self.author_id)
 
-    def to_json_short(self, get_photo=None):
-        if get_photo is None: get_photo = lambda x: x.id
-        return {
-            "id": self.id,
-            "dishname": self.dish_name,
-            "creation_date": str(self.creation_date),
-            "photos": list(map(lambda x: get_photo(x), self.photos)),
-            "rank": self.taste_comments if self.taste_comments is not None else 0.0,
-            "tags": [i.json for i in self.tags],
-        }
+    # fields of to_json_short, and fields of to_json which aren't columns with columns they're computed from
+    SHORT_FIELDS = ['id', 'dishname', 'creation_date', 'photos', 'rank', 'tags']
+    EXTRA_FIELDS = {
+        'tags': [],
+        'ingredients': [],
+        'photos': [],
+        'author_name': ['author_id'],
+    }
 
-    def to_json(self):
+    @staticmethod
+    def json_fields(short=False):
+        if short: return set(Recipe.SHORT_FIELDS)
+        return set(Recipe.__table__.columns.keys()) | set(Recipe.EXTRA_FIELDS)
+
+    @staticmethod
+    def columns_for(fields):
+        """Returns attributes of columns required to build `fields` of to_json."""
+        names = {'id'}
+        for field in fields:
+            names.update(Recipe.EXTRA_FIELDS.get(field, [field]))
+        columns = Recipe.__table__.columns.keys()
+        return [getattr(Recipe, name) for name in columns if name in names]
+
+    def to_json_short(self, get_photo=None, fields=None):
+        if get_photo is None: get_photo = lambda x: x.id
+        wanted = lambda name: fields is None or name in fields
+        d = {}
+        if wanted('id'): d['id'] = self.id
+        if wanted('dishname'): d['dishname'] = self.dish_name
+        if wanted('creation_date'): d['creation_date'] = str(self.creation_date)
+        if wanted('photos'): d['photos'] = list(map(lambda x: get_photo(x), self.photos))
+        if wanted('rank'): d['rank'] = self.taste_comments if self.taste_comments is not None else 0.0
+        if wanted('tags'): d['tags'] = [i.json for i in self.tags]
+        return d
+
+    def to_json(self, fields=None, photo_ids=None):
+        """
+        :param fields:      names of fields to include (columns and `EXTRA_FIELDS`), all by default; relationships
+                            feeding excluded fields aren't loaded
+        :param photo_ids:   ids of recipe's photos when they're already loaded (see flavority.loaders)
+        """
+        wanted = lambda name: fields is None or name in fields
         extra_content = {}
-        tags = {} if self.tags is None else {'tags': [i.json for i in self.tags]}
-        extra_content.update(tags)
-        ingredients = {} if self.ingredients is None else \
-            {'ingredients': [{"unit_name":i.ingredient_unit.unit.unit_name,"ingr_name": i.ingredient_unit.ingredient.name, "amount": i.amount} for i in self.ingredients]}
-        extra_content.update(ingredients)
-        extra_content.update({"photos": list(map(lambda x: x.id, self.photos))})
-        extra_content.update({'author_name': self.author.email})                
-        return to_json_dict(self, self.__class__, extra_content)
+        if wanted('tags'):
+            tags = {} if self.tags is None else {'tags': [i.json for i in self.tags]}
+            extra_content.update(tags)
+        if wanted('ingredients'):
+            ingredients = {} if self.ingredients is None else \
+                {'ingredients': [{"unit_name":i.ingredient_unit.unit.unit_name,"ingr_name": i.ingredient_unit.ingredient.name, "amount": i.amount} for i in self.ingredients]}
+            extra_content.update(ingredients)
+        if wanted('photos'):
+            if photo_ids is None: photo_ids = list(map(lambda x: x.id, self.photos))
+            extra_content.update({"photos": photo_ids})
+        if wanted('author_name'):
+            extra_content.update({'author_name': self.author.email})
+        return to_json_dict(self, self.__class__, extra_content, fields)
 
     
     def count_taste(self):
@@ -271,7 +297,31 @@ class Recipe(db.Model):
             self.difficulty_comments = 0
         else:
             self.difficulty_comments = sum/self.comments.count()
-            
+
+    @staticmethod
+    def recount_rates(bind=None):
+        """
+        Recomputes `taste_comments` and `difficulty_comments` of every recipe at once.
+
+        This is a set-based equivalent of calling :func:`count_taste` and :func:`count_difficulty`
+        for each recipe: averages are written by one `UPDATE` with correlated scalar subqueries, which
+        every backend (SQLite included) supports, recipes without any comment get 0.
+
+        :param bind:    anything with an `execute` method (session, connection, engine),
+                        application's session by default
+        """
+        if bind is None: bind = db.session
+        recipes, comments = Recipe.__table__, Comment.__table__
+
+        def average(column):
+            return func.coalesce(select([func.avg(column)])
+                                 .where(comments.c.recipe_id == recipes.c.id)
+                                 .as_scalar(), 0)
+
+        bind.execute(recipes.update()
+                     .values(taste_comments=average(comments.c.taste),
+                             difficulty_comments=average(comments.c.difficulty)))
+
 #End of 'Recipe' class declaration
 
 
@@ -287,10 +337,10 @@ class Comment(db.Model):
     taste = db.Column(db.Float)
     difficulty = db.Column(db.Float)
     date = db.Column(db.DateTime)    
-    author_id = db.Column(db.Integer, db.ForeignKey('User.id'))
+    author_id = db.Column(db.Integer, db.ForeignKey('User.id'), index=True)
     author = db.relationship('User', backref=db.backref('comments', lazy='dynamic'))        #DELmany to one z comment do usera
     
-    recipe_id = db.Column(db.Integer, db.ForeignKey('Recipe.id'))
+    recipe_id = db.Column(db.Integer, db.ForeignKey('Recipe.id'), index=True)
     recipe = db.relationship('Recipe', backref=db.backref('comments', lazy='dynamic'))       #DElmany to one z comment do recipe
     
     def __init__(self, text, taste, difficulty, author_id, recipe_id, date=None):
@@ -305,13 +355,40 @@ class Comment(db.Model):
     def __repr__(self):
         return '<Commented by: %r,to recipe: %r, with text: %r>' % (self.author_id, self.recipe_id , self.text)
     
-    def to_json(self):
-        photo = Photo.query.filter(Photo.avatar_user_id == self.author.id).first();
+    # fields of to_json which aren't columns, with columns they're computed from
+    EXTRA_FIELDS = {
+        'author_name': ['author_id'],
+        'author_avatar': ['author_id'],
+        'recipe_name': ['recipe_id'],
+    }
+
+    @staticmethod
+    def json_fields():
+        return set(Comment.__table__.columns.keys()) | set(Comment.EXTRA_FIELDS)
+
+    @staticmethod
+    def columns_for(fields):
+        """Returns attributes of columns required to build `fields` of to_json."""
+        names = {'id'}
+        for field in fields:
+            names.update(Comment.EXTRA_FIELDS.get(field, [field]))
+        return [getattr(Comment, name) for name in Comment.__table__.columns.keys() if name in names]
+
+    def to_json(self, fields=None):
+        """
+        :param fields:  names of fields to include (columns and `EXTRA_FIELDS`), all by default; lookups
+                        feeding excluded fields aren't made
+        """
+        wanted = lambda name: fields is None or name in fields
         extra_content = {}
-        extra_content.update({'author_name': self.author.email})                
-        extra_content.update({'author_avatar': photo.id if photo is not None else ""})                
-        extra_content.update({'recipe_name': self.recipe.dish_name})                
-        return to_json_dict(self, self.__class__, extra_content)
+        if wanted('author_name'):
+            extra_content.update({'author_name': self.author.email})
+        if wanted('author_avatar'):
+            photo = Photo.query.filter(Photo.avatar_user_id == self.author_id).first();
+            extra_content.update({'author_avatar': photo.id if photo is not None else ""})
+        if wanted('recipe_name'):
+            extra_content.update({'recipe_name': self.recipe.dish_name})
+        return to_json_dict(self, self.__class__, extra_content, fields)
     
 #End of 'Comment' class declaration
 
@@ -430,8 +507,8 @@ class Photo(db.Model):
     __tablename__ = 'Photo'
 
     id = db.Column(db.Integer, primary_key=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('Recipe.id'), nullable=True)
-    avatar_user_id = db.Column(db.Integer, db.ForeignKey('User.id'))
+    recipe_id = db.Column(db.Integer, db.ForeignKey('Recipe.id'), nullable=True, index=True)
+    avatar_user_id = db.Column(db.Integer, db.ForeignKey('User.id'), index=True)
     full_data = db.Column(db.LargeBinary, nullable=False)
     mini_data = db.Column(db.LargeBinary, nullable=True)
 
@@ -446,3 +523,55 @@ class Photo(db.Model):
         return self.recipe_id is not None or self.avatar_user_id is not None
 
 
+
+
+class Change(db.Model):
+    '''
+    Append-only log of changes of entities synchronized by clients (see flavority.sync).
+
+    `id` of a change is the cursor clients resume synchronization from. Changes of entities private to a
+    user (eg. favorites) have `user_id` set. Only the latest change of an entity matters to a client, so
+    older ones and old deletions are removed by compaction, which moves :class:`ChangeHorizon` forward.
+    '''
+
+    ENTITY_LENGTH = 20
+    OP_LENGTH = 10
+
+    INSERT = 'insert'
+    UPDATE = 'update'
+    DELETE = 'delete'
+
+    __tablename__ = 'ChangeLog'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    entity = db.Column(db.String(ENTITY_LENGTH), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True, index=True)
+    op = db.Column(db.String(OP_LENGTH), nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+
+    # ids must never be reused once compaction removed the latest rows, cursors would skip new changes
+    __table_args__ = (db.Index('ix_ChangeLog_entity', 'entity', 'entity_id'), {'sqlite_autoincrement': True})
+
+    def __init__(self, entity, entity_id, op, user_id=None):
+        self.entity = entity
+        self.entity_id = entity_id
+        self.op = op
+        self.user_id = user_id
+        self.date = datetime.now()
+
+    def __repr__(self):
+        return '<Change #%r: %r %r %r>' % (self.id, self.op, self.entity, self.entity_id)
+
+
+class ChangeHorizon(db.Model):
+    '''
+    The oldest cursor from which the change log is still complete, a single row. Clients with an older
+    cursor could miss deletions removed by compaction and must synchronize from scratch.
+    '''
+
+    __tablename__ = 'ChangeHorizon'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cursor = db.Column(db.Integer, nullable=False, default=0)
+    date = db.Column(db.DateTime)
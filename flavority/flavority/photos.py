@@ -2,14 +2,19 @@
 from base64 import b64encode, b64decode
 from io import SEEK_SET
 from tempfile import NamedTemporaryFile
+from time import perf_counter
 
-from flask import abort, send_file
+from flask import abort, current_app, has_app_context, send_file
 from flask.ext.restful import Resource, reqparse
 from sqlalchemy.exc import SQLAlchemyError
 from wand.image import Image
 
-from . import app, lm
-from .models import Photo, Recipe, User
+from . import lm, db
+from .cache import invalidate, recipe_tag
+from .loaders import photos_by_id
+from .models import Change, Photo, Recipe, User
+from .sync import PHOTO, RECIPE, record
+from .util import cast_ids
 
 
 class PhotoResource(Resource):
@@ -29,12 +34,15 @@ class PhotoResource(Resource):
     def encode_image(image_binary, mini_size=(300, 300)):
         assert isinstance(image_binary, bytes)
 
+        start = perf_counter()
         with Image(blob=image_binary) as image:
             if image.format.lower() != format:
                 image = PhotoResource.convert_image(image)
             mini_img = image.clone()
             mini_img.resize(*mini_size)
             full, mini = image.make_blob(), mini_img.make_blob()
+        if has_app_context():    # also used by scripts generating datasets
+            current_app.metrics.photo_encode_seconds.observe(perf_counter() - start)
 
         return {
             PhotoResource.KEY_FULL_SIZE: full,
@@ -54,6 +62,7 @@ class PhotoResource(Resource):
 
         parser = reqparse.RequestParser()
         parser.add_argument('mini', type=cast_mini)
+        parser.add_argument('ids', type=cast_ids, default=None)
         return parser.parse_args()
 
     @staticmethod
@@ -81,18 +90,26 @@ class PhotoResource(Resource):
         returned.
 
         If request has a `mini` GET parameter then it will return image's miniature.
+
+        Without `photo_id` but with `ids=` returns metadata of those photos (see :func:`photos_by_id`),
+        including miniatures when `mini` is set.
         """
 
+        args = self.parse_get_arguments()
+        if photo_id is None and args.ids is not None:
+            return {'photos': photos_by_id(args.ids, mini=bool(args['mini']))}
+
         if photo_id is None:
             return abort(404)
 
-        args = self.parse_get_arguments()
-        image = Photo.query.get(photo_id)
-        if image is None:
+        # load only the requested blob instead of the whole row with both sizes of the image
+        column = Photo.mini_data if args['mini'] else Photo.full_data
+        data = db.session.query(column).filter(Photo.id == photo_id).scalar()
+        if data is None:
             return abort(404)
 
-        file = NamedTemporaryFile(prefix='img{}'.format(photo_id), suffix='.jpg', dir=app.config['TEMPDIR'])
-        file.write(b64decode(image.full_data if not args['mini'] else image.mini_data))
+        file = NamedTemporaryFile(prefix='img{}'.format(photo_id), suffix='.jpg', dir=current_app.config['TEMPDIR'])
+        file.write(b64decode(data))
         file.seek(0, SEEK_SET)
 
         return send_file(file, mimetype='image/jpeg')
@@ -127,17 +144,23 @@ class PhotoResource(Resource):
 
         if args.recipe_id is not None:
             photo.recipe = Recipe.query.get(args['recipe_id'])
+            if photo.recipe is not None: photo.recipe.touch()
         if args.user_id is not None:
             photo.avatar_user = User.query.get(args['user_id'])
 
         try:
-            app.db.session.add(photo)
-            app.db.session.commit()
+            db.session.add(photo)
+            db.session.flush()
+            record(PHOTO, photo.id, Change.INSERT)
+            if photo.recipe_id is not None: record(RECIPE, photo.recipe_id, Change.UPDATE)
+            db.session.commit()
         except SQLAlchemyError as e:
-            app.logger.error(e)
-            app.db.session.rollback()
+            current_app.logger.error(e)
+            db.session.rollback()
             return abort(500)
 
+        if photo.recipe_id is not None: invalidate('recipes', recipe_tag(photo.recipe_id))
+        if photo.avatar_user_id is not None: invalidate('users')
         return {
             'id': photo.id
         }
@@ -162,14 +185,21 @@ class PhotoResource(Resource):
 
         photo.full_data = b64encode(files[self.KEY_FULL_SIZE])
         photo.mini_data = b64encode(files[self.KEY_MINI_SIZE])
+        record(PHOTO, photo.id, Change.UPDATE)
+        # the recipe's miniatures, entity tag and modification time change with the photo
+        if photo.recipe is not None:
+            photo.recipe.touch()
+            record(RECIPE, photo.recipe_id, Change.UPDATE)
 
         try:
-            app.db.session.commit()
+            db.session.commit()
         except SQLAlchemyError as e:
-            app.logger.error(e)
-            app.db.session.rollback()
+            current_app.logger.error(e)
+            db.session.rollback()
             return abort(500)
 
+        if photo.recipe_id is not None: invalidate('recipes', recipe_tag(photo.recipe_id))
+        if photo.avatar_user_id is not None: invalidate('users')
         return {
             'id': photo.id
         }
@@ -190,13 +220,15 @@ class PhotoResource(Resource):
         if photo.avatar_user_id != user.id: return abort(403)
 
         try:
-            app.db.session.delete(photo)
-            app.db.session.commit()
+            record(PHOTO, photo.id, Change.DELETE)
+            db.session.delete(photo)
+            db.session.commit()
         except SQLAlchemyError as e:
-            app.logger.error(e)
-            app.db.session.rollback()
+            current_app.logger.error(e)
+            db.session.rollback()
             return abort(500)
 
+        invalidate('users')
         return None, 204
 
 
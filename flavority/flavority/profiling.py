@@ -0,0 +1,160 @@
+
+import cProfile
+from collections import Counter
+from datetime import datetime
+from hmac import compare_digest
+import os
+import os.path
+import random
+import sys
+from threading import Lock, Thread, get_ident
+from time import sleep
+
+from flask import g, request
+
+
+class StackSampler:
+
+    """
+    Periodically records call stacks of registered threads.
+
+    A single daemon thread samples all registered threads and only runs while there is at least one of them,
+    so the cost for a profiled request is one `sys._current_frames` call per `interval` and nothing for the
+    others.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = {}
+        self.lock = Lock()
+        self.thread = None
+
+    def register(self, ident):
+        with self.lock:
+            self.stacks[ident] = Counter()
+            if self.thread is None:
+                self.thread = Thread(target=self.run, name='flavority-sampler', daemon=True)
+                self.thread.start()
+
+    def unregister(self, ident):
+        with self.lock:
+            return self.stacks.pop(ident, Counter())
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.stacks:
+                    self.thread = None
+                    return
+                frames = sys._current_frames()
+                for ident, stacks in self.stacks.items():
+                    frame = frames.get(ident)
+                    if frame is not None: stacks[self.stack(frame)] += 1
+            sleep(self.interval)
+
+    @staticmethod
+    def stack(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename),
+                                             code.co_firstlineno).replace(';', ':'))
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+
+class RequestProfiler:
+
+    """
+    Opt-in profiler of single requests.
+
+    A request is profiled when it carries `X-Flavority-Profile` header equal to `PROFILER_SECRET` or, with
+    `PROFILER_SAMPLE_RATE` above 0, when it's randomly picked. Results are written to `TEMPDIR/profiles`:
+    `PROFILER_MODE = 'cprofile'` produces `.prof` files readable with `pstats`, `'sampling'` produces
+    `.collapsed` stacks accepted by flamegraph tools. Randomly picked requests are always sampled, as
+    the sampling profiler doesn't slow down the profiled code. At most `PROFILER_MAX_FILES` files are
+    kept, the oldest ones are removed.
+    """
+
+    HEADER = 'X-Flavority-Profile'
+    FILE_HEADER = 'X-Flavority-Profile-File'
+
+    MODE_CPROFILE = 'cprofile'
+    MODE_SAMPLING = 'sampling'
+
+    def __init__(self, a):
+        self.app = a
+        self.sampler = StackSampler(a.config.get('PROFILER_SAMPLING_INTERVAL', 0.005))
+        self.directory = os.path.join(a.config['TEMPDIR'], 'profiles')
+        self.max_files = a.config.get('PROFILER_MAX_FILES', 100)
+
+        a.before_request(self.start_request)
+        a.after_request(self.finish_request)
+        a.teardown_request(self.teardown_request)
+
+    def requested(self):
+        secret = self.app.config.get('PROFILER_SECRET')
+        header = request.headers.get(self.HEADER)
+        return secret is not None and header is not None and compare_digest(header, secret)
+
+    def start_request(self):
+        g.profile = None
+        if self.requested():
+            mode = self.app.config.get('PROFILER_MODE', self.MODE_CPROFILE)
+        elif random.random() < self.app.config.get('PROFILER_SAMPLE_RATE', 0.0):
+            mode = self.MODE_SAMPLING
+        else:
+            return
+
+        if mode == self.MODE_CPROFILE:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another request of this process is being profiled
+                return
+        else:
+            profile = get_ident()
+            self.sampler.register(profile)
+        g.profile = (mode, profile, self.filename(mode))
+
+    def filename(self, mode):
+        return '{}-{}-{}-{}.{}'.format(
+            datetime.now().strftime('%Y%m%d%H%M%S%f'), os.getpid(), request.endpoint or 'unmatched',
+            request.method.lower(), 'prof' if mode == self.MODE_CPROFILE else 'collapsed')
+
+    def finish_request(self, response):
+        if getattr(g, 'profile', None) is not None and self.requested():
+            response.headers[self.FILE_HEADER] = g.profile[2]
+        return response
+
+    def teardown_request(self, exc=None):
+        if getattr(g, 'profile', None) is None: return
+        mode, profile, filename = g.profile
+        g.profile = None
+
+        if not os.path.isdir(self.directory): os.makedirs(self.directory)
+        path = os.path.join(self.directory, filename)
+        if mode == self.MODE_CPROFILE:
+            profile.disable()
+            profile.dump_stats(path)
+        else:
+            stacks = self.sampler.unregister(profile)
+            with open(path, 'w') as file:
+                for stack, count in stacks.most_common():
+                    file.write('{} {}\n'.format(stack, count))
+        self.rotate()
+
+    def rotate(self):
+        """Removes the oldest files above `max_files`, names start with the time of the request."""
+        if self.max_files is None: return
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(('.prof', '.collapsed')))
+        for name in names[:max(0, len(names) - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                # removed by another worker at the same time
+                pass
+
+
+__all__ = ['StackSampler', 'RequestProfiler']
@@ -1,19 +1,33 @@
 
 import traceback
 from base64 import b64decode
-from functools import reduce
 from json import loads as json_loads
 from os.path import abspath, join
 
-from flask import request
+from flask import current_app, request
 from flask.ext.restful import Resource, reqparse, abort
 from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
-
-from . import lm, app
-from .models import Recipe, Tag, tag_assignment, Ingredient, IngredientUnit, IngredientAssociation, Photo, Unit, User
-from .util import Flavority, ViewPager
+from sqlalchemy.orm import load_only
+
+from . import lm, db
+from .cache import cached, invalidate, recipe_tag
+from .etags import conditional, version_tag
+from .models import Change, Recipe, Tag, tag_assignment, favour_recipes, Ingredient, IngredientUnit, IngredientAssociation, Photo, Unit, User
+from .util import Flavority, ViewPager, cast_fields, cast_ids, check_fields
+from .loaders import INCLUDES, full_recipes, include_related, short_recipes
 from .photos import PhotoResource
+from .sync import PHOTO, RECIPE, record
+
+
+def include_tags(*tags):
+    """
+    Returns cache tags of a recipe response, extended with those of related resources when any are
+    embedded with `include=`: comments' and authors' counts change with every recipe and comment,
+    avatars with `users` and favorites counts with `favorites`.
+    """
+    if 'include' not in request.args: return tags
+    return tags + ('recipes', 'users', 'favorites')
 
 
 class Recipes(Resource):
@@ -50,10 +64,17 @@ class Recipes(Resource):
         parser.add_argument('tag_id', type=int, default=None, action='append')
         parser.add_argument('advanced', type=cast_bool, default=False)
         parser.add_argument('myrecipes', type=cast_bool, default=False)
+        parser.add_argument('fields', type=cast_fields, default=None)
+        parser.add_argument('include', type=cast_fields, default=None)
+        parser.add_argument('ids', type=cast_ids, default=None)
         return parser.parse_args()
 
     @staticmethod
-    def parse_post_arguments():
+    def parse_post_arguments(req=None):
+        """
+        :param req: object standing for the request with its arguments (see flavority.bulk_import), the
+                    current request by default
+        """
         def cast_difficulty(val):
             f = float(val)
             if f in [0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0]:
@@ -78,13 +99,26 @@ class Recipes(Resource):
         parser.add_argument('photos', type=list, default=[])
         parser.add_argument('remove_photos', type=list, default=[])
 
-        return parser.parse_args()
+        return parser.parse_args(req=req)
 
     def options(self):
         return None
 
+    @cached(lambda: include_tags('recipes'), per_user=lambda: 'myrecipes' in request.args)
     def get(self):
         args = self.parse_get_arguments()
+        check_fields(args.fields, Recipe.json_fields(short=args.short))
+        check_fields(args.include, INCLUDES, 'include')
+        recipes_json = short_recipes if args.short else full_recipes
+
+        if args.ids is not None:
+            # a known set of recipes in the requested order, with one query for all of them
+            recipes = recipes_json(Recipe.query.filter(Recipe.id.in_(args.ids)), args.fields, args.include,
+                                   order=args.ids) if args.ids else []
+            return {
+                'recipes': recipes,
+                'totalElements': len(recipes),
+            }
 
         query = Recipe.query
 
@@ -94,22 +128,16 @@ class Recipes(Resource):
            return #advancedSearch(args['query'], args['page'], args['limit'])
 
         # only recipes containg at least one of the requested tags
-        #   this piece of code may require an explanation:
-        #       the idea is to take all recipes marked with a given tag (one) and union results
-        #       in order to avoid None objects they're filtered out
         if args.tag_id is not None:
-            query = reduce(
-                lambda q1, q2: q1.union(q2),
-                map(
-                    lambda tag: tag.recipes,
-                    filter(lambda x: x is not None, [Tag.query.get(i) for i in args.tag_id])))
+            tagged = db.session.query(tag_assignment.c.recipe).filter(tag_assignment.c.tag.in_(args.tag_id))
+            query = query.filter(Recipe.id.in_(tagged.subquery()))
 
         # only recipes from given user
         if args['user_id']:
             query = query.filter(Recipe.author_id == args['user_id'])
         elif args['myrecipes']:
             user = lm.get_current_user()
-            query = user.recipes
+            query = query.filter(Recipe.author_id == user.id)
         
         # search string in titles
         if args['query'] is not None:
@@ -126,12 +154,10 @@ class Recipes(Resource):
         query = ViewPager(query, page=args['page'], limit_per_page=args['limit'])
 
         # return short or standard form as requested
-        func = lambda x: x.to_json()
-        if args['short']:
-            func = lambda x: x.to_json_short(get_photo=lambda photo: photo.id)
+        recipes = recipes_json(query, args.fields, args.include)
 
         return {
-            'recipes': list(map(func, query.all())),
+            'recipes': recipes,
             'totalElements': total_elements,
         }
 
@@ -192,7 +218,7 @@ class Recipes(Resource):
                 photo = Photo.query.get(pid)
                 if photo is None: continue
                 if not photo.is_attached():
-                    app.db.session.delete()
+                    db.session.delete()
 
         args, user = self.parse_post_arguments(), lm.get_current_user()
 
@@ -209,22 +235,32 @@ class Recipes(Resource):
         remove_unused_photos(args.remove_photos)
 
         try:
-            app.db.session.add(recipe)
-            app.db.session.commit()
+            db.session.add(recipe)
+            db.session.flush()
+            record(RECIPE, recipe.id, Change.INSERT)
+            for photo in recipe.photos:
+                record(PHOTO, photo.id, Change.UPDATE)
+            db.session.commit()
         except SQLAlchemyError as e:
-            app.logger.error(e)
-            app.db.session.rollback()
+            current_app.logger.error(e)
+            db.session.rollback()
             return Flavority.failure(), 500
 
+        # a new recipe may have brought new tags, ingredients and units
+        invalidate('recipes', 'tags', 'ingredients', 'units')
         return {'id': recipe.id}, 201
 
 
 class RecipesWithId(Resource):
 
     @staticmethod
-    def get_recipe_by_id(recipe_id):
+    def get_recipe_by_id(recipe_id, fields=None):
+        query = Recipe.query.filter(Recipe.id == recipe_id)
+        if fields is not None:
+            # author's id is always needed to tell whether it's user's own recipe
+            query = query.options(load_only(*Recipe.columns_for(fields | {'author_id'})))
         try:
-            return Recipe.query.filter(Recipe.id == recipe_id).one()
+            return query.one()
         except:
             abort(404, message="Recipe with id {} doesn't exist".format(recipe_id))
 
@@ -234,6 +270,13 @@ class RecipesWithId(Resource):
         if field_value is not None:
             setattr(recipe, field, field_value)
 
+    @staticmethod
+    def parse_get_arguments():
+        parser = reqparse.RequestParser()
+        parser.add_argument('fields', type=cast_fields, default=None)
+        parser.add_argument('include', type=cast_fields, default=None)
+        return parser.parse_args()
+
     @staticmethod
     def get_form_parser():
         parser = reqparse.RequestParser()
@@ -259,18 +302,45 @@ class RecipesWithId(Resource):
     def options(self, recipe_id=None):
         return None
 
+    @staticmethod
+    def version(recipe_id):
+        """
+        Returns the entity tag and modification time of a recipe as seen by the current user, reading only
+        a few columns instead of the whole recipe. Responses with related resources embedded (`include=`)
+        change without the recipe, they are tagged by their body instead. A signed in user's `favorite`
+        flag changes without touching the recipe, so their responses have no modification time.
+        """
+        if 'include' in request.args: return None
+        row = db.session.query(Recipe.updated_at, Recipe.author_id).filter(Recipe.id == recipe_id).first()
+        if row is None: return None
+        user = lm.get_current_user()
+        favorite = user is not None and db.session.query(favour_recipes)\
+            .filter(favour_recipes.c.user == user.id, favour_recipes.c.recipe == recipe_id)\
+            .count() > 0
+        my_recipe = user is not None and row.author_id == user.id
+        return version_tag('recipe', recipe_id, row.updated_at, favorite, my_recipe, request.query_string), \
+               row.updated_at if user is None else None
+
+    @conditional(lambda recipe_id: RecipesWithId.version(recipe_id))
+    @cached(lambda recipe_id: include_tags(recipe_tag(recipe_id)), per_user=True)
     def get(self, recipe_id):
+        args = self.parse_get_arguments()
+        check_fields(args.fields, Recipe.json_fields())
+        check_fields(args.include, INCLUDES, 'include')
+
         my_recipe = False
         favorite = False
-        recipe = RecipesWithId.get_recipe_by_id(recipe_id)
+        recipe = RecipesWithId.get_recipe_by_id(recipe_id, args.fields)
         user = lm.get_current_user()
         if user is not None:
             if recipe.author_id == user.id:
                 my_recipe = True
-            if recipe in user.favourites:
+            if user.favourites.filter(Recipe.id == recipe.id).count() > 0:
                 favorite = True
+        d = recipe.to_json(fields=args.fields)
+        include_related([(recipe.id, d)], args.include)
         return {
-            'recipe': recipe.to_json(),
+            'recipe': d,
             'favorite': favorite,
             'my_recipe': my_recipe, 
         }
@@ -282,15 +352,18 @@ class RecipesWithId(Resource):
         try:
             tags_to_remove = filter(lambda tag: tag.recipes.count() == 1, recipe.tags)
             for tag in tags_to_remove:
-                app.db.session.delete(tag)
+                db.session.delete(tag)
             for photo in recipe.photos:
-                app.db.session.delete(photo)                        
-            app.db.session.delete(recipe)
-            app.db.session.commit()
+                record(PHOTO, photo.id, Change.DELETE)
+                db.session.delete(photo)                        
+            record(RECIPE, recipe.id, Change.DELETE)
+            db.session.delete(recipe)
+            db.session.commit()
         except:
-            app.db.session.rollback()
+            db.session.rollback()
             return Flavority.failure()
 
+        invalidate('recipes', recipe_tag(recipe_id), 'tags')
         return Flavority.success()
 
     @lm.auth_required
@@ -306,16 +379,19 @@ class RecipesWithId(Resource):
         RecipesWithId.update_if_set(recipe, args, 'portions')
         Recipes.add_tags(recipe, args.tags)
         Recipes.add_ingredients(recipe, args.ingredients)
+        recipe.touch()
+        record(RECIPE, recipe.id, Change.UPDATE)
 
         # TODO: add rest of the arguments
 
         try:
-            app.db.session.commit()
+            db.session.commit()
         except:
             traceback.print_exc()
-            app.db.session.rollback()
+            db.session.rollback()
             return Flavority.failure(), 500
 
+        invalidate('recipes', recipe_tag(recipe_id), 'tags', 'ingredients', 'units')
         return Flavority.success()
 
 
@@ -1,5 +1,4 @@
 
-from . import app
 from .recipes import RecipesWithId, Recipes
 from .signing import Signup, Signin
 from .comments import Comments
@@ -9,25 +8,41 @@ from .photos import PhotoResource
 from .units import UnitResource
 from .users import UserById
 from .favorite import FavoriteRecipes
+from .memory import MemoryResource
+from .batch import Batch
+from .export import RecipeExport
+from .sync import Sync
+from .bulk_import import RecipeImport
 
 
-app.restapi.add_resource(Signup, "/auth/signup")
-app.restapi.add_resource(Signin, "/auth/signin")
+def init_app(a):
+    """Registers all resources in application's API."""
+    api = a.restapi
 
-app.restapi.add_resource(Recipes, "/recipes/")
-app.restapi.add_resource(RecipesWithId,"/recipes/<int:recipe_id>")
+    api.add_resource(Signup, "/auth/signup")
+    api.add_resource(Signin, "/auth/signin")
 
+    api.add_resource(Recipes, "/recipes/")
+    api.add_resource(RecipesWithId,"/recipes/<int:recipe_id>")
+    api.add_resource(RecipeExport, "/recipes/export")
+    api.add_resource(RecipeImport, "/recipes/import")
 
-app.restapi.add_resource(Comments, '/comments/')
-app.restapi.add_resource(TagsResource, '/tags/')
-app.restapi.add_resource(IngredientsResource, '/ingredients/')
-app.restapi.add_resource(UnitResource, '/units/')
 
-app.restapi.add_resource(PhotoResource,
-                         '/photos/',
-                         '/photos/<int:photo_id>/')
-                         
-app.restapi.add_resource(UserById, "/users", "/users/<int:user_id>")
+    api.add_resource(Comments, '/comments/')
+    api.add_resource(TagsResource, '/tags/')
+    api.add_resource(IngredientsResource, '/ingredients/')
+    api.add_resource(UnitResource, '/units/')
 
-app.restapi.add_resource(FavoriteRecipes, "/favorite/","/favorite/<int:recipe_id>")
+    api.add_resource(PhotoResource,
+                     '/photos/',
+                     '/photos/<int:photo_id>/')
 
+    api.add_resource(UserById, "/users", "/users/<int:user_id>")
+
+    api.add_resource(FavoriteRecipes, "/favorite/","/favorite/<int:recipe_id>")
+
+    api.add_resource(MemoryResource, '/admin/memory/', '/admin/memory/<int:snapshot_id>')
+
+    api.add_resource(Batch, '/batch', endpoint=Batch.ENDPOINT)
+
+    api.add_resource(Sync, '/sync')
@@ -0,0 +1,105 @@
+
+"""
+Serializers of model rows compiled once per model.
+
+:func:`serializer` generates a function reading every column of a model directly, with the conversion of
+the column's type inlined, instead of looking the conversion up for every column of every row. Output is
+the same as of the reflective `to_json_dict` it replaces: dates and datetimes in ISO format, `None` as
+an empty string, other values as they are, followed by `extra_content`.
+
+:func:`output_json` is a `flask_restful` representation encoding responses with `orjson` when it's
+installed and with a compact `json.dumps` otherwise.
+"""
+
+from json import dumps
+from keyword import iskeyword
+
+from flask import current_app, make_response
+from flask_restful.representations.json import output_json as restful_output_json
+from sqlalchemy import Date, DateTime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+ISO_TYPES = (Date, DateTime)
+
+SERIALIZERS = {}
+
+# serializers of subsets of columns are cached up to this number, the others are compiled on every use
+MAX_SERIALIZERS = 1024
+
+
+def column_expression(column, variable):
+    # the exact type is checked, as it was by to_json_dict
+    if type(column.type) in ISO_TYPES: return '{}.isoformat()'.format(variable)
+    return variable
+
+
+def compile_serializer(cls, fields=None):
+    """
+    Returns a function `serialize(inst, extra_content=None)` specialized for columns of model `cls`, only
+    those named in `fields` when it's given.
+    """
+    lines = ['def serialize(inst, extra_content=None):', '    d = {}']
+    for column in cls.__table__.columns:
+        name = column.name
+        if fields is not None and name not in fields: continue
+        read = 'inst.{}'.format(name) if name.isidentifier() and not iskeyword(name) \
+            else 'getattr(inst, {!r})'.format(name)
+        lines.append('    v = {}'.format(read))
+        lines.append("    d[{!r}] = '' if v is None else {}".format(name, column_expression(column, 'v')))
+    lines.append('    if extra_content: d.update(extra_content)')
+    lines.append('    return d')
+
+    namespace = {}
+    exec(compile('\n'.join(lines), '<serializer of {}>'.format(cls.__name__), 'exec'), namespace)
+    serialize = namespace['serialize']
+    serialize.__doc__ = 'Serializes columns of a {} row.'.format(cls.__name__)
+    return serialize
+
+
+def serializer(cls, fields=None):
+    """
+    Returns the compiled serializer of model `cls`, compiling it on first use. With `fields` (a collection
+    of names, eg. from a `fields=` argument) the serializer skips all other columns.
+    """
+    if fields is not None:
+        # names of non-column fields don't change the serializer
+        fields = frozenset(fields).intersection(cls.__table__.columns.keys())
+    key = cls if fields is None else (cls, fields)
+    try:
+        return SERIALIZERS[key]
+    except KeyError:
+        serialize = compile_serializer(cls, fields)
+        if fields is None or len(SERIALIZERS) < MAX_SERIALIZERS: SERIALIZERS[key] = serialize
+        return serialize
+
+
+def compile_models(base):
+    """Compiles serializers of all models derived from `base`, so that no request pays for it."""
+    pending = list(base.__subclasses__())
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        if getattr(cls, '__table__', None) is not None: serializer(cls)
+
+
+def encode(data):
+    """Encodes `data` to JSON bytes."""
+    if orjson is not None: return orjson.dumps(data)
+    return dumps(data, separators=(',', ':')).encode()
+
+
+def output_json(data, code, headers=None):
+    """Fast replacement of `flask_restful`'s JSON representation, which is still used in debug mode."""
+    if current_app.debug: return restful_output_json(data, code, headers)
+    response = make_response(encode(data) + b'\n', code)
+    response.headers.extend(headers or {})
+    response.headers['Content-Type'] = 'application/json'
+    return response
+
+
+__all__ = ['serializer', 'compile_models', 'encode', 'output_json']
@@ -4,7 +4,7 @@ from flask import abort
 from flask.ext.restful import Resource, reqparse
 from sqlalchemy.exc import SQLAlchemyError
 
-from flavority import app, lm
+from flavority import lm, db
 from .models import User
 
 
@@ -40,10 +40,10 @@ class Signup(Resource):
             abort(403)  # email already in the database
         
         try:
-            app.db.session.add(user)
-            app.db.session.commit()
+            db.session.add(user)
+            db.session.commit()
         except SQLAlchemyError:
-            app.db.session.rollback()
+            db.session.rollback()
         
         return {
             "result": "success",
@@ -75,9 +75,9 @@ class Signin(Resource):
             
         try:
             user.last_seen_date = datetime.now()
-            app.db.session.commit()
+            db.session.commit()
         except SQLAlchemyError:
-            app.db.session.rollback()
+            db.session.rollback()
                                    
         return {
             "result": "success",
@@ -0,0 +1,159 @@
+
+"""
+Incremental synchronization of clients from the change log (see :class:`Change`).
+
+Write paths record changes of recipes, comments, favorites and photos with :func:`record` in the same
+transaction as the change. `/sync?since=<cursor>` returns entities inserted or updated since the cursor,
+as they are now, and ids of those deleted, with the cursor to use next time. Favorites are private, a
+client gets those of its user only. Entities which existed before the log are logged once by the data
+migrations `changelog_recipes`, `changelog_comments`, `changelog_photos` and `changelog_favorites`
+(`manage.py data run <name>`), until then `since=0` misses them.
+
+The log is compacted with `manage.py changelog compact` (:func:`compact`): changes followed by a later
+change of the same entity are removed at once, deletions after `SYNC_TOMBSTONE_DAYS`. Cursors older
+than the removed deletions are answered with HTTP410 and such clients synchronize from scratch.
+"""
+
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask.ext.restful import Resource, reqparse
+from flask_restful import abort
+from sqlalchemy import and_, func, or_, select
+
+from . import lm, db
+from .loaders import comments_by_id, full_recipes, photos_by_id
+from .models import Change, ChangeHorizon, Recipe
+
+
+RECIPE = 'recipe'
+COMMENT = 'comment'
+FAVORITE = 'favorite'
+PHOTO = 'photo'
+
+HORIZON_ID = 1
+
+
+def record(entity, entity_id, op, user_id=None):
+    """Adds a change of an entity to the session, it's committed together with the change itself."""
+    db.session.add(Change(entity, entity_id, op, user_id))
+
+
+def horizon():
+    """Returns the oldest cursor from which the change log is complete."""
+    cursor = db.session.query(ChangeHorizon.cursor).filter(ChangeHorizon.id == HORIZON_ID).scalar()
+    return cursor or 0
+
+
+def compact(tombstone_days, now=None):
+    """
+    Removes changes superseded by a later change of the same entity, and deletions older than
+    `tombstone_days`, moving the horizon past them.
+
+    :return:    numbers of superseded changes and of deletions removed
+    """
+    if now is None: now = datetime.now()
+    log = Change.__table__
+
+    latest = select([func.max(log.c.id)]).group_by(log.c.entity, log.c.entity_id, log.c.user_id)
+    superseded = db.session.execute(log.delete().where(~log.c.id.in_(latest))).rowcount
+
+    expired, removed = db.session.query(func.max(Change.id))\
+        .filter(Change.op == Change.DELETE, Change.date < now - timedelta(days=tombstone_days))\
+        .scalar(), 0
+    if expired is not None:
+        removed = db.session.execute(log.delete().where(and_(log.c.op == Change.DELETE, log.c.id <= expired)))\
+            .rowcount
+        row = ChangeHorizon.query.get(HORIZON_ID)
+        if row is None:
+            row = ChangeHorizon(id=HORIZON_ID, cursor=0)
+            db.session.add(row)
+        row.cursor, row.date = max(row.cursor or 0, expired), now
+    db.session.commit()
+    return superseded, removed
+
+
+def load_recipes(ids):
+    return {d['id']: d for d in full_recipes(Recipe.query.filter(Recipe.id.in_(ids)), order=ids)}
+
+
+def load_photos(ids):
+    return {d['id']: d for d in photos_by_id(ids)}
+
+
+# synchronized entities, name: (key in the response, function loading `{id: json}` of entities from ids)
+ENTITIES = OrderedDict([
+    (RECIPE, ('recipes', load_recipes)),
+    (COMMENT, ('comments', comments_by_id)),
+    (FAVORITE, ('favorites', lambda ids: {i: i for i in ids})),
+    (PHOTO, ('photos', load_photos)),
+])
+
+
+def cast_cursor(x):
+    cursor = int(x)
+    if cursor < 0: raise ValueError('invalid cursor {!r}'.format(x))
+    return cursor
+
+
+class Sync(Resource):
+
+    """
+    Returns changes since a client's cursor: `{'cursor': ..., 'more': ..., 'changes': {'recipes':
+    {'upserted': [recipe json, ...], 'deleted': [id, ...]}, ...}}`. Favorites are ids of recipes. When
+    `more` is set there are further changes, requested with the returned cursor.
+    """
+
+    @staticmethod
+    def parse_get_arguments():
+        parser = reqparse.RequestParser()
+        parser.add_argument('since', type=cast_cursor, default=0)
+        parser.add_argument('limit', type=cast_cursor, default=None)
+        return parser.parse_args()
+
+    def options(self):
+        return None
+
+    def get(self):
+        args, user = self.parse_get_arguments(), lm.get_current_user()
+        max_changes = current_app.config.get('SYNC_MAX_CHANGES', 1000)
+        limit = min(args.limit or max_changes, max_changes)
+        if args.since > 0 and args.since < horizon():
+            abort(410, message='cursor {} is older than the change log, synchronize from scratch'.format(args.since))
+
+        query = db.session.query(Change.id, Change.entity, Change.entity_id, Change.op)\
+            .filter(Change.id > args.since)
+        if user is None:
+            query = query.filter(Change.user_id == None)
+        else:
+            query = query.filter(or_(Change.user_id == None, Change.user_id == user.id))
+        rows = query.order_by(Change.id).limit(limit + 1).all()
+        more, rows = len(rows) > limit, rows[:limit]
+
+        # only the latest change of an entity matters
+        latest = OrderedDict()
+        for row in rows:
+            latest.pop((row.entity, row.entity_id), None)
+            latest[(row.entity, row.entity_id)] = row.op
+        upserted, deleted = defaultdict(list), defaultdict(list)
+        for (entity, entity_id), op in latest.items():
+            (deleted if op == Change.DELETE else upserted)[entity].append(entity_id)
+
+        changes = {}
+        for entity, (name, load) in ENTITIES.items():
+            ids = upserted[entity]
+            found = load(ids) if ids else {}
+            changes[name] = {
+                'upserted': [found[i] for i in ids if i in found],
+                # entities deleted without a change recorded yet
+                'deleted': deleted[entity] + [i for i in ids if i not in found],
+            }
+        return {
+            'cursor': rows[-1].id if rows else args.since,
+            'more': more,
+            'changes': changes,
+        }
+
+
+__all__ = ['RECIPE', 'COMMENT', 'FAVORITE', 'PHOTO', 'record', 'horizon', 'compact', 'Sync']
@@ -2,7 +2,8 @@
 from flask.ext.restful import Resource, reqparse
 from sqlalchemy import desc, func
 
-from . import app
+from . import db
+from .cache import cached
 from .models import Tag, tag_assignment
 from .util import ViewPager
 
@@ -26,6 +27,7 @@ class TagsResource(Resource):
     def options(self):
         return None
 
+    @cached(lambda: ('tags',))
     def get(self):
         """
         Returns a list of TAGS_LIMIT most used tags in the following convention:
@@ -45,7 +47,7 @@ class TagsResource(Resource):
         # then there are sorted, in descending order, by a number of recipes tagged
         # and limited to the predefined number
         # in order to get tag's name they are also joined with Tag object
-        tags = app.db.session\
+        tags = db.session\
             .query(tag_assignment.columns.tag, Tag.name, func.count(tag_assignment.columns.tag))\
             .join(Tag, tag_assignment.columns.tag == Tag.id)\
             .group_by(tag_assignment.columns.tag)\
@@ -1,6 +1,8 @@
 
 from flask.ext.restful import Resource
 
+from .cache import cached
+from .etags import conditional
 from .models import Unit
 
 
@@ -9,6 +11,8 @@ class UnitResource(Resource):
     def options(self):
         pass
 
+    @conditional()
+    @cached(lambda: ('units',))
     def get(self):
         query = Unit.query
         return [u.to_json() for u in query.all()]
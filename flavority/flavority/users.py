@@ -4,13 +4,30 @@ import traceback
 from flask.ext.restful import Resource, reqparse
 from flask_restful import abort
 
-from . import lm, app
+from . import lm
+from .etags import conditional
+from .loaders import users_by_id
 from .models import User
-from .util import Flavority
+from .util import Flavority, cast_ids
 
 class UserById(Resource):
 
+    @staticmethod
+    def parse_get_arguments():
+        parser = reqparse.RequestParser()
+        parser.add_argument('ids', type=cast_ids, default=None)
+        return parser.parse_args()
+
+    @conditional()
     def get(self, user_id=None):
+        """
+        Returns a user with `user_id`, the logged user, or with `ids=` users with those ids in the same
+        order, all of them loaded at once.
+        """
+        args = self.parse_get_arguments()
+        if user_id is None and args.ids is not None:
+            users = users_by_id(args.ids)
+            return {'users': [users[i] for i in args.ids if i in users]}
         if user_id is not None:
             return UserById.get_user_by_id(user_id).to_json() 
         else:
@@ -1,8 +1,52 @@
 
+from datetime import datetime
+
+from flask_restful import abort
+
+
+# ids accepted by an `ids=` argument
+MAX_IDS = 100
+
 def ViewPager(query, page=1, limit_per_page=10):
     return query.offset(limit_per_page * (page - 1)).limit(limit_per_page)
 
 
+def cast_fields(x):
+    """Casts a `fields=` (or `include=`) argument, a comma separated list of names, to a set of names."""
+    return {name.strip() for name in x.split(',') if name.strip()}
+
+
+def cast_ids(x):
+    """Casts an `ids=` argument, a comma separated list of ids, to a list of distinct ids in the given order."""
+    ids, seen = [], set()
+    for part in x.split(','):
+        if not part.strip(): continue
+        i = int(part)
+        if i not in seen:
+            ids.append(i)
+            seen.add(i)
+    if len(ids) > MAX_IDS: raise ValueError('at most {} ids are allowed'.format(MAX_IDS))
+    return ids
+
+
+def cast_datetime(x):
+    """Casts an ISO 8601 date or date and time (as written by `isoformat`), without a time zone."""
+    for format in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(x, format)
+        except ValueError:
+            pass
+    raise ValueError('{!r} is not an ISO 8601 date'.format(x))
+
+
+def check_fields(fields, allowed, argument='fields'):
+    """Aborts with HTTP400 when `fields` (if given) contain a name which isn't `allowed`."""
+    if fields is None: return
+    unknown = fields - set(allowed)
+    if unknown:
+        abort(400, message='unknown {}: {}'.format(argument, ', '.join(sorted(unknown))))
+
+
 class Flavority:
 
     @staticmethod
@@ -20,4 +64,4 @@ class Flavority:
         }
 
 
-__all__ = ['ViewPager', 'Flavority', ]
+__all__ = ['ViewPager', 'Flavority', 'cast_fields', 'check_fields', ]
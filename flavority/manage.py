@@ -0,0 +1,118 @@
+
+from argparse import ArgumentParser
+from sys import stdout, exit
+
+
+__desc__ = """Manage flavority's database: schema migrations, batched data migrations and compaction of the
+change log. The schema of a new database is created with `db upgrade`."""
+
+
+def db_command(app, args):
+    from flavority import migrations
+
+    if args.action == 'upgrade':
+        migrations.upgrade(app, args.revision or 'head')
+    elif args.action == 'downgrade':
+        migrations.downgrade(app, args.revision)
+    elif args.action == 'stamp':
+        migrations.stamp(app, args.revision)
+    elif args.action == 'current':
+        stdout.write('{}\n'.format(migrations.current_revision(app)))
+    elif args.action == 'revision':
+        migrations.revision(app, args.message, args.autogenerate)
+    return True
+
+
+def data_command(app, args):
+    from flavority.migrations import data
+    import flavority.migrations.backfills     # registers data migrations
+
+    engine = app.db.get_engine(app)
+    if args.action == 'list':
+        for name, (last_id, done) in data.status(engine).items():
+            stdout.write('{:<40} {}\n'.format(name, 'done' if done else 'at id {}'.format(last_id)))
+        return True
+    if args.name not in data.REGISTRY:
+        stdout.write('no data migration named {}\n'.format(args.name))
+        return False
+    if args.action == 'reset':
+        data.reset(engine, args.name)
+        return True
+    return data.run(engine, args.name, args.batch_size, args.pause, args.max_batches)
+
+
+def changelog_command(app, args):
+    from flavority.sync import compact, horizon
+
+    if args.action == 'horizon':
+        stdout.write('{}\n'.format(horizon()))
+        return True
+    days = args.days if args.days is not None else app.config['SYNC_TOMBSTONE_DAYS']
+    superseded, removed = compact(days)
+    stdout.write('removed {} superseded changes and {} deletions older than {} days, horizon is {}\n'.format(
+        superseded, removed, days, horizon()))
+    return True
+
+
+parser = ArgumentParser(description = __desc__)
+commands = parser.add_subparsers(dest = 'command')
+
+db_parser = commands.add_parser('db', help = 'schema migrations')
+db_parser.add_argument('action',
+        choices = ['upgrade', 'downgrade', 'stamp', 'current', 'revision'])
+db_parser.add_argument('revision',
+        nargs = '?',
+        default = None,
+        help = 'target revision of upgrade, downgrade and stamp')
+db_parser.add_argument('-m', '--message',
+        default = None,
+        help = 'description of a new revision')
+db_parser.add_argument('--autogenerate',
+        action = 'store_true',
+        help = 'fill a new revision with differences between the models and the database')
+db_parser.set_defaults(handler = db_command)
+
+data_parser = commands.add_parser('data', help = 'batched data migrations')
+data_parser.add_argument('action',
+        choices = ['list', 'run', 'reset'])
+data_parser.add_argument('name',
+        nargs = '?',
+        default = None,
+        help = 'name of a data migration')
+data_parser.add_argument('-b', '--batch-size',
+        type = int,
+        default = None,
+        help = 'rows converted per transaction')
+data_parser.add_argument('-p', '--pause',
+        type = float,
+        default = 0.0,
+        help = 'seconds to wait between batches, giving way to other clients of the database')
+data_parser.add_argument('--max-batches',
+        type = int,
+        default = None,
+        help = 'stop after this many batches, a next run resumes where this one stopped')
+data_parser.set_defaults(handler = data_command)
+
+changelog_parser = commands.add_parser('changelog', help = 'change log read by /sync')
+changelog_parser.add_argument('action',
+        choices = ['compact', 'horizon'])
+changelog_parser.add_argument('-d', '--days',
+        type = int,
+        default = None,
+        help = 'days deletions are kept, SYNC_TOMBSTONE_DAYS by default')
+changelog_parser.set_defaults(handler = changelog_command)
+
+
+def main():
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        exit(2)
+
+    from flavority import create_app
+    app = create_app()
+    with app.app_context():
+        exit(0 if args.handler(app, args) else 1)
+
+if __name__ == "__main__":
+    main()
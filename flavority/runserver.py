@@ -1,9 +1,90 @@
 
-from flavority import app
+from argparse import ArgumentParser
+import multiprocessing
+import os
+
+
+__desc__ = """Run flavority. By default the production profile is served by gunicorn with SERVER_WORKERS
+processes of SERVER_THREADS threads each (see config.py), `--dev` starts the Werkzeug development server.
+Send SIGHUP to the master to reload workers gracefully and SIGTERM to stop after running requests end."""
+
+
+def server_options(config):
+    """Translates SERVER_* settings of the application into gunicorn settings."""
+    bind = config['SERVER_BIND']
+    return {
+        'bind': [bind] if isinstance(bind, str) else list(bind),
+        'workers': config['SERVER_WORKERS'] or multiprocessing.cpu_count(),
+        'threads': config['SERVER_THREADS'],
+        'worker_class': 'gthread',
+        'keepalive': config['SERVER_KEEPALIVE'],
+        'timeout': config['SERVER_TIMEOUT'],
+        'graceful_timeout': config['SERVER_GRACEFUL_TIMEOUT'],
+        'max_requests': config['SERVER_MAX_REQUESTS'],
+        'max_requests_jitter': config['SERVER_MAX_REQUESTS_JITTER'],
+        'limit_request_line': config['SERVER_LIMIT_REQUEST_LINE'],
+        'limit_request_fields': config['SERVER_LIMIT_REQUEST_FIELDS'],
+        'pidfile': config['SERVER_PIDFILE'],
+        'preload_app': True,
+    }
+
+
+def serve(app, options):
+    from gunicorn.app.base import BaseApplication
+
+    from flavority import after_fork
+
+    class Server(BaseApplication):
+
+        def load_config(self):
+            for key, value in options.items():
+                if value is not None: self.cfg.set(key, value)
+            # the application is created once in the master, workers drop what they inherited from it
+            self.cfg.set('post_fork', lambda server, worker: after_fork(app))
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
+parser = ArgumentParser(description = __desc__)
+parser.add_argument('--dev',
+        action = 'store_true',
+        help = 'run the single process development server with the default (DEBUG) profile')
+parser.add_argument('-b', '--bind',
+        action = 'append',
+        default = None,
+        help = 'address to listen on, overrides SERVER_BIND, may be repeated')
+parser.add_argument('-w', '--workers',
+        type = int,
+        default = None,
+        help = 'number of worker processes, overrides SERVER_WORKERS')
+parser.add_argument('-t', '--threads',
+        type = int,
+        default = None,
+        help = 'number of threads per worker, overrides SERVER_THREADS')
+
 
 def main():
-    app.run()
+    args = parser.parse_args()
+    if not args.dev:
+        os.environ.setdefault('FLAVORITY_PROFILE', 'production')
+
+    from flavority import create_app
+    try:
+        app = create_app()
+    except RuntimeError as e:
+        parser.exit(1, '{}: {}\n'.format(parser.prog, e))
+    if args.dev:
+        app.run(threaded=True)
+        return
+
+    options = server_options(app.config)
+    if args.bind: options['bind'] = args.bind
+    if args.workers: options['workers'] = args.workers
+    if args.threads: options['threads'] = args.threads
+    serve(app, options)
 
 if __name__ == "__main__":
     main()
-
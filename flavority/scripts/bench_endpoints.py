@@ -0,0 +1,235 @@
+
+from argparse import ArgumentParser
+from datetime import datetime
+from io import BytesIO
+from itertools import product
+from json import dump, load
+import os.path
+import platform
+from sys import stderr, stdout, exit
+from time import perf_counter
+
+from harness import setup_app, auth_headers, percentile
+
+
+__desc__ = """Measure latency and SQL query counts of API endpoints on a generated dataset."""
+
+SNAPSHOT = 'bench-{scale}-{seed}.db'
+PHOTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'photo.jpg')
+
+PERCENTILES = [50, 90, 99]
+
+
+class Case:
+
+    def __init__(self, name, path, method='get', query_string=None, auth=False, data=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.query_string = query_string or []
+        self.auth = auth
+        self.data = data
+
+    def request(self, client, headers):
+        data = self.data() if callable(self.data) else self.data
+        return getattr(client, self.method)(self.path,
+                                            query_string=self.query_string,
+                                            headers=headers if self.auth else {},
+                                            data=data)
+
+
+def pick_ids(app):
+    """Chooses objects used by requests: the most commented recipe, most used tags and so on."""
+    from sqlalchemy import desc, func
+    from flavority.models import Comment, Photo, Recipe, tag_assignment, favour_recipes
+
+    session = app.db.session
+    recipe_id = session.query(Comment.recipe_id)\
+        .group_by(Comment.recipe_id)\
+        .order_by(desc(func.count(Comment.id)))\
+        .limit(1).scalar()
+    tag_ids = [row[0] for row in session.query(tag_assignment.c.tag)
+                                        .group_by(tag_assignment.c.tag)
+                                        .order_by(desc(func.count(tag_assignment.c.recipe)))
+                                        .limit(2)]
+    user_id = session.query(favour_recipes.c.user)\
+        .group_by(favour_recipes.c.user)\
+        .order_by(desc(func.count(favour_recipes.c.recipe)))\
+        .limit(1).scalar()
+    photo_id = session.query(Photo.id).filter(Photo.recipe_id != None).order_by(Photo.id).limit(1).scalar()
+    author_id = session.query(Recipe.author_id).filter(Recipe.id == recipe_id).scalar()
+    return {
+        'recipe': recipe_id or 1,
+        'tags': tag_ids or [1],
+        'user': user_id or 1,
+        'author': author_id or 1,
+        'photo': photo_id or 1,
+    }
+
+
+def build_cases(ids):
+    cases = []
+
+    sorts = ['id', 'date_added', 'rate']
+    tags = [('none', []), ('one', ids['tags'][:1]), ('two', ids['tags'][:2])]
+    queries = [('none', None), ('word', 'salt')]
+    shorts = [False, True]
+    for sort_by, (tag_name, tag_ids), (query_name, query), short in product(sorts, tags, queries, shorts):
+        args = [('sort_by', sort_by), ('short', str(short).lower())]
+        args.extend(('tag_id', tag_id) for tag_id in tag_ids)
+        if query is not None: args.append(('query', query))
+        cases.append(Case('Recipes.get sort={} tags={} query={} short={}'.format(
+            sort_by, tag_name, query_name, short), '/recipes/', query_string=args))
+
+    cases.extend([
+        Case('RecipesWithId.get', '/recipes/{}'.format(ids['recipe'])),
+        Case('RecipesWithId.get auth', '/recipes/{}'.format(ids['recipe']), auth=True),
+        Case('Comments.get', '/comments/'),
+        Case('Comments.get recipe', '/comments/', query_string=[('recipe_id', ids['recipe'])]),
+        Case('Comments.get about_me', '/comments/', query_string=[('about_me', 'true')], auth=True),
+        Case('TagsResource.get', '/tags/'),
+        Case('UserById.get', '/users/{}'.format(ids['author'])),
+        Case('UserById.get logged', '/users', auth=True),
+        Case('FavoriteRecipes.get', '/favorite/', auth=True),
+        Case('PhotoResource.get', '/photos/{}/'.format(ids['photo'])),
+        Case('PhotoResource.get mini', '/photos/{}/'.format(ids['photo']),
+             query_string=[('mini', 'true')]),
+    ])
+
+    with open(PHOTO, 'rb') as file: photo = file.read()
+    cases.append(Case('PhotoResource.post', '/photos/', method='post', auth=True,
+                      data=lambda: {'file': (BytesIO(photo), 'photo.jpg'), 'recipe_id': ids['recipe']}))
+    return cases
+
+
+def run_case(app, client, case, headers, iterations, warmup):
+    """Measures a case; responses other than 2xx are counted as failures, their timings are still kept."""
+    timings, queries, statuses, failures = [], [], set(), 0
+    for i in range(warmup + iterations):
+        with app.queries.track() as log:
+            start = perf_counter()
+            response = case.request(client, headers)
+            response.get_data()
+            elapsed = perf_counter() - start
+        statuses.add(response.status_code)
+        if i >= warmup:
+            if not 200 <= response.status_code < 300: failures += 1
+            timings.append(elapsed * 1000.0)
+            queries.append(log.count)
+
+    result = {'p{}'.format(p): percentile(timings, p) for p in PERCENTILES}
+    result.update({
+        'mean': sum(timings) / len(timings),
+        'min': min(timings),
+        'max': max(timings),
+        'queries': max(queries),
+        'statuses': sorted(statuses),
+        'failures': failures,
+    })
+    return result
+
+
+def run(args):
+    snapshot = args.snapshot or SNAPSHOT.format(scale=args.scale, seed=args.seed)
+    app, database = setup_app(snapshot, args.scale, args.seed)
+    client = app.test_client()
+
+    ids = pick_ids(app)
+    headers = auth_headers(ids['user'])
+    results = {}
+    for case in build_cases(ids):
+        if args.filter and args.filter not in case.name: continue
+        results[case.name] = run_case(app, client, case, headers, args.iterations, args.warmup)
+        result = results[case.name]
+        stdout.write('{:<60} p50 {:8.2f} ms  p99 {:8.2f} ms  {:4} queries{}\n'.format(
+            case.name, result['p50'], result['p99'], result['queries'],
+            '  {} failed, statuses {}'.format(result['failures'], result['statuses']) if result['failures'] else ''))
+
+    return {
+        'meta': {
+            'scale': args.scale,
+            'seed': args.seed,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'python': platform.python_version(),
+            'date': datetime.now().isoformat(),
+        },
+        'cases': results,
+    }
+
+
+def compare(base, current, threshold, out=stdout):
+    """
+    Prints differences between two result files and returns names of regressed cases. A case regresses
+    when its median latency grew by more than `threshold` (a fraction), when it issues more queries or
+    when it has failed requests.
+    """
+    regressions = []
+    for name in sorted(set(base['cases']) & set(current['cases'])):
+        old, new = base['cases'][name], current['cases'][name]
+        ratio = new['p50'] / old['p50'] if old['p50'] else float('inf')
+        regressed = ratio > 1.0 + threshold or new['queries'] > old['queries'] or new.get('failures', 0) > 0
+        if regressed: regressions.append(name)
+        out.write('{} {:<60} p50 {:8.2f} -> {:8.2f} ms ({:+6.1f}%)  queries {:4} -> {:4}\n'.format(
+            '!' if regressed else ' ', name, old['p50'], new['p50'], (ratio - 1.0) * 100.0,
+            old['queries'], new['queries']))
+    for name in sorted(set(base['cases']) ^ set(current['cases'])):
+        out.write('  {:<60} only in {}\n'.format(name, 'base' if name in base['cases'] else 'current'))
+    return regressions
+
+
+parser = ArgumentParser(description = __desc__)
+parser.add_argument('-s', '--scale',
+        default = 'small',
+        help = 'scale of the generated dataset (see generate_dataset.py)')
+parser.add_argument('--seed',
+        type = int,
+        default = 0,
+        help = 'seed of the generated dataset')
+parser.add_argument('--snapshot',
+        default = None,
+        help = 'SQLite snapshot to use, generated if missing')
+parser.add_argument('-n', '--iterations',
+        type = int,
+        default = 50,
+        help = 'measured requests per case')
+parser.add_argument('-w', '--warmup',
+        type = int,
+        default = 5,
+        help = 'requests per case made before measuring')
+parser.add_argument('-k', '--filter',
+        default = None,
+        help = 'run only cases with this substring in their names')
+parser.add_argument('-o', '--output',
+        default = None,
+        help = 'save results to this JSON file')
+parser.add_argument('--compare',
+        nargs = 2,
+        metavar = ('BASE', 'CURRENT'),
+        default = None,
+        help = 'compare two result files instead of running benchmarks')
+parser.add_argument('--threshold',
+        type = float,
+        default = 0.1,
+        help = 'relative growth of median latency reported as a regression')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as file: base = load(file)
+        with open(args.compare[1]) as file: current = load(file)
+        regressions = compare(base, current, args.threshold)
+        if regressions:
+            stderr.write('{} regression(s) found\n'.format(len(regressions)))
+            exit(1)
+        exit(0)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as file: dump(results, file, indent=4, sort_keys=True)
+    failed = [name for name, result in results['cases'].items() if result['failures']]
+    if failed:
+        stderr.write('{} case(s) with failed requests: {}\n'.format(len(failed), ', '.join(sorted(failed))))
+        exit(1)
+    exit(0)
@@ -0,0 +1,100 @@
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from json import dumps
+from sys import stdout, exit
+from time import perf_counter
+import traceback
+
+from flavority import db
+from flavority.models import Comment, Recipe, Tag, to_json_dict
+from flavority.serializers import encode
+
+
+__desc__ = """Compare the compiled serializers with the reflective to_json_dict they replaced on dumps of
+generated rows, and the fast JSON encoder with flask_restful's json.dumps."""
+
+
+def reflective_to_json_dict(inst, cls, extra_content={}):
+    """to_json_dict as it was before serializers were compiled."""
+    convert = dict()
+    convert[db.Date] = lambda dt: dt.isoformat()
+    convert[db.DateTime] = lambda dt: dt.isoformat()
+    d = dict()
+    for c in cls.__table__.columns:
+        v = getattr(inst, c.name)
+        if type(c.type) in convert.keys() and v is not None:
+            try:
+                d[c.name] = convert[type(c.type)](v)
+            except:
+                traceback.print_exc()
+                d[c.name] = "Error:  Failed to covert using ", str(convert[type(c.type)])
+        elif v is None:
+            d[c.name] = str()
+        else:
+            d[c.name] = v
+    d.update(extra_content)
+    return d
+
+
+def make_rows(n):
+    start = datetime(2014, 1, 1)
+    recipes, comments, tags = [], [], []
+    for i in range(n):
+        recipe = Recipe('Dish {}'.format(i), 30 + i % 90, 'Mix and bake. ' * 20, 1 + i % 6,
+                        0.5 + i % 10 / 2.0, 1 + i % 100, start + timedelta(minutes=i))
+        recipe.id = i + 1
+        recipes.append(recipe)
+        comment = Comment('Very tasty' if i % 3 else None, 4.5, 2.0, 1 + i % 100, 1 + i, start + timedelta(minutes=i))
+        comment.id = i + 1
+        comments.append(comment)
+        tag = Tag('Tag{}'.format(i))
+        tag.id = i + 1
+        tags.append(tag)
+    return [('Recipe', Recipe, recipes), ('Comment', Comment, comments), ('Tag', Tag, tags)]
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        result = fn()
+        times.append(perf_counter() - start)
+    return min(times), result
+
+
+def run(rows, repeat, out=stdout):
+    extra = {'author_name': 'user@flavority.test'}
+    ok = True
+    out.write('{:<10} {:>8} {:>14} {:>14} {:>8}\n'.format('model', 'rows', 'reflective ms', 'compiled ms', 'speedup'))
+    dumps_all = []
+    for name, cls, instances in rows:
+        old_time, old = best_of(lambda: [reflective_to_json_dict(i, cls, extra) for i in instances], repeat)
+        new_time, new = best_of(lambda: [to_json_dict(i, cls, extra) for i in instances], repeat)
+        if old != new:
+            out.write('{}: compiled serializer output differs from to_json_dict\n'.format(name))
+            ok = False
+        out.write('{:<10} {:>8} {:>14.2f} {:>14.2f} {:>7.1f}x\n'.format(
+            name, len(instances), old_time * 1000, new_time * 1000, old_time / new_time))
+        dumps_all.append(new)
+
+    old_time, old = best_of(lambda: [dumps(d) for d in dumps_all], repeat)
+    new_time, new = best_of(lambda: [encode(d) for d in dumps_all], repeat)
+    out.write('{:<10} {:>8} {:>14.2f} {:>14.2f} {:>7.1f}x\n'.format(
+        'encoding', sum(len(d) for d in dumps_all), old_time * 1000, new_time * 1000, old_time / new_time))
+    return ok
+
+
+parser = ArgumentParser(description = __desc__)
+parser.add_argument('-n', '--rows',
+        type = int,
+        default = 10000,
+        help = 'rows of every model')
+parser.add_argument('-r', '--repeat',
+        type = int,
+        default = 5,
+        help = 'measurements, the best one is reported')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    exit(0 if run(make_rows(args.rows), args.repeat) else 1)
@@ -0,0 +1,155 @@
+
+from argparse import ArgumentParser
+import json
+import os.path
+import subprocess
+import sys
+import threading
+from time import perf_counter, sleep
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from harness import setup_app, percentile
+
+
+__desc__ = """Measure throughput of concurrent readers and writers on a SQLite snapshot with the default
+and the production database configuration."""
+
+SNAPSHOT = 'bench-{scale}-{seed}.db'
+PROFILES = ['default', 'production']
+
+READ = text('SELECT id, dish_name, taste_comments FROM Recipe WHERE id = :id')
+READ_COMMENTS = text('SELECT id, text, taste FROM Comment WHERE recipe_id = :id ORDER BY id DESC LIMIT 20')
+WRITE = text('INSERT INTO Comment (text, taste, difficulty, date, author_id, recipe_id) '
+             'VALUES (:text, 3.0, 3.0, CURRENT_TIMESTAMP, :author, :recipe)')
+UPDATE = text('UPDATE Recipe SET taste_comments = '
+              '(SELECT AVG(taste) FROM Comment WHERE recipe_id = :recipe) WHERE id = :recipe')
+
+
+class Worker(threading.Thread):
+
+    def __init__(self, engine, kind, recipes, authors, stop, seed):
+        super().__init__(daemon=True)
+        self.engine, self.kind, self.stop = engine, kind, stop
+        self.recipes, self.authors, self.n = recipes, authors, seed
+        self.latencies, self.errors, self.locked = [], 0, 0
+
+    def pick(self, values):
+        self.n = (self.n * 1103515245 + 12345) % 2 ** 31
+        return values[self.n % len(values)]
+
+    def operation(self):
+        recipe = self.pick(self.recipes)
+        if self.kind == 'read':
+            with self.engine.connect() as connection:
+                connection.execute(READ, id=recipe).fetchall()
+                connection.execute(READ_COMMENTS, id=recipe).fetchall()
+        else:
+            with self.engine.begin() as connection:
+                connection.execute(WRITE, text='benchmark', author=self.pick(self.authors), recipe=recipe)
+                connection.execute(UPDATE, recipe=recipe)
+
+    def run(self):
+        while not self.stop.is_set():
+            start = perf_counter()
+            try:
+                self.operation()
+            except OperationalError as e:
+                if 'locked' in str(e): self.locked += 1
+                else: self.errors += 1
+                continue
+            self.latencies.append(perf_counter() - start)
+
+
+def measure(profile, snapshot, scale, seed, readers, writers, duration):
+    app, database = setup_app(snapshot, scale, seed, profile=None if profile == 'default' else profile)
+    engine = app.db.engine
+    with engine.connect() as connection:
+        recipes = [row[0] for row in connection.execute(text('SELECT id FROM Recipe'))]
+        authors = [row[0] for row in connection.execute(text('SELECT id FROM User'))]
+        journal = connection.execute(text('PRAGMA journal_mode')).scalar()
+
+    stop = threading.Event()
+    workers = [Worker(engine, 'read', recipes, authors, stop, i) for i in range(readers)] + \
+              [Worker(engine, 'write', recipes, authors, stop, readers + i) for i in range(writers)]
+    for worker in workers: worker.start()
+    sleep(duration)
+    stop.set()
+    for worker in workers: worker.join()
+
+    result = {'profile': profile, 'journal_mode': journal, 'pool': type(engine.pool).__name__}
+    for kind in ('read', 'write'):
+        group = [worker for worker in workers if worker.kind == kind]
+        latencies = [value for worker in group for value in worker.latencies]
+        result[kind] = {
+            'ops': len(latencies) / duration,
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+            'locked': sum(worker.locked for worker in group),
+            'errors': sum(worker.errors for worker in group),
+        }
+    return result
+
+
+def report(results, out=sys.stdout):
+    def ms(value): return '-' if value is None else '{:.2f}'.format(value * 1000)
+
+    out.write('{:<12} {:<8} {:<10} {:>10} {:>9} {:>9} {:>10} {:>9} {:>9} {:>7}\n'.format(
+        'profile', 'journal', 'pool', 'reads/s', 'p50 ms', 'p99 ms', 'writes/s', 'p50 ms', 'p99 ms', 'locked'))
+    for r in results:
+        read, write = r['read'], r['write']
+        out.write('{:<12} {:<8} {:<10} {:>10.1f} {:>9} {:>9} {:>10.1f} {:>9} {:>9} {:>7}\n'.format(
+            r['profile'], r['journal_mode'], r['pool'],
+            read['ops'], ms(read['p50']), ms(read['p99']),
+            write['ops'], ms(write['p50']), ms(write['p99']),
+            read['locked'] + write['locked']))
+
+
+parser = ArgumentParser(description = __desc__)
+parser.add_argument('-s', '--scale',
+        default = 'small',
+        help = 'scale of the generated dataset (see generate_dataset.py)')
+parser.add_argument('--seed',
+        type = int,
+        default = 0,
+        help = 'seed of the generated dataset')
+parser.add_argument('--snapshot',
+        default = None,
+        help = 'SQLite snapshot to use, generated if missing')
+parser.add_argument('-r', '--readers',
+        type = int,
+        default = 8,
+        help = 'number of reading threads')
+parser.add_argument('-w', '--writers',
+        type = int,
+        default = 2,
+        help = 'number of writing threads')
+parser.add_argument('-d', '--duration',
+        type = float,
+        default = 10.0,
+        help = 'seconds each profile is measured')
+parser.add_argument('-p', '--profile',
+        choices = PROFILES,
+        default = None,
+        help = 'measure a single profile and print the result as JSON, all profiles are compared by default')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    snapshot = args.snapshot or SNAPSHOT.format(scale=args.scale, seed=args.seed)
+
+    if args.profile is not None:
+        result = measure(args.profile, snapshot, args.scale, args.seed,
+                         args.readers, args.writers, args.duration)
+        sys.stdout.write('\n{}\n'.format(json.dumps(result)))
+        sys.exit(0)
+
+    # the configuration is read when flavority is imported, so every profile runs in its own process
+    results = []
+    for profile in PROFILES:
+        command = [sys.executable, os.path.abspath(__file__), '--profile', profile, '--snapshot', snapshot,
+                   '--scale', args.scale, '--seed', str(args.seed), '--readers', str(args.readers),
+                   '--writers', str(args.writers), '--duration', str(args.duration)]
+        # the result is the last line, preceded by progress of a snapshot generation
+        results.append(json.loads(subprocess.check_output(command).decode().splitlines()[-1]))
+    report(results)
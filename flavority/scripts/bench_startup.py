@@ -0,0 +1,75 @@
+
+from argparse import ArgumentParser
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+from harness import percentile
+
+
+__desc__ = """Measure cold start of the application: importing the package, creating an application and
+spawning forked workers which answer their first request. Uses the configured database, which must
+already have its schema (see `manage.py db upgrade`)."""
+
+IMPORT = 'import flavority'
+CREATE = 'import flavority; flavority.create_app()'
+
+
+def time_command(code, repeat):
+    """Returns wall times of `repeat` fresh interpreters executing `code`."""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        subprocess.check_call([sys.executable, '-c', code])
+        times.append(perf_counter() - start)
+    return times
+
+
+def time_fork(app, repeat, path):
+    """Returns times from fork until a forked worker answered its first request to `path`."""
+    from flavority import after_fork
+
+    times = []
+    for _ in range(repeat):
+        read, write = os.pipe()
+        start = perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            after_fork(app)
+            status = app.test_client().get(path).status_code
+            os.write(write, b'1' if status < 500 else b'0')
+            os._exit(0)
+        os.close(write)
+        ok = os.read(read, 1) == b'1'
+        times.append(perf_counter() - start)
+        os.close(read)
+        os.waitpid(pid, 0)
+        if not ok: raise RuntimeError('worker failed to answer {}'.format(path))
+    return times
+
+
+def report(name, times, out=sys.stdout):
+    out.write('{:<24} p50 {:8.1f} ms   p90 {:8.1f} ms   min {:8.1f} ms\n'.format(
+        name, percentile(times, 50) * 1000, percentile(times, 90) * 1000, min(times) * 1000))
+
+
+parser = ArgumentParser(description = __desc__)
+parser.add_argument('-n', '--repeat',
+        type = int,
+        default = 10,
+        help = 'measurements of every phase')
+parser.add_argument('--path',
+        default = '/units/',
+        help = 'path requested by forked workers')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    report('import flavority', time_command(IMPORT, args.repeat))
+    report('create_app()', time_command(CREATE, args.repeat))
+
+    from flavority import create_app
+    app = create_app()
+    app.test_client().get(args.path)    # the parent holds open connections, as a preloading master would
+    report('fork to first response', time_fork(app, args.repeat, args.path))
@@ -0,0 +1,57 @@
+
+"""
+Helpers shared by the data generating scripts.
+
+Rows are inserted with SQLAlchemy Core `executemany` statements in chunks, which skips the ORM's unit of
+work entirely. Random choices are made with NumPy over whole arrays of ids instead of one
+`random.sample` call per row.
+"""
+
+from sys import stdout
+
+import numpy as np
+from sqlalchemy import func, select
+
+
+CHUNK_SIZE = 10000
+
+
+def insert_chunked(bind, table, rows, chunk_size=CHUNK_SIZE):
+    """
+    Inserts dictionaries produced by `rows` iterable into `table`, `chunk_size` rows per statement.
+
+    :param bind:    session, connection or engine
+    :return:        number of inserted rows
+    """
+    count, chunk = 0, []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            bind.execute(table.insert(), chunk)
+            count, chunk = count + len(chunk), []
+    if chunk:
+        bind.execute(table.insert(), chunk)
+        count += len(chunk)
+    return count
+
+
+def next_id(bind, column):
+    """
+    Returns the first free value of an integer primary key `column`, so that rows can be inserted
+    with explicit ids and referenced by other rows of the same bulk insert.
+    """
+    current = bind.execute(select([func.max(column)])).scalar()
+    return 1 if current is None else current + 1
+
+
+def fetch_ids(bind, column):
+    """Returns all values of `column` as a NumPy array."""
+    return np.fromiter((row[0] for row in bind.execute(select([column]))), dtype=np.int64)
+
+
+def progress(done, total, out=stdout):
+    out.write('{0:3}%\r'.format(done * 100 // total if total else 100))
+    out.flush()
+
+
+__all__ = ['CHUNK_SIZE', 'insert_chunked', 'next_id', 'fetch_ids', 'progress']
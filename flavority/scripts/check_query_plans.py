@@ -0,0 +1,126 @@
+
+from argparse import ArgumentParser
+import re
+from sys import stderr, stdout, exit
+
+from harness import setup_app, auth_headers
+from bench_endpoints import Case, build_cases, pick_ids
+
+
+__desc__ = """Fail when a request makes SQLite scan a whole table where an index is expected."""
+
+SNAPSHOT = 'bench-{scale}-{seed}.db'
+
+SCAN = re.compile(r'^SCAN (?:TABLE )?(?P<table>\S+)(?: AS \S+)?(?P<rest>.*)$')
+
+# tables which are expected to be read as a whole by requests of a given case (by name prefix),
+# eg. listings without any filter or a substring search
+ALLOWED_SCANS = [
+    ('Recipes.get', {'Recipe'}),
+    ('Comments.get', {'Comment'}),
+    ('IngredientsResource.get', {'Ingredient'}),
+    ('UnitResource.get', {'Unit'}),
+]
+
+# cases in which the comments are filtered and must not be scanned
+STRICT_CASES = {'Comments.get recipe', 'Comments.get about_me'}
+
+
+def allowed_scans(case_name):
+    if case_name in STRICT_CASES: return set()
+    tables = set()
+    for prefix, allowed in ALLOWED_SCANS:
+        if case_name.startswith(prefix): tables |= allowed
+    return tables
+
+
+def query_plan(connection, statement, parameters):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN {}'.format(statement), parameters)
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def full_scans(plan, tables):
+    """
+    Returns names of tables from `tables` which are read as a whole. A scan going through an index, even
+    a covering one, still visits every row; only `SEARCH` steps (index or rowid lookups) are selective.
+    """
+    scans = []
+    for detail in plan:
+        match = SCAN.match(detail)
+        if match is None: continue
+        if match.group('table') in tables: scans.append(match.group('table'))
+    return scans
+
+
+def check_case(app, client, connection, case, headers, verbose=False, out=stdout):
+    """Returns the status of the case's response and statements scanning tables that aren't allowed."""
+    with app.queries.track() as log:
+        response = case.request(client, headers)
+        response.get_data()
+
+    tables, allowed, violations = set(app.db.metadata.tables), allowed_scans(case.name), []
+    for statement, parameters, elapsed in log.statements:
+        if not statement.lstrip().upper().startswith('SELECT'): continue
+        plan = query_plan(connection, statement, parameters)
+        unexpected = [table for table in full_scans(plan, tables) if table not in allowed]
+        if unexpected: violations.append((statement, plan, unexpected))
+        if verbose:
+            out.write('{}\n    {}\n'.format(' '.join(statement.split()), '\n    '.join(plan)))
+    return response.status_code, violations
+
+
+def extra_cases():
+    return [
+        Case('IngredientsResource.get', '/ingredients/'),
+        Case('UnitResource.get', '/units/'),
+    ]
+
+
+parser = ArgumentParser(description = __desc__)
+parser.add_argument('-s', '--scale',
+        default = 'tiny',
+        help = 'scale of the generated dataset (see generate_dataset.py)')
+parser.add_argument('--seed',
+        type = int,
+        default = 0,
+        help = 'seed of the generated dataset')
+parser.add_argument('--snapshot',
+        default = None,
+        help = 'SQLite snapshot to use, generated if missing')
+parser.add_argument('-v', '--verbose',
+        action = 'store_true',
+        help = 'print plans of all statements')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    app, database = setup_app(args.snapshot or SNAPSHOT.format(scale=args.scale, seed=args.seed),
+                              args.scale, args.seed)
+    client = app.test_client()
+    ids = pick_ids(app)
+    headers = auth_headers(ids['user'])
+
+    connection, failed = app.db.engine.raw_connection(), 0
+    try:
+        for case in build_cases(ids) + extra_cases():
+            status, violations = check_case(app, client, connection, case, headers, args.verbose)
+            # a failed request may have skipped the statements it should be checked for
+            succeeded = 200 <= status < 300
+            if succeeded and not violations:
+                stdout.write('ok      {}\n'.format(case.name))
+                continue
+            failed += 1
+            stdout.write('FAILED  {}{}\n'.format(case.name, '' if succeeded else ' (status {})'.format(status)))
+            for statement, plan, tables in violations:
+                stdout.write('    full scan of {}:\n    {}\n        {}\n'.format(
+                    ', '.join(tables), ' '.join(statement.split()), '\n        '.join(plan)))
+    finally:
+        connection.close()
+
+    if failed:
+        stderr.write('{} case(s) failed or scan tables where an index is expected\n'.format(failed))
+        exit(1)
+    exit(0)
@@ -1,50 +1,78 @@
 
 from argparse import ArgumentParser
-from json import loads
+from datetime import datetime
 from sys import exit
-import random
 
-import flavority
+import numpy as np
+
+from flavority import create_app, db
 from flavority.models import Recipe, Comment, User
 
+from bulk import CHUNK_SIZE, insert_chunked, fetch_ids
+
 
 __author__	= "Joanna Cisło"
 __desc__	= """Create comments."""
 
 
-def add_comments_to_database(db, n):
-    
-    users = User.query.all()
-    recipes = Recipe.query.all()
-    comments = ['Very ' + 'very ' * 22 + 'tasty', 'Not tasty', 'Good']
-    rates = [0, 0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5]
-    
-    for i in range(n):
-        user = random.sample(users, 1)[0]
-        recipe = random.sample(recipes, 1)[0]
-        text = random.sample(comments, 1)[0]
-        taste = random.sample(rates, 1)[0]
-        difficulty = random.sample(rates, 1)[0]
-        comment = Comment(text, taste, difficulty, user.id, recipe.id)
-        db.session.add(comment)
+COMMENTS = ['Very ' + 'very ' * 22 + 'tasty', 'Not tasty', 'Good']
+RATES = [0, 0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5]
+
+
+def generate_comments(rng, user_ids, recipe_ids, n, chunk_size=CHUNK_SIZE):
+    """
+    Yields rows of `n` random comments. Authors, recipes, texts and marks are drawn for the whole
+    chunk at once.
+    """
+    now = datetime.now()
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        authors = rng.choice(user_ids, size).tolist()
+        recipes = rng.choice(recipe_ids, size).tolist()
+        texts = rng.randint(0, len(COMMENTS), size).tolist()
+        tastes = rng.randint(0, len(RATES), size).tolist()
+        difficulties = rng.randint(0, len(RATES), size).tolist()
+        for author, recipe, text, taste, difficulty in zip(authors, recipes, texts, tastes, difficulties):
+            yield {
+                'text': COMMENTS[text],
+                'taste': RATES[taste],
+                'difficulty': RATES[difficulty],
+                'date': now,
+                'author_id': author,
+                'recipe_id': recipe,
+            }
+
+
+def add_comments_to_database(db, n, seed=None):
+    rng = np.random.RandomState(seed)
+    user_ids = fetch_ids(db.session, User.id)
+    recipe_ids = fetch_ids(db.session, Recipe.id)
+    if len(user_ids) == 0 or len(recipe_ids) == 0:
+        return 0
+
+    count = insert_chunked(db.session, Comment.__table__, generate_comments(rng, user_ids, recipe_ids, n))
+    Recipe.recount_rates(db.session)
     db.session.commit()
+    return count
 
-    for recipe in recipes:
-        recipe.count_taste()        
-        recipe.count_difficulty()
-    db.session.commit()   
-        
 parser = ArgumentParser(description = __desc__)
 parser.add_argument("-n", "--number",
         type = int,
         dest = "amount",
         help = "amount of new comments"
     )
+parser.add_argument("-s", "--seed",
+        type = int,
+        dest = "seed",
+        default = None,
+        help = "seed of the random number generator"
+    )
 
 if __name__ == "__main__":
     args = parser.parse_args()
-    
+
     if args.amount:
-        flavority.app.db.create_all()
-        add_comments_to_database(flavority.app.db, args.amount)
+        with create_app().app_context():
+            db.create_all()
+            add_comments_to_database(db, args.amount, args.seed)
     exit(0)
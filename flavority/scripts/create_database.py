@@ -3,7 +3,7 @@ from argparse import ArgumentParser
 from json import loads
 
 import random
-import flavority
+from flavority import create_app, db
 from flavority.models import Recipe, Unit, Ingredient, IngredientAssociation, User, IngredientUnit
 
 
@@ -101,8 +101,9 @@ if __name__ == "__main__":
 
     text = text.replace(']\n[' , ',\n')
     recipes = loads(text)[args.offset:(args.offset + args.amount)]
-    flavority.app.db.create_all()
-    add_recipes_to_database(flavority.app.db, recipes)
+    with create_app().app_context():
+        db.create_all()
+        add_recipes_to_database(db, recipes)
 
     exit(0)
 
@@ -1,12 +1,14 @@
 
 from argparse import ArgumentParser
-from random import randint, sample
 from sys import stderr, stdout, exit
 
+import numpy as np
 from sqlalchemy.exc import SQLAlchemyError
 
-from flavority import app
-from flavority.models import Recipe, Tag
+from flavority import create_app, db
+from flavority.models import Recipe, Tag, tag_assignment
+
+from bulk import insert_chunked, next_id, fetch_ids, progress
 
 
 def parse_args():
@@ -19,29 +21,45 @@ def parse_args():
     parser = ArgumentParser()
     parser.add_argument('amount', type=cast_natural,
                         help='number of tags to be generated and added')
+    parser.add_argument('-s', '--seed', type=int, default=None,
+                        help='seed of the random number generator')
     return parser.parse_args()
 
 
-def generate_tags(amount, group_min=0, group_max=None, tag_name_base='Tag'):
-    recipes = Recipe.query.all()
-    if group_max is None: group_max = len(recipes) - 1
+def generate_assignments(rng, tag_ids, recipe_ids, group_min, group_max):
+    """
+    Yields `tag_assignment` rows tagging a random group of recipes with every tag from `tag_ids`.
+    Each group is drawn without replacement, so a recipe is never tagged twice with the same tag.
+    """
+    sizes = rng.randint(group_min, group_max + 1, len(tag_ids)).tolist()
+    for i, (tag_id, size) in enumerate(zip(tag_ids, sizes)):
+        for recipe_id in rng.choice(recipe_ids, size, replace=False).tolist():
+            yield {'recipe': recipe_id, 'tag': tag_id}
+        progress(i + 1, len(tag_ids))
 
-    stdout.write('Generating tags... \n')
-    for i in range(amount):
-        tag = Tag('{}{}'.format(tag_name_base, i + 1))
-        group_size = randint(group_min, group_max)
-        for recipe in sample(recipes, group_size):
-            recipe.tags.append(tag)
-            app.db.session.add(tag)
-        percent = (i + 1) * 100 // amount
-        stdout.write('{0:3}%\r'.format(percent))
-    stdout.write('Done.\n')
 
-    stdout.write('Committing changes...\n')
+def generate_tags(amount, group_min=0, group_max=None, tag_name_base='Tag', seed=None):
+    rng = np.random.RandomState(seed)
+    session = db.session
+    recipe_ids = fetch_ids(session, Recipe.id)
+    if group_max is None: group_max = len(recipe_ids) - 1
+    group_max = max(group_min, min(group_max, len(recipe_ids)))
+
+    stdout.write('Generating tags... \n')
+    first_id = next_id(session, Tag.id)
+    tag_ids = list(range(first_id, first_id + amount))
     try:
-        app.db.session.commit()
+        insert_chunked(session, Tag.__table__,
+                       ({'id': i, 'name': '{}{}'.format(tag_name_base, i)} for i in tag_ids))
+        insert_chunked(session, tag_assignment,
+                       generate_assignments(rng, tag_ids, recipe_ids, group_min, group_max))
+        stdout.write('Done.\n')
+
+        stdout.write('Committing changes...\n')
+        session.commit()
     except SQLAlchemyError as e:
-        stderr.write(e)
+        session.rollback()
+        stderr.write('{}\n'.format(e))
         return False
     stdout.write('Done.\n')
 
@@ -50,4 +68,6 @@ def generate_tags(amount, group_min=0, group_max=None, tag_name_base='Tag'):
 
 if __name__ == '__main__':
     args = parse_args()
-    exit(0) if generate_tags(args.amount) else exit(1)
+    with create_app().app_context():
+        done = generate_tags(args.amount, seed=args.seed)
+    exit(0 if done else 1)
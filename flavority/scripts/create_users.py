@@ -1,13 +1,16 @@
 
 from argparse import ArgumentParser
-from json import loads
+from binascii import hexlify
+from datetime import datetime
 from sys import exit
-from base64 import b64encode, b64decode
+from base64 import b64encode
 
-import flavority
-from flavority.models import User, Recipe, Photo
+from flavority import create_app, db
+from flavority.models import User, Photo
 from flavority.photos import PhotoResource
 
+from bulk import insert_chunked, next_id
+
 
 __author__  = "Joanna Cisło"
 __desc__    = """Create users."""
@@ -15,31 +18,47 @@ __desc__    = """Create users."""
 KEY_FULL_SIZE = 'full-size'
 KEY_MINI_SIZE = 'mini-size'
 
+PASSWORD = '123'
+
 
 def add_users_to_database(db, n):
+    """
+    Inserts `n` users, each one with an avatar.
+
+    The avatar is encoded once and the same blobs are bound to every photo row. All generated users share
+    a single salt and password hash, as they share the password anyway.
+    """
 
-    
     photo_bytes = None
     with open("photo.jpg", "rb") as file: photo_bytes = file.read()
-    
+
     files = PhotoResource.encode_image(photo_bytes)
     full_data = b64encode(files[KEY_FULL_SIZE])
     mini_data = b64encode(files[KEY_MINI_SIZE])
-    
-    users = User.query.all()
-    start = len(users)
-    for i in range(start,start+n):
-        user = User('user{}@gmail.com'.format(i), '123')
-        db.session.add(user)
-        
-        photo = Photo()
-        photo.full_data = full_data
-        photo.mini_data = mini_data
-        photo.avatar_user_id = i
-        db.session.add(photo)
-        
+
+    salt = hexlify(User.gen_salt())
+    password = User.hash_pwd(User.combine(salt, PASSWORD.encode()))
+    now = datetime.now()
+
+    start = next_id(db.session, User.id)
+    ids = range(start, start + n)
+    insert_chunked(db.session, User.__table__, ({
+        'id': i,
+        'email': 'user{}@gmail.com'.format(i),
+        'salt': salt,
+        'password': password,
+        'type': User.USER_TYPES[User.USER_TYPE_COMMON],
+        'register_date': now,
+        'last_seen_date': now,
+    } for i in ids))
+    insert_chunked(db.session, Photo.__table__, ({
+        'full_data': full_data,
+        'mini_data': mini_data,
+        'avatar_user_id': i,
+    } for i in ids))
+
     db.session.commit()
-    
+
 
 parser = ArgumentParser(description = __desc__)
 parser.add_argument("-n", "--number",
@@ -51,6 +70,7 @@ parser.add_argument("-n", "--number",
 if __name__ == "__main__":
     args = parser.parse_args()
     if args.amount:
-        flavority.app.db.create_all()
-        add_users_to_database(flavority.app.db, args.amount)
+        with create_app().app_context():
+            db.create_all()
+            add_users_to_database(db, args.amount)
     exit(0)
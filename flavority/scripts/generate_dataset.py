@@ -0,0 +1,364 @@
+
+from argparse import ArgumentParser
+from base64 import b64encode
+from binascii import hexlify
+from collections import namedtuple
+from datetime import datetime, timedelta
+from json import dump
+import os.path
+from sys import stderr, stdout, exit
+
+import numpy as np
+from sqlalchemy import create_engine, event, func, select
+
+from flavority import create_app, db
+from flavority.models import (User, Recipe, Comment, Tag, Unit, Ingredient, IngredientUnit,
+                              IngredientAssociation, Photo, tag_assignment, favour_recipes)
+
+from bulk import CHUNK_SIZE, insert_chunked
+
+
+__desc__ = """Generate a deterministic synthetic dataset for load and performance testing."""
+
+
+Scale = namedtuple('Scale', [
+    'users', 'recipes', 'comments', 'tags', 'ingredients', 'favorites', 'photos', 'avatars',
+])
+
+SCALES = {
+    'tiny':     Scale(users=20, recipes=200, comments=1000, tags=20, ingredients=50,
+                      favorites=200, photos=50, avatars=10),
+    'small':    Scale(users=1000, recipes=10000, comments=50000, tags=200, ingredients=500,
+                      favorites=10000, photos=2000, avatars=500),
+    'medium':   Scale(users=10000, recipes=100000, comments=1000000, tags=1000, ingredients=2000,
+                      favorites=100000, photos=20000, avatars=5000),
+    'large':    Scale(users=100000, recipes=1000000, comments=10000000, tags=5000, ingredients=5000,
+                      favorites=1000000, photos=200000, avatars=50000),
+}
+
+# every generated user can sign in with this password
+PASSWORD = '123'
+EMAIL_FORMAT = 'user{}@flavority.test'
+
+# all dates are offsets from this point so that datasets do not depend on the wall clock
+EPOCH = datetime(2014, 1, 1)
+SPAN_SECONDS = 2 * 365 * 24 * 3600
+
+# exponent of zipf distributions used for popularity of tags and recipes
+ZIPF_EXPONENT = 1.1
+
+RATES = [0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0]
+UNITS = ['', 'cup', 'cups', 'teaspoon', 'teaspoons', 'tablespoon', 'tablespoons', 'pound', 'ounce',
+         'g', 'kg', 'ml', 'l', 'pinch', 'clove', 'slice']
+WORDS = ['salt', 'pepper', 'sugar', 'butter', 'garlic', 'onion', 'tomato', 'chicken', 'beef', 'pork',
+         'rice', 'pasta', 'cheese', 'milk', 'cream', 'egg', 'flour', 'oil', 'lemon', 'basil', 'honey',
+         'potato', 'carrot', 'apple', 'bean', 'soup', 'salad', 'cake', 'pie', 'bread', 'grilled',
+         'baked', 'fried', 'spicy', 'sweet', 'roasted', 'creamy', 'quick', 'easy', 'classic']
+COMMENTS = ['Very ' + 'very ' * 22 + 'tasty', 'Not tasty', 'Good']
+
+# every table written by `generate`, all of them must be empty
+GENERATED_TABLES = [User.__table__, Unit.__table__, Ingredient.__table__, IngredientUnit.__table__,
+                    Recipe.__table__, IngredientAssociation.__table__, Tag.__table__, tag_assignment,
+                    Comment.__table__, favour_recipes, Photo.__table__]
+
+PHOTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'photo.jpg')
+
+
+class ZipfSampler:
+
+    """
+    Draws indices from `0..n-1` with zipf-distributed popularity. Ranks are shuffled, so popular items
+    are spread over the whole id range instead of being the smallest ids. With `n` 0 nothing is drawn.
+    """
+
+    def __init__(self, rng, n, exponent=ZIPF_EXPONENT):
+        weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+        self.cdf = np.cumsum(weights)
+        if n: self.cdf /= self.cdf[-1]
+        self.order = rng.permutation(n)
+        self.rng = rng
+
+    def sample(self, size):
+        if not len(self.order): return np.zeros(0, dtype=np.int64)
+        ranks = np.searchsorted(self.cdf, self.rng.random_sample(size), side='right')
+        return self.order[np.minimum(ranks, len(self.order) - 1)]
+
+
+def sentences(rng, n, length):
+    """Yields `n` strings of `length` random words."""
+    for i in range(n):
+        yield ' '.join(WORDS[w] for w in rng.randint(0, len(WORDS), length).tolist())
+
+
+def dates(rng, size):
+    return [EPOCH + timedelta(seconds=s) for s in rng.randint(0, SPAN_SECONDS, size).tolist()]
+
+
+def unique_pairs(first, second, stride):
+    """Removes duplicated `(first, second)` pairs; values of `second` must be lower than `stride`."""
+    keys = np.unique(first.astype(np.int64) * stride + second)
+    return keys // stride, keys % stride
+
+
+def encode_photo(path=PHOTO):
+    from flavority.photos import PhotoResource
+
+    with open(path, 'rb') as file: files = PhotoResource.encode_image(file.read())
+    return b64encode(files[PhotoResource.KEY_FULL_SIZE]), b64encode(files[PhotoResource.KEY_MINI_SIZE])
+
+
+def generate_users(bind, rng, scale):
+    salt = hexlify(rng.bytes(User.HASH_SIZE))
+    password = User.hash_pwd(User.combine(salt, PASSWORD.encode()))
+
+    def rows():
+        for start in range(1, scale.users + 1, CHUNK_SIZE):
+            ids = range(start, min(start + CHUNK_SIZE, scale.users + 1))
+            for i, date in zip(ids, dates(rng, len(ids))):
+                yield {
+                    'id': i,
+                    'email': EMAIL_FORMAT.format(i),
+                    'salt': salt,
+                    'password': password,
+                    'type': User.USER_TYPES[User.USER_TYPE_COMMON],
+                    'register_date': date,
+                    'last_seen_date': date,
+                }
+    return insert_chunked(bind, User.__table__, rows())
+
+
+def generate_ingredients(bind, rng, scale):
+    """Inserts units, ingredients and 1-3 units per ingredient. Returns number of ingredient-unit pairs."""
+    insert_chunked(bind, Unit.__table__,
+                   ({'id': i + 1, 'unit_name': name} for i, name in enumerate(UNITS)))
+    insert_chunked(bind, Ingredient.__table__,
+                   ({'id': i + 1, 'name': '{} {}'.format(name, i + 1)}
+                    for i, name in enumerate(sentences(rng, scale.ingredients, 2))))
+
+    counts = rng.randint(1, 4, scale.ingredients)
+    ingredients = np.repeat(np.arange(1, scale.ingredients + 1), counts)
+    units = rng.randint(1, len(UNITS) + 1, len(ingredients))
+    ingredients, units = unique_pairs(ingredients, units, len(UNITS) + 1)
+    return insert_chunked(bind, IngredientUnit.__table__, (
+        {'id': i + 1, 'ingredient_id': ingr, 'unit_id': unit}
+        for i, (ingr, unit) in enumerate(zip(ingredients.tolist(), units.tolist()))))
+
+
+def generate_recipes(bind, rng, scale, ingredient_units):
+    def recipes():
+        for start in range(1, scale.recipes + 1, CHUNK_SIZE):
+            ids = range(start, min(start + CHUNK_SIZE, scale.recipes + 1))
+            size = len(ids)
+            authors = rng.randint(1, scale.users + 1, size).tolist()
+            times = rng.randint(5, 240, size).tolist()
+            portions = rng.randint(1, 9, size).tolist()
+            difficulties = rng.randint(0, len(RATES), size).tolist()
+            names = sentences(rng, size, 3)
+            texts = sentences(rng, size, 60)
+            for row in zip(ids, names, authors, dates(rng, size), times, texts, difficulties, portions):
+                yield {
+                    'id': row[0],
+                    'dish_name': row[1],
+                    'author_id': row[2],
+                    'creation_date': row[3],
+                    'preparation_time': row[4],
+                    'recipe_text': row[5],
+                    'difficulty': RATES[row[6]],
+                    'portions': row[7],
+                    'taste_comments': 0,
+                    'difficulty_comments': 0,
+                }
+
+    def ingredients():
+        for start in range(1, scale.recipes + 1, CHUNK_SIZE):
+            ids = np.arange(start, min(start + CHUNK_SIZE, scale.recipes + 1))
+            recipe_ids = np.repeat(ids, rng.randint(2, 12, len(ids)))
+            units = rng.randint(1, ingredient_units + 1, len(recipe_ids)).tolist()
+            amounts = rng.randint(1, 10, len(recipe_ids)).tolist()
+            for recipe_id, unit, amount in zip(recipe_ids.tolist(), units, amounts):
+                yield {'recipe_id': recipe_id, 'ingredient_unit_id': unit, 'amount': amount}
+
+    count = insert_chunked(bind, Recipe.__table__, recipes())
+    insert_chunked(bind, IngredientAssociation.__table__, ingredients())
+    return count
+
+
+def generate_tags(bind, rng, scale):
+    insert_chunked(bind, Tag.__table__,
+                   ({'id': i + 1, 'name': 'tag{}'.format(i + 1)} for i in range(scale.tags)))
+
+    if not scale.tags or not scale.recipes: return 0
+    popularity = ZipfSampler(rng, scale.tags)
+    recipes = np.repeat(np.arange(1, scale.recipes + 1), rng.poisson(3, scale.recipes))
+    recipes, tags = unique_pairs(recipes, popularity.sample(len(recipes)) + 1, scale.tags + 1)
+    return insert_chunked(bind, tag_assignment, (
+        {'recipe': recipe, 'tag': tag} for recipe, tag in zip(recipes.tolist(), tags.tolist())))
+
+
+def generate_comments(bind, rng, scale):
+    if not scale.recipes or not scale.users: return 0
+    popularity = ZipfSampler(rng, scale.recipes)
+
+    def rows():
+        for start in range(0, scale.comments, CHUNK_SIZE):
+            size = min(CHUNK_SIZE, scale.comments - start)
+            recipes = (popularity.sample(size) + 1).tolist()
+            authors = rng.randint(1, scale.users + 1, size).tolist()
+            texts = rng.randint(0, len(COMMENTS), size).tolist()
+            tastes = rng.randint(0, len(RATES), size).tolist()
+            difficulties = rng.randint(0, len(RATES), size).tolist()
+            for row in zip(recipes, authors, texts, tastes, difficulties, dates(rng, size)):
+                yield {
+                    'recipe_id': row[0],
+                    'author_id': row[1],
+                    'text': COMMENTS[row[2]],
+                    'taste': RATES[row[3]],
+                    'difficulty': RATES[row[4]],
+                    'date': row[5],
+                }
+    count = insert_chunked(bind, Comment.__table__, rows())
+    Recipe.recount_rates(bind)
+    return count
+
+
+def generate_favorites(bind, rng, scale):
+    if not scale.recipes or not scale.users: return 0
+    popularity = ZipfSampler(rng, scale.recipes)
+    users = rng.randint(1, scale.users + 1, scale.favorites)
+    users, recipes = unique_pairs(users, popularity.sample(scale.favorites) + 1, scale.recipes + 1)
+    return insert_chunked(bind, favour_recipes, (
+        {'user': user, 'recipe': recipe} for user, recipe in zip(users.tolist(), recipes.tolist())))
+
+
+def generate_photos(bind, rng, scale, blobs):
+    full_data, mini_data = blobs
+    recipes = rng.randint(1, scale.recipes + 1, scale.photos).tolist() if scale.recipes else []
+    avatars = rng.choice(np.arange(1, scale.users + 1), min(scale.avatars, scale.users), replace=False)
+    count = insert_chunked(bind, Photo.__table__, (
+        {'recipe_id': recipe, 'full_data': full_data, 'mini_data': mini_data} for recipe in recipes))
+    count += insert_chunked(bind, Photo.__table__, (
+        {'avatar_user_id': user, 'full_data': full_data, 'mini_data': mini_data}
+        for user in sorted(avatars.tolist())))
+    return count
+
+
+def generate(bind, scale, seed=0, photo=PHOTO, out=stdout):
+    """
+    Fills an empty database with a dataset of a given `scale`. Generating twice with the same `scale`,
+    `seed` and `photo` yields identical rows.
+
+    :param bind:    connection or engine to write to
+    :return:        dictionary with number of rows inserted per table
+    """
+    for table in GENERATED_TABLES:
+        if bind.execute(select([func.count()]).select_from(table)).scalar():
+            raise RuntimeError('refusing to generate a dataset into a non-empty database, {} has rows'
+                               .format(table.name))
+
+    if scale.recipes and not (scale.users and scale.ingredients):
+        raise ValueError('recipes need users and ingredients')
+
+    rng = np.random.RandomState(seed)
+    blobs = encode_photo(photo) if scale.photos or scale.avatars else (b'', b'')
+
+    counts = {}
+    steps = [
+        ('users', lambda: generate_users(bind, rng, scale)),
+        ('ingredient_units', lambda: generate_ingredients(bind, rng, scale)),
+        ('recipes', lambda: generate_recipes(bind, rng, scale, counts['ingredient_units'])),
+        ('tag_assignments', lambda: generate_tags(bind, rng, scale)),
+        ('comments', lambda: generate_comments(bind, rng, scale)),
+        ('favorites', lambda: generate_favorites(bind, rng, scale)),
+        ('photos', lambda: generate_photos(bind, rng, scale, blobs)),
+    ]
+    for name, step in steps:
+        out.write('Generating {}...\n'.format(name))
+        counts[name] = step()
+    return counts
+
+
+def create_snapshot_engine(path):
+    """
+    Returns an engine writing to a new SQLite file at `path`. Durability is turned off as the file is
+    either completely generated or discarded.
+    """
+    engine = create_engine('sqlite:///{}'.format(os.path.abspath(path)))
+
+    @event.listens_for(engine, 'connect')
+    def fast_pragmas(connection, record):
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA journal_mode=OFF')
+        cursor.execute('PRAGMA synchronous=OFF')
+        cursor.close()
+
+    return engine
+
+
+def generate_snapshot(path, scale, seed=0, photo=PHOTO, out=stdout):
+    """
+    Writes a dataset into a new SQLite file at `path` together with a `<path>.json` manifest describing
+    how it was generated.
+    """
+    engine = create_snapshot_engine(path)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        counts = generate(connection, scale, seed, photo, out)
+    with engine.connect() as connection:
+        connection.execute('ANALYZE')
+    engine.dispose()
+
+    with open('{}.json'.format(path), 'w') as file:
+        dump({'seed': seed, 'scale': scale._asdict(), 'counts': counts}, file, indent=4, sort_keys=True)
+    return counts
+
+
+parser = ArgumentParser(description = __desc__)
+parser.add_argument('-s', '--scale',
+        choices = sorted(SCALES),
+        default = 'small',
+        help = 'predefined size of the dataset')
+parser.add_argument('--seed',
+        type = int,
+        default = 0,
+        help = 'seed of the random number generator')
+parser.add_argument('-o', '--output',
+        type = str,
+        dest = 'output',
+        default = None,
+        help = 'write a SQLite snapshot to this file instead of the configured database')
+parser.add_argument('-f', '--force',
+        action = 'store_true',
+        help = 'overwrite an existing snapshot file')
+parser.add_argument('--photo',
+        type = str,
+        default = PHOTO,
+        help = 'image used for every recipe photo and avatar')
+for field in Scale._fields:
+    parser.add_argument('--{}'.format(field),
+            type = int,
+            default = None,
+            help = 'override number of {} of the chosen scale'.format(field))
+
+
+def scale_from_args(args):
+    return SCALES[args.scale]._replace(**{
+        field: getattr(args, field) for field in Scale._fields if getattr(args, field) is not None})
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    scale = scale_from_args(args)
+
+    if args.output is None:
+        app = create_app()
+        with app.app_context(), db.engine.begin() as connection:
+            generate(connection, scale, args.seed, args.photo)
+        exit(0)
+
+    if os.path.exists(args.output):
+        if not args.force:
+            stderr.write('{} already exists, use --force to overwrite it\n'.format(args.output))
+            exit(1)
+        os.remove(args.output)
+    generate_snapshot(args.output, scale, args.seed, args.photo)
+    exit(0)
@@ -0,0 +1,73 @@
+
+"""
+Sets up the application against a working copy of a generated SQLite snapshot.
+
+The application reads its configuration from `FLAVORITY_SETTINGS` when it's created, so :func:`setup_app`
+points it to settings of a working directory first.
+"""
+
+from binascii import hexlify
+import os
+import os.path
+import shutil
+from tempfile import mkdtemp
+
+
+SETTINGS = """
+DEBUG = {debug!r}
+SECRET_KEY = {secret!r}
+TEMPDIR = {tempdir!r}
+SQLALCHEMY_DATABASE_URI = {uri!r}
+"""
+
+
+def setup_app(snapshot, scale='tiny', seed=0, debug=False, workdir=None, profile=None):
+    """
+    Configures and imports the application so that it works on a fresh copy of `snapshot`. The snapshot
+    is generated first if it doesn't exist. `profile` selects a configuration profile (eg. `production`).
+
+    :return:    tuple of the application (with its context pushed) and a path of the working database
+    """
+    if workdir is None: workdir = mkdtemp(prefix='flavority-')
+    database = os.path.join(workdir, 'flavority.db')
+    settings = os.path.join(workdir, 'settings.py')
+    with open(settings, 'w') as file:
+        file.write(SETTINGS.format(debug=debug, secret=hexlify(os.urandom(16)).decode(), tempdir=os.path.join(workdir, 'tmp'),
+                                   uri='sqlite:///{}'.format(database)))
+    os.environ['FLAVORITY_SETTINGS'] = settings
+    if profile: os.environ['FLAVORITY_PROFILE'] = profile
+    else: os.environ.pop('FLAVORITY_PROFILE', None)
+
+    from flavority import create_app
+
+    if not os.path.exists(snapshot):
+        from generate_dataset import SCALES, generate_snapshot
+        generate_snapshot(snapshot, SCALES[scale], seed)
+
+    shutil.copyfile(snapshot, database)
+    app = create_app()
+    # scripts use the models and the database directly, outside of requests
+    app.app_context().push()
+    return app, database
+
+
+def auth_headers(user_id):
+    """Returns headers authenticating requests as a user with `user_id`."""
+    from flavority import lm
+    from flavority.models import User
+
+    user = User.query.get(user_id)
+    return {lm.TOKEN_HEADER: lm.generate_token(user).decode()}
+
+
+def percentile(values, p):
+    """Returns `p`-th percentile of `values` using linear interpolation between closest ranks."""
+    values = sorted(values)
+    if not values: return None
+    k = (len(values) - 1) * p / 100.0
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+
+__all__ = ['setup_app', 'auth_headers', 'percentile']
@@ -0,0 +1,294 @@
+
+from argparse import ArgumentParser
+from collections import defaultdict
+from http.client import HTTPConnection, HTTPException
+from json import dump, dumps, loads
+import os.path
+import random
+from sys import stderr, stdout, exit
+from threading import Lock, Thread
+from time import perf_counter, sleep, time
+from urllib.parse import urlencode, urlsplit
+
+from harness import percentile
+
+
+__desc__ = """Replay a weighted mix of user scenarios against a running server with many virtual users."""
+
+TOKEN_HEADER = 'X-Flavority-Token'
+TOKEN_LIFETIME = 800        # seconds, a bit less than the server's token duration
+
+PHOTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'photo.jpg')
+
+# default share of every scenario in the traffic
+WEIGHTS = {
+    'browse': 40,
+    'search': 15,
+    'detail': 25,
+    'comment': 5,
+    'favorite': 5,
+    'photo': 9,
+    'upload': 1,
+}
+
+
+class Stats:
+
+    """
+    Thread-safe collection of latencies and errors per route.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, elapsed, ok):
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            if not ok: self.errors[route] += 1
+
+    def report(self, duration):
+        routes = {}
+        for route in sorted(self.latencies):
+            timings = [t * 1000.0 for t in self.latencies[route]]
+            routes[route] = {
+                'requests': len(timings),
+                'throughput': len(timings) / duration,
+                'p50': percentile(timings, 50),
+                'p95': percentile(timings, 95),
+                'p99': percentile(timings, 99),
+                'error_rate': self.errors[route] / len(timings),
+            }
+        total = sum(len(t) for t in self.latencies.values())
+        return {
+            'duration': duration,
+            'requests': total,
+            'throughput': total / duration,
+            'error_rate': sum(self.errors.values()) / total if total else 0.0,
+            'routes': routes,
+        }
+
+
+class VirtualUser(Thread):
+
+    """
+    Signs in as one of the generated users and runs randomly chosen scenarios until the deadline. Every
+    virtual user keeps its own persistent connection.
+    """
+
+    def __init__(self, index, options, stats, deadline, photo):
+        super().__init__(daemon=True)
+        self.options = options
+        self.stats = stats
+        self.deadline = deadline
+        self.photo = photo
+        self.rng = random.Random(options.seed * 100003 + index)
+        self.email = options.email_format.format(self.rng.randint(1, options.users))
+        self.token, self.token_time = None, 0
+        self.connection = None
+        url = urlsplit(options.url)
+        self.host, self.port, self.prefix = url.hostname, url.port or 80, url.path.rstrip('/')
+
+    def request(self, route, method, path, params=None, body=None, content_type=None, auth=False):
+        if auth and time() - self.token_time > TOKEN_LIFETIME:
+            self.signin()
+
+        headers = {}
+        if auth: headers[TOKEN_HEADER] = self.token
+        if content_type: headers['Content-Type'] = content_type
+        if params: path = '{}?{}'.format(path, urlencode(params, doseq=True))
+
+        start = perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = HTTPConnection(self.host, self.port, timeout=self.options.timeout)
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+            status = response.status
+        except (HTTPException, OSError):
+            if self.connection is not None: self.connection.close()
+            self.connection, data, status = None, b'', 0
+        self.stats.record(route, perf_counter() - start, 200 <= status < 400)
+
+        if status == 401 and auth:
+            self.token_time = 0
+        try:
+            return status, loads(data.decode()) if data else None
+        except ValueError:
+            return status, None
+
+    def signin(self):
+        self.token_time = time()
+        status, data = self.request('POST /auth/signin', 'POST', '/auth/signin',
+                                    body=dumps({'email': self.email, 'password': self.options.password}),
+                                    content_type='application/json')
+        self.token = data['token'] if status == 200 and data else ''
+
+    def recipe_id(self):
+        return self.rng.randint(1, self.options.recipes)
+
+    ###
+    ### scenarios
+    ###
+    def browse(self):
+        params = {
+            'short': 'true',
+            'page': self.rng.randint(1, 20),
+            'sort_by': self.rng.choice(['id', 'date_added', 'rate']),
+        }
+        if self.rng.random() < 0.3:
+            status, tags = self.request('GET /tags/', 'GET', '/tags/')
+            if status == 200 and tags: params['tag_id'] = self.rng.choice(tags)['id']
+        self.request('GET /recipes/', 'GET', '/recipes/', params)
+
+    def search(self):
+        word = self.rng.choice(['salt', 'chicken', 'cake', 'spicy', 'soup', 'easy'])
+        self.request('GET /recipes/?query', 'GET', '/recipes/', {'query': word, 'short': 'true'})
+
+    def detail(self):
+        recipe_id = self.recipe_id()
+        self.request('GET /recipes/<id>', 'GET', '/recipes/{}'.format(recipe_id), auth=True)
+        self.request('GET /comments/?recipe_id', 'GET', '/comments/', {'recipe_id': recipe_id})
+
+    def comment(self):
+        self.request('POST /comments/', 'POST', '/comments/', body=dumps({
+            'recipe': self.recipe_id(),
+            'taste': self.rng.choice([1.0, 2.0, 3.0, 4.0, 5.0]),
+            'difficulty': self.rng.choice([1.0, 2.0, 3.0, 4.0, 5.0]),
+            'text': 'load test comment',
+        }), content_type='application/json', auth=True)
+
+    def favorite(self):
+        self.request('POST /favorite/', 'POST', '/favorite/', body=dumps({'recipe_id': self.recipe_id()}),
+                     content_type='application/json', auth=True)
+        self.request('GET /favorite/', 'GET', '/favorite/', auth=True)
+
+    def photo(self):
+        status, data = self.request('GET /recipes/<id>', 'GET', '/recipes/{}'.format(self.recipe_id()))
+        photos = data['recipe']['photos'] if status == 200 and data else []
+        for photo_id in photos[:3]:
+            self.request('GET /photos/<id>/?mini', 'GET', '/photos/{}/'.format(photo_id), {'mini': 'true'})
+        if photos:
+            self.request('GET /photos/<id>/', 'GET', '/photos/{}/'.format(photos[0]))
+
+    def upload(self):
+        boundary = 'flavority{}'.format(self.rng.getrandbits(64))
+        body = b''.join([
+            '--{}\r\n'.format(boundary).encode(),
+            b'Content-Disposition: form-data; name="file"; filename="photo.jpg"\r\n',
+            b'Content-Type: image/jpeg\r\n\r\n',
+            self.photo,
+            '\r\n--{}--\r\n'.format(boundary).encode(),
+        ])
+        self.request('POST /photos/', 'POST', '/photos/', body=body,
+                     content_type='multipart/form-data; boundary={}'.format(boundary), auth=True)
+
+    def run(self):
+        names = sorted(self.options.weights)
+        weights = [self.options.weights[name] for name in names]
+        while time() < self.deadline:
+            getattr(self, self.rng.choices(names, weights)[0])()
+            if self.options.think_time:
+                sleep(self.rng.expovariate(1.0 / self.options.think_time))
+        if self.connection is not None: self.connection.close()
+
+
+def run(options, out=stdout):
+    with open(options.photo, 'rb') as file: photo = file.read()
+
+    stats = Stats()
+    start = time()
+    users = []
+    for i in range(options.concurrency):
+        user = VirtualUser(i, options, stats, start + options.ramp_up + options.duration, photo)
+        users.append(user)
+        user.start()
+        if options.ramp_up: sleep(options.ramp_up / options.concurrency)
+    for user in users: user.join()
+
+    report = stats.report(time() - start)
+    out.write('{:<28} {:>8} {:>9} {:>9} {:>9} {:>9} {:>7}\n'.format(
+        'route', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for route, r in report['routes'].items():
+        out.write('{:<28} {:>8} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>6.1f}%\n'.format(
+            route, r['requests'], r['throughput'], r['p50'], r['p95'], r['p99'], r['error_rate'] * 100.0))
+    out.write('total: {} requests, {:.1f} req/s, {:.2f}% errors\n'.format(
+        report['requests'], report['throughput'], report['error_rate'] * 100.0))
+    return report
+
+
+def parse_weights(text):
+    weights = dict(WEIGHTS)
+    for item in filter(None, text.split(',')):
+        name, value = item.split('=')
+        if name not in WEIGHTS: raise ValueError('unknown scenario {}'.format(name))
+        weights[name] = float(value)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+parser = ArgumentParser(description = __desc__)
+parser.add_argument('url',
+        nargs = '?',
+        default = 'http://127.0.0.1:5000',
+        help = 'base URL of a running server')
+parser.add_argument('-c', '--concurrency',
+        type = int,
+        default = 20,
+        help = 'number of virtual users')
+parser.add_argument('-d', '--duration',
+        type = float,
+        default = 60.0,
+        help = 'seconds of full load after ramp up')
+parser.add_argument('--ramp-up',
+        type = float,
+        default = 5.0,
+        help = 'seconds over which virtual users are started')
+parser.add_argument('--think-time',
+        type = float,
+        default = 0.0,
+        help = 'mean pause in seconds between scenarios of a virtual user')
+parser.add_argument('-m', '--mix',
+        type = parse_weights,
+        dest = 'weights',
+        default = dict(WEIGHTS),
+        help = 'override scenario weights, e.g. browse=10,upload=0')
+parser.add_argument('--users',
+        type = int,
+        default = 1000,
+        help = 'number of generated users to sign in as')
+parser.add_argument('--recipes',
+        type = int,
+        default = 10000,
+        help = 'highest recipe id in the dataset')
+parser.add_argument('--email-format',
+        default = 'user{}@flavority.test',
+        help = 'format of generated users\' emails')
+parser.add_argument('--password',
+        default = '123',
+        help = 'password of generated users')
+parser.add_argument('--photo',
+        default = PHOTO,
+        help = 'image uploaded by the upload scenario')
+parser.add_argument('--timeout',
+        type = float,
+        default = 30.0,
+        help = 'socket timeout of a single request')
+parser.add_argument('--seed',
+        type = int,
+        default = 0,
+        help = 'seed of virtual users\' choices')
+parser.add_argument('-o', '--output',
+        default = None,
+        help = 'save the report to this JSON file')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if not args.weights:
+        stderr.write('no scenario to run\n')
+        exit(1)
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as file: dump(report, file, indent=4, sort_keys=True)
+    exit(0)
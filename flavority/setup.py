@@ -51,9 +51,22 @@ setup(
         "Flask-RESTful>=0.2.11",
         "Flask-SQLAlchemy>=1.0",
         "SQLAlchemy>=0.9",
+        "alembic>=0.7",
         'wand>=0.3.7',
     ],
 
+    extras_require = {
+        # data generating tools from scripts/
+        'scripts': ['numpy>=1.7'],
+        # production server started by runserver.py
+        'server': ['gunicorn>=19.7'],
+        # brotli compression of responses
+        'brotli': ['brotli>=1.0'],
+    },
+
     packages = find_packages(exclude = ["tests*"]),
+    package_data = {
+        'flavority': ['migrations/script.py.mako'],
+    },
 )
 